@@ -2,15 +2,18 @@
 
 from .config import Settings, get_settings, settings
 from .db import Base, SessionLocal, get_db
+from .http import HttpClients, http_clients
 from .security import RateLimiter, RateLimitExceeded
 
 __all__ = [
     "Base",
+    "HttpClients",
     "RateLimitExceeded",
     "RateLimiter",
     "SessionLocal",
     "Settings",
     "get_db",
     "get_settings",
+    "http_clients",
     "settings",
 ]
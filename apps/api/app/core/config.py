@@ -27,8 +27,109 @@ class Settings(BaseSettings):
     postgres_dsn: str | None = None
     redis_url: str | None = None
     judge0_url: str | None = None
+    judge0_api_key: str | None = None
+    # /run backend: "auto" (Judge0 when configured, else the simulator),
+    # "local" (opt-in: the local sandbox for Python, otherwise as "auto"),
+    # "judge0" or "simulate". The local sandbox needs Linux namespaces,
+    # seccomp and either root or unprivileged user namespaces; without them
+    # every local run fails with 503.
+    code_executor: str = "auto"
+    # Local sandbox: warm worker processes and per-run limits.
+    sandbox_pool_size: int = 4
+    sandbox_max_concurrency: int = 8
+    sandbox_timeout_seconds: float = 3.0
+    sandbox_cpu_seconds: int = 3
+    sandbox_memory_mb: int = 256
+    sandbox_output_bytes: int = 64 * 1024
+    sandbox_uid: int = 65534  # programs run as this uid when the API runs as root
+    # Judge0: concurrent runs share batch submissions and batch polls.
+    judge0_batch_size: int = 20
+    judge0_batch_window_seconds: float = 0.05
+    judge0_poll_interval_seconds: float = 0.5
+    judge0_timeout_seconds: float = 30.0
+    # Execution scheduler: global run slots, fair-share queues and their depth limits.
+    run_max_concurrency: int = 8
+    run_max_queue: int = 200
+    run_max_queue_per_class: int = 60
+    run_max_queue_per_user: int = 2
+    run_queue_timeout_seconds: float = 20.0
+    # Weighted round robin between classes, e.g. "kelas-x-1:2,kelas-x-2:1" (default weight 1).
+    run_class_weights: str = ""
+    # Replay results of deterministic runs (same language, source, stdin and runtime).
+    run_cache_enabled: bool = True
+    run_cache_size: int = 4096
+    run_cache_ttl_seconds: float = 86_400.0
+    # Background /run jobs kept for polling after they finish.
+    run_job_max_entries: int = 10_000
+    run_job_ttl_seconds: float = 600.0
     openai_api_key: str | None = None
+    embedding_model: str = "text-embedding-3-small"
+    embedding_batch_size: int = 256
+    embedding_batch_tokens: int = 100_000
+    embedding_max_retries: int = 5
+    embedding_cache_size: int = 10_000
+    embedding_cache_path: str | None = None
+    rag_retrieval_mode: str = "hybrid"
+    rag_reranker: str = "cosine"
+    rag_index_type: str = "flat"
+    rag_ivf_nlist: int = 1024
+    rag_ivf_nprobe: int = 16
+    rag_pq_m: int = 48
+    rag_hnsw_m: int = 32
+    rag_hnsw_ef_search: int = 64
+    # Memory-map vectors and payloads on load so workers share them via the page cache.
+    rag_index_mmap: bool = True
+    # Threads serving FAISS searches for async (request-path) retrieval.
+    rag_search_threads: int = 4
     google_gemini_api_key: str | None = None
+    # Relay LLM output to chat clients token by token instead of as one reply.
+    llm_stream_responses: bool = True
+    # Token budget for retrieved context in a generation prompt.
+    llm_context_token_budget: int = 1200
+    # Generation providers in order of preference: any of "gemini", "openai", "local".
+    llm_providers: str = "gemini,openai"
+    gemini_model: str = "gemini-2.5-flash"
+    openai_chat_model: str = "gpt-4o-mini"
+    openai_base_url: str = "https://api.openai.com/v1"
+    # Per attempt: a full answer, or the first streamed delta.
+    llm_timeout_seconds: float = 30.0
+    # Start the next provider once the current one passes its p95 latency
+    # (the default delay applies until enough latencies have been observed).
+    llm_hedging_enabled: bool = True
+    llm_hedge_default_seconds: float = 3.0
+    # Skip a provider for ``reset`` seconds after this many consecutive failures.
+    llm_breaker_failure_threshold: int = 5
+    llm_breaker_reset_seconds: float = 30.0
+    # Replay answers for near-identical questions over the same retrieved chunks.
+    answer_cache_enabled: bool = True
+    answer_cache_size: int = 2048
+    answer_cache_ttl_seconds: float = 3600.0
+    answer_cache_threshold: float = 0.9
+    # Share one retrieval + generation between concurrent identical questions.
+    chat_coalescing_enabled: bool = True
+    # Conversation memory: "memory" (per process) or "redis" (needs redis_url).
+    conversation_store: str = "memory"
+    conversation_max_entries: int = 10_000
+    conversation_ttl_seconds: float = 86_400.0
+    # Turns kept verbatim; older ones are folded into a summary of this many tokens.
+    conversation_recent_turns: int = 4
+    conversation_summary_tokens: int = 200
+    # Token budget for the compressed history included in a generation prompt.
+    conversation_history_tokens: int = 400
+    # A follow-up reuses earlier chunks scoring at least this (cosine) instead of
+    # searching. Both embedders score unrelated questions that merely share
+    # filler words ("di Python", "untuk setiap") up to ~0.45 against a chunk,
+    # while on-topic follow-ups score 0.5 and up.
+    conversation_reuse_threshold: float = 0.5
+    # Idle seconds before an SSE keep-alive comment is sent.
+    sse_heartbeat_seconds: float = 15.0
+    # Shared outbound HTTP clients (one pool per upstream host).
+    http_http2: bool = True
+    http_max_connections: int = 100
+    http_max_keepalive_connections: int = 20
+    http_keepalive_expiry: float = 30.0
+    http_connect_timeout: float = 5.0
+    http_read_timeout: float = 30.0
     posthog_api_key: str | None = None
     moderation_blocklist_path: str | None = None
     rate_limit_per_minute_chat: int = 20
@@ -0,0 +1,79 @@
+"""Application-scoped pooled HTTP clients for outbound API calls."""
+
+from __future__ import annotations
+
+import asyncio
+from importlib.util import find_spec
+
+import httpx
+
+from .config import settings
+
+# optional dependency: httpx only speaks HTTP/2 when h2 is installed
+_HTTP2_AVAILABLE = find_spec("h2") is not None
+
+
+class HttpClients:
+    """Named ``httpx.AsyncClient`` instances shared by every caller in the process.
+
+    Each upstream (``"gemini"``, ``"openai"``, ``"judge0"``) gets its own client, so
+    its connection limits apply per host and keep-alive connections, TLS sessions
+    and HTTP/2 streams are reused across requests instead of re-handshaking.
+    Clients are created lazily and bound to the running event loop; a caller on a
+    different loop (e.g. ``asyncio.run`` in a Celery task) gets a fresh client.
+    """
+
+    def __init__(
+        self,
+        *,
+        http2: bool = True,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 30.0,
+    ) -> None:
+        self.http2 = http2 and _HTTP2_AVAILABLE
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self._clients: dict[str, tuple[asyncio.AbstractEventLoop, httpx.AsyncClient]] = {}
+
+    @classmethod
+    def from_settings(cls) -> "HttpClients":
+        return cls(
+            http2=settings.http_http2,
+            max_connections=settings.http_max_connections,
+            max_keepalive_connections=settings.http_max_keepalive_connections,
+            keepalive_expiry=settings.http_keepalive_expiry,
+            connect_timeout=settings.http_connect_timeout,
+            read_timeout=settings.http_read_timeout,
+        )
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        """Return the pooled client for upstream ``name``, creating it on first use."""
+
+        loop = asyncio.get_running_loop()
+        entry = self._clients.get(name)
+        if entry is None or entry[0] is not loop or entry[1].is_closed:
+            client = httpx.AsyncClient(http2=self.http2, limits=self.limits, timeout=self.timeout)
+            self._clients[name] = entry = (loop, client)
+        return entry[1]
+
+    async def aclose(self) -> None:
+        """Close every client owned by the running loop; call at application shutdown."""
+
+        loop = asyncio.get_running_loop()
+        for name, (owner, client) in list(self._clients.items()):
+            if owner is loop:
+                await client.aclose()
+            del self._clients[name]
+
+
+http_clients = HttpClients.from_settings()
+
+
+__all__ = ["HttpClients", "http_clients"]
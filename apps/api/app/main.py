@@ -3,7 +3,9 @@
 from __future__ import annotations
 
 import json
+from contextlib import asynccontextmanager
 from pathlib import Path
+from typing import AsyncIterator
 
 from dotenv import load_dotenv
 from fastapi import FastAPI
@@ -13,14 +15,39 @@ from fastapi.middleware.cors import CORSMiddleware
 env_file_path = Path(__file__).parent.parent.parent / ".env"
 load_dotenv(env_file_path)
 
-from app.core import RateLimiter, settings
+# Settings read the environment on import, so the app imports follow load_dotenv.
+# ruff: noqa: E402
+
+from app.core import RateLimiter, http_clients, settings
 # from app.core import RateLimiter, settings, Base, SessionLocal, get_db
 from app.routers import chat, progress, quiz, run as run_router
+from app.services.answer_cache import SemanticAnswerCache
+from app.services.conversation import RedisConversationStore, conversation_store_from_settings
 from app.services.hint_policy import HintPolicy
+from app.services.judge0 import judge0_dispatcher
 from app.services.rag import RagService, ChunkPayload
+from app.services.run_cache import RunResultCache
+from app.services.run_jobs import RunJobStore
+from app.services.sandbox import python_sandbox
+from app.services.scheduler import ExecutionScheduler
+from app.services.single_flight import SingleFlight
+
+
+@asynccontextmanager
+async def lifespan(application: FastAPI) -> AsyncIterator[None]:
+    if settings.code_executor == "local":
+        await python_sandbox.start()  # warm the /run workers before the first request
+    yield
+    await application.state.run_jobs.aclose()
+    await judge0_dispatcher.aclose()
+    await python_sandbox.aclose()
+    await http_clients.aclose()
+    if isinstance(application.state.conversations, RedisConversationStore):
+        await application.state.conversations.aclose()
+
 
 def create_app() -> FastAPI:
-    application = FastAPI(title=settings.app_name)  # Removed lifespan for debugging
+    application = FastAPI(title=settings.app_name, lifespan=lifespan)
     # FastAPIInstrumentor.instrument_app(application)  # Commented out for debugging
     application.add_middleware(
         CORSMiddleware,
@@ -42,6 +69,26 @@ def create_app() -> FastAPI:
         "run": RateLimiter(settings.rate_limit_per_minute_run, 60),
     }
     application.state.hint_policy = HintPolicy()
+    if settings.answer_cache_enabled:
+        application.state.answer_cache = SemanticAnswerCache(
+            settings.answer_cache_size,
+            settings.answer_cache_ttl_seconds,
+            settings.answer_cache_threshold,
+        )
+    if settings.chat_coalescing_enabled:
+        application.state.chat_flights = SingleFlight()
+    application.state.conversations = conversation_store_from_settings()
+    application.state.run_jobs = RunJobStore(
+        settings.run_job_max_entries, settings.run_job_ttl_seconds
+    )
+    application.state.run_scheduler = ExecutionScheduler.from_settings()
+    if settings.run_cache_enabled:
+        application.state.run_cache = RunResultCache(
+            settings.run_cache_size, settings.run_cache_ttl_seconds
+        )
+        application.state.run_flights = SingleFlight()
+    # Pooled clients for Gemini, OpenAI and Judge0, closed by ``lifespan`` on shutdown.
+    application.state.http_clients = http_clients
 
     index_path = Path("data/faiss/index.bin")
     rag_service = RagService.load(index_path)
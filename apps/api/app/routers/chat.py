@@ -1,22 +1,43 @@
 from __future__ import annotations
 
-import asyncio
 import json
-from typing import AsyncGenerator
+from typing import Any, AsyncGenerator
 
 from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
 
 from app.core import RateLimitExceeded
 from app.core.auth import get_current_user
+from app.core.config import settings
+from app.core.sse import SSE_HEADERS, sse_event, stream_events
+from app.services.answer_cache import SemanticAnswerCache
+from app.services.conversation import (
+    Conversation,
+    ConversationStore,
+    ConversationTurn,
+    conversation_key,
+)
 from app.services.hint_policy import HintPolicy, HintState
-from app.services.rag import RagService
+from app.services.metadata_index import FILTERABLE_FIELDS
+from app.services.rag import RagService, RetrievedChunk, is_fallback_response
+from app.services.single_flight import SingleFlight
 
 
 class ModeratedChatRequest(BaseModel):
     message: str
     conversation_id: str | None = None
+    filters: dict[str, str | list[str]] | None = None
+
+    @field_validator("filters")
+    @classmethod
+    def _check_filter_fields(
+        cls, filters: dict[str, str | list[str]] | None
+    ) -> dict[str, str | list[str]] | None:
+        unknown = set(filters or {}) - set(FILTERABLE_FIELDS)
+        if unknown:
+            raise ValueError(f"Unsupported filter fields: {', '.join(sorted(unknown))}")
+        return filters
 
 
 router = APIRouter(prefix="/chat", tags=["chat"])
@@ -43,50 +64,176 @@ async def moderation_guard(request: Request, payload: ModeratedChatRequest) -> N
         raise HTTPException(status.HTTP_400_BAD_REQUEST, "Pesan melanggar kebijakan moderasi.")
 
 
-async def _generate_events(
-    request: Request,
+def coalescing_key(payload: ModeratedChatRequest, user_id: str = "") -> str:
+    """Identical questions (modulo case, spacing and trailing punctuation) share a key.
+
+    Turns of a conversation only coalesce within that conversation of that
+    user, since their answers depend on (and are recorded into) its history.
+    """
+
+    message = " ".join(payload.message.casefold().split()).rstrip(" ?!.")
+    filters = {
+        field: sorted([value] if isinstance(value, str) else value)
+        for field, value in (payload.filters or {}).items()
+    }
+    key: list[Any] = [message, filters]
+    if payload.conversation_id:
+        key.append(conversation_key(user_id, payload.conversation_id))
+    return json.dumps(key, sort_keys=True, ensure_ascii=False)
+
+
+async def _retrieve(
+    rag_service: RagService, payload: ModeratedChatRequest, conversation: Conversation | None
+) -> list[RetrievedChunk]:
+    """Reuse the conversation's earlier chunks when they still answer a follow-up."""
+
+    if conversation is not None:
+        return await rag_service.aretrieve_followup(
+            payload.message, conversation.chunk_ids, top_k=3, filters=payload.filters
+        )
+    return await rag_service.aretrieve(payload.message, top_k=3, filters=payload.filters)
+
+
+async def _chat_events(
     rag_service: RagService,
     payload: ModeratedChatRequest,
     hint_policy: HintPolicy,
+    answer_cache: SemanticAnswerCache | None,
+    conversations: ConversationStore | None = None,
+    conversation: Conversation | None = None,
+    store_key: str | None = None,
 ) -> AsyncGenerator[str, None]:
-    retrieved = rag_service.retrieve(payload.message, top_k=3)
+    """SSE frames for one question; independent of any single client connection.
+
+    With a ``conversation`` the prompt carries its compressed history and the
+    finished turn is appended to ``conversations`` under ``store_key``.
+    """
+
+    yield sse_event({"type": "started"}, event="status")
+    retrieved = await _retrieve(rag_service, payload, conversation)
+    history = conversation.history(settings.conversation_history_tokens) if conversation else ""
+    cached = None
+    if answer_cache is not None and retrieved:
+        context = answer_cache.context_key(
+            rag_service.index_version, [chunk.vector_id for chunk in retrieved], payload.filters
+        )
+        query_vector = await rag_service.embedder.aembed_one(payload.message)
+        cached = answer_cache.lookup(query_vector, context)
     state = HintState()
-    yield "event: status\n" "data: {\"type\": \"started\"}\n\n"
     for chunk in retrieved:
-        if await request.is_disconnected():
-            break
         state = hint_policy.evaluate(payload.message, state)
-        chunk_payload = {
-            "type": "chunk",
-            "text": chunk.text,
-            "metadata": chunk.metadata,
-            "score": chunk.score,
-            "hintsRevealed": state.hints_revealed,
-        }
-        yield f"data: {json.dumps(chunk_payload, ensure_ascii=False)}\n\n"
-        await asyncio.sleep(0.05)
+        yield sse_event(
+            {
+                "type": "chunk",
+                "text": chunk.text,
+                "metadata": chunk.metadata,
+                "score": chunk.score,
+                "hintsRevealed": state.hints_revealed,
+            }
+        )
 
     # Generate adaptive response using LLM
-    llm_response = await rag_service.generate_response(payload.message, retrieved)
-    yield f"data: {json.dumps({'type': 'response', 'text': llm_response}, ensure_ascii=False)}\n\n"
-
-    yield "event: status\n" "data: {\"type\": \"completed\"}\n\n"
+    if cached is not None:
+        llm_response = cached.answer
+        yield sse_event({"type": "delta", "text": llm_response})
+    elif settings.llm_stream_responses:
+        parts: list[str] = []
+        async for delta in rag_service.stream_response(payload.message, retrieved, history):
+            parts.append(delta)
+            yield sse_event({"type": "delta", "text": delta})
+        llm_response = "".join(parts)
+    else:
+        llm_response = await rag_service.generate_response(payload.message, retrieved, history)
+    cacheable = cached is None and retrieved and not is_fallback_response(llm_response)
+    if answer_cache is not None and cacheable:
+        answer_cache.store(payload.message, query_vector, context, llm_response)
+    yield sse_event({"type": "response", "text": llm_response})
+
+    if conversations is not None and conversation is not None and store_key:
+        answer = "" if is_fallback_response(llm_response) else llm_response
+        turn = ConversationTurn(payload.message, answer, [chunk.vector_id for chunk in retrieved])
+        # Appended to the stored copy, not ``conversation``: another turn of this
+        # conversation may have been saved while this answer was generated.
+        await conversations.append(
+            store_key,
+            turn,
+            settings.conversation_recent_turns,
+            settings.conversation_summary_tokens,
+        )
+    yield sse_event({"type": "completed"}, event="status")
 
 
-@router.post(
-    "/",
-    response_class=StreamingResponse,
-    dependencies=[Depends(get_current_user)],
-)
+async def _generate_events(
+    request: Request,
+    rag_service: RagService,
+    payload: ModeratedChatRequest,
+    hint_policy: HintPolicy,
+    user_id: str = "",
+) -> AsyncGenerator[str, None]:
+    """Relay the (possibly shared) event stream for ``payload`` to this client.
+
+    Concurrent identical questions join one in-flight retrieval and generation;
+    a client that disconnects only unsubscribes, and the shared upstream call is
+    cancelled once nobody is listening. Frames that are ready together go out in
+    one flush. Conversation history is only kept for an authenticated
+    ``user_id`` and is never visible to another user reusing the same id.
+    """
+
+    answer_cache: SemanticAnswerCache | None = getattr(request.app.state, "answer_cache", None)
+    flights: SingleFlight[str] | None = getattr(request.app.state, "chat_flights", None)
+    conversations: ConversationStore | None = getattr(request.app.state, "conversations", None)
+    conversation = None
+    store_key = None
+    if user_id and payload.conversation_id:
+        store_key = conversation_key(user_id, payload.conversation_id)
+    if conversations is not None and store_key:
+        conversation = await conversations.get(store_key)
+        if conversation.has_history:
+            answer_cache = None  # a cached answer would ignore what was said before
+
+    def produce() -> AsyncGenerator[str, None]:
+        return _chat_events(
+            rag_service, payload, hint_policy, answer_cache, conversations, conversation, store_key
+        )
+
+    if flights is None:
+        events = produce()
+    else:
+        events = flights.stream(coalescing_key(payload, user_id), produce)
+    heartbeat = settings.sse_heartbeat_seconds
+    async for frames in stream_events(request, events, heartbeat_interval=heartbeat):
+        yield frames
+
+
+@router.get("/stats", dependencies=[Depends(get_current_user)])
+async def chat_stats(
+    request: Request, rag_service: RagService = Depends(get_rag_service)
+) -> dict[str, dict[str, Any]]:
+    """Answer cache hit rate, coalescing rate and per-provider LLM latency/breaker state."""
+
+    stats: dict[str, dict[str, Any]] = {}
+    answer_cache: SemanticAnswerCache | None = getattr(request.app.state, "answer_cache", None)
+    if answer_cache is not None:
+        stats["answer_cache"] = {"entries": len(answer_cache), **answer_cache.stats.as_dict()}
+    flights: SingleFlight[str] | None = getattr(request.app.state, "chat_flights", None)
+    if flights is not None:
+        stats["coalescing"] = {"in_flight": len(flights), **flights.stats.as_dict()}
+    stats["llm"] = rag_service.llm.stats()
+    return stats
+
+
+@router.post("/", response_class=StreamingResponse)
 async def create_chat_completion(
     payload: ModeratedChatRequest,
     request: Request,
     _: None = Depends(enforce_chat_rate_limit),
     rag_service: RagService = Depends(get_rag_service),
+    user: dict = Depends(get_current_user),
 ) -> StreamingResponse:
     """Stream chunks retrieved from the RAG index via SSE."""
 
     await moderation_guard(request, payload)
     hint_policy: HintPolicy = request.app.state.hint_policy
-    generator = _generate_events(request, rag_service, payload, hint_policy)
-    return StreamingResponse(generator, media_type="text/event-stream")
+    user_id = str(user.get("id") or "")
+    generator = _generate_events(request, rag_service, payload, hint_policy, user_id)
+    return StreamingResponse(generator, media_type="text/event-stream", headers=SSE_HEADERS)
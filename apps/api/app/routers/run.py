@@ -1,21 +1,30 @@
 from __future__ import annotations
 
 import asyncio
-import http.client
-import json
-from collections.abc import Awaitable, Callable
+import contextlib
+from collections.abc import AsyncGenerator, Awaitable, Callable
+from typing import Any, AsyncContextManager
 
 from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 
 from app.core import RateLimitExceeded
 from app.core.config import settings
 from app.core.auth import get_current_user
+from app.core.sse import SSE_HEADERS, sse_event, stream_events
+from app.services.judge0 import Judge0Error, UnsupportedLanguage, judge0_dispatcher
+from app.services.run_cache import RunResultCache
+from app.services.run_jobs import RunJob, RunJobStore
+from app.services.sandbox import SandboxChunk, SandboxError, python_sandbox
+from app.services.scheduler import AdmissionRejected, ExecutionScheduler
+from app.services.single_flight import SingleFlight
 
 
 class CodeRunRequest(BaseModel):
     language: str = Field(pattern=r"^[a-zA-Z0-9+#]+$")
     source: str = Field(min_length=1, max_length=5000)
+    stdin: str = Field(default="", max_length=5000)
 
 
 class CodeRunResponse(BaseModel):
@@ -23,6 +32,13 @@ class CodeRunResponse(BaseModel):
     stderr: str | None = None
     status: str = "queued"
     execution_time_ms: int | None = None
+    cached: bool = False
+
+
+class RunJobResponse(BaseModel):
+    job_id: str
+    status: str
+    result: CodeRunResponse | None = None
 
 
 router = APIRouter(prefix="/run", tags=["run"])
@@ -37,6 +53,40 @@ def enforce_run_rate_limit(request: Request) -> None:
         raise HTTPException(status.HTTP_429_TOO_MANY_REQUESTS, str(exc)) from exc
 
 
+def get_run_identity(request: Request, user: dict = Depends(get_current_user)) -> tuple[str, str]:
+    """``(class_id, user_id)`` a run is scheduled under.
+
+    The class comes from ``app_metadata`` only: students can edit their own
+    ``user_metadata`` and would otherwise pick the class with the best weight.
+    """
+
+    class_id = str((user.get("app_metadata") or {}).get("class_id") or "umum")
+    user_id = str(user.get("id") or (request.client.host if request.client else "anonymous"))
+    return class_id, user_id
+
+
+def _rejection(exc: AdmissionRejected) -> HTTPException:
+    return HTTPException(exc.status_code, str(exc), headers={"Retry-After": str(exc.retry_after)})
+
+
+def admit(request: Request, identity: tuple[str, str] | None) -> None:
+    """Refuse at once (429/503) when the run would not even be queued."""
+
+    scheduler: ExecutionScheduler | None = getattr(request.app.state, "run_scheduler", None)
+    if scheduler is not None and identity is not None:
+        try:
+            scheduler.check(*identity)
+        except AdmissionRejected as exc:
+            raise _rejection(exc) from exc
+
+
+def _run_slot(request: Request, identity: tuple[str, str] | None) -> AsyncContextManager[None]:
+    scheduler: ExecutionScheduler | None = getattr(request.app.state, "run_scheduler", None)
+    if scheduler is None or identity is None:
+        return contextlib.nullcontext()
+    return scheduler.slot(*identity)
+
+
 async def _simulate_execution(payload: CodeRunRequest) -> CodeRunResponse:
     if "import socket" in payload.source or "http" in payload.source:
         raise HTTPException(status.HTTP_400_BAD_REQUEST, "Network access is not permitted in the sandbox.")
@@ -49,64 +99,335 @@ async def _simulate_execution(payload: CodeRunRequest) -> CodeRunResponse:
     )
 
 
+PYTHON_LANGUAGES = {"python", "python3", "py"}
+
+
+async def _execute_locally(payload: CodeRunRequest) -> CodeRunResponse:
+    """Run Python in a warm worker of the local sandbox pool."""
+
+    if payload.language.lower() not in PYTHON_LANGUAGES:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "The local sandbox only runs Python.")
+    try:
+        result = await python_sandbox.run(payload.source, payload.stdin)
+    except SandboxError as exc:
+        raise HTTPException(status.HTTP_503_SERVICE_UNAVAILABLE, str(exc)) from exc
+    return CodeRunResponse(
+        stdout=result.stdout,
+        stderr=result.stderr or None,
+        status=result.status,
+        execution_time_ms=round(result.execution_time_ms),
+    )
+
+
+def _judge0_configured() -> bool:
+    return bool(settings.judge0_url)
+
+
+def select_executor(
+    payload: CodeRunRequest,
+) -> Callable[[CodeRunRequest], Awaitable[CodeRunResponse]]:
+    mode = settings.code_executor
+    if mode == "local" and payload.language.lower() in PYTHON_LANGUAGES:
+        return _execute_locally
+    if mode == "judge0" or (mode in ("auto", "local") and _judge0_configured()):
+        return _execute_with_judge0
+    return _simulate_execution
+
+
+async def _runtime_version(
+    executor: Callable[[CodeRunRequest], Awaitable[CodeRunResponse]], payload: CodeRunRequest
+) -> str | None:
+    """Cache namespace of a real executor; ``None`` (never cached) for anything else.
+
+    For Judge0 it names the language id and the compiler version the instance
+    reports, so an upgraded Judge0 does not serve results of the old one.
+    """
+
+    if executor is _execute_locally:
+        return f"local:{python_sandbox.runtime_version}"
+    if executor is _execute_with_judge0:
+        version = await judge0_dispatcher.runtime_version(payload.language)
+        return f"judge0:{settings.judge0_url}:{version}" if version else None
+    return None
+
+
+async def execute(
+    request: Request,
+    payload: CodeRunRequest,
+    executor: Callable[[CodeRunRequest], Awaitable[CodeRunResponse]],
+    identity: tuple[str, str] | None = None,
+) -> CodeRunResponse:
+    """Run ``payload``, answering deterministic repeats from the run cache.
+
+    Identical cacheable runs that arrive together share one execution, so a
+    classroom starting the same snippet uses a single sandbox slot. Actual
+    executions wait for a slot of the fair-share scheduler under ``identity``.
+    """
+
+    async def run() -> CodeRunResponse:
+        try:
+            async with _run_slot(request, identity):
+                return await executor(payload)
+        except AdmissionRejected as exc:
+            raise _rejection(exc) from exc
+
+    cache: RunResultCache | None = getattr(request.app.state, "run_cache", None)
+    key = None
+    if cache is not None:
+        runtime = await _runtime_version(executor, payload)
+        key = cache.key(payload.language, payload.source, payload.stdin, runtime)
+    if cache is None or key is None:
+        return await run()
+    cached = cache.get(key)
+    if cached is not None:
+        return CodeRunResponse(**cached, cached=True)
+
+    async def produce() -> AsyncGenerator[CodeRunResponse, None]:
+        result = await run()
+        cache.put(key, result.model_dump(exclude={"cached"}))
+        yield result
+
+    flights: SingleFlight[CodeRunResponse] | None = getattr(request.app.state, "run_flights", None)
+    results = produce() if flights is None else flights.stream(key, produce)
+    try:
+        async for result in results:
+            return result
+    finally:
+        await results.aclose()
+    raise RuntimeError("The run finished without producing a result")
+
+
 @router.post("/", response_model=CodeRunResponse, dependencies=[Depends(get_current_user)])
 async def submit_code_execution(
+    request: Request,
     payload: CodeRunRequest,
     _: None = Depends(enforce_run_rate_limit),
     executor: Callable[[CodeRunRequest], Awaitable[CodeRunResponse]] | None = None,
+    identity: tuple[str, str] = Depends(get_run_identity),
 ) -> CodeRunResponse:
-    """Submit code execution to Judge0 or the built-in simulator."""
+    """Run code in the local sandbox, on Judge0 or in the built-in simulator.
 
-    # Use Judge0 if configured, otherwise simulate
-    if settings.judge0_url and settings.judge0_url.startswith("https://judge0-ce.p.rapidapi.com"):
-        run_callable = executor or _execute_with_judge0
-    else:
-        run_callable = executor or _simulate_execution
+    Waits for the result; ``POST /run/jobs`` is the non-blocking variant.
+    """
 
-    result = await run_callable(payload)
-    if result.execution_time_ms and result.execution_time_ms > 3000:
+    result = await execute(request, payload, executor or select_executor(payload), identity)
+    if result.status == "timeout" or (result.execution_time_ms and result.execution_time_ms > 3000):
         raise HTTPException(status.HTTP_400_BAD_REQUEST, "Execution exceeded time limit.")
     return result
 
 
-async def _execute_with_judge0(payload: CodeRunRequest) -> CodeRunResponse:
-    """Execute code using Judge0 API."""
-    url = settings.judge0_url
-    async with http.client.AsyncHTTPConnection(url) as conn:
-        payload_json = json.dumps({
-            "source": payload.source,
-            "language": payload.language,
-        })
-        headers = {
-            "Content-Type": "application/json",
-            "x-rapidapi-host": "judge0-ce.p.rapidapi.com",
-            "x-rapidapi-key": settings.judge0_api_key,
+def _result_frames(result: CodeRunResponse) -> list[str]:
+    outputs = (("stdout", result.stdout), ("stderr", result.stderr))
+    frames = [sse_event({"data": text}, event=name) for name, text in outputs if text]
+    return frames + [sse_event(result.model_dump(exclude={"stdout", "stderr"}), event="result")]
+
+
+async def _buffered_run_events(
+    request: Request,
+    payload: CodeRunRequest,
+    executor: Callable[[CodeRunRequest], Awaitable[CodeRunResponse]],
+    identity: tuple[str, str],
+) -> AsyncGenerator[str, None]:
+    try:
+        result = await execute(request, payload, executor, identity)
+    except HTTPException as exc:
+        yield sse_event({"status_code": exc.status_code, "detail": exc.detail}, event="error")
+        return
+    for frame in _result_frames(result):
+        yield frame
+
+
+async def _streamed_run_events(
+    request: Request, payload: CodeRunRequest, identity: tuple[str, str]
+) -> AsyncGenerator[str, None]:
+    cache: RunResultCache | None = getattr(request.app.state, "run_cache", None)
+    key = None
+    if cache is not None:
+        runtime = await _runtime_version(_execute_locally, payload)
+        key = cache.key(payload.language, payload.source, payload.stdin, runtime)
+        cached = cache.get(key) if key is not None else None
+        if cached is not None:
+            for frame in _result_frames(CodeRunResponse(**cached, cached=True)):
+                yield frame
+            return
+
+    output: dict[str, list[str]] = {"stdout": [], "stderr": []}
+    result: CodeRunResponse | None = None
+    try:
+        async with _run_slot(request, identity):
+            async for event in python_sandbox.stream(payload.source, payload.stdin):
+                if isinstance(event, SandboxChunk):
+                    output[event.stream].append(event.data)
+                    yield sse_event({"data": event.data}, event=event.stream)
+                    continue
+                if event.stderr:  # the sandbox's own notice (time or resource limit)
+                    output["stderr"].append(event.stderr)
+                    yield sse_event({"data": event.stderr}, event="stderr")
+                result = CodeRunResponse(
+                    stdout="".join(output["stdout"]),
+                    stderr="".join(output["stderr"]) or None,
+                    status=event.status,
+                    execution_time_ms=round(event.execution_time_ms),
+                )
+    except AdmissionRejected as exc:
+        yield sse_event({"status_code": exc.status_code, "detail": str(exc)}, event="error")
+        return
+    except SandboxError as exc:
+        unavailable = {"status_code": status.HTTP_503_SERVICE_UNAVAILABLE, "detail": str(exc)}
+        yield sse_event(unavailable, event="error")
+        return
+    if result is None:  # the worker went away without reporting a result
+        failed = {
+            "status_code": status.HTTP_503_SERVICE_UNAVAILABLE,
+            "detail": "The sandbox ended the run without a result.",
         }
-        response = await conn.request("POST", "/submissions", body=payload_json, headers=headers)
-        if response.status != 201:
-            raise HTTPException(status.HTTP_500_INTERNAL_SERVER_ERROR, "Failed to submit code to Judge0.")
-
-        result = json.loads(response.read())
-        if result["status"]["id"] == 3:  # Compilation error
-            return CodeRunResponse(
-                stdout="",
-                stderr=result["compile_output"],
-                status="error",
-                execution_time_ms=0,
-            )
-        elif result["status"]["id"] == 2:  # Runtime error
-            return CodeRunResponse(
-                stdout="",
-                stderr=result["stderr"],
-                status="error",
-                execution_time_ms=result["time"],
-            )
-        elif result["status"]["id"] == 1:  # Success
-            return CodeRunResponse(
-                stdout=result["stdout"],
-                stderr="",
-                status="completed",
-                execution_time_ms=result["time"],
-            )
-        else:
-            raise HTTPException(status.HTTP_500_INTERNAL_SERVER_ERROR, "Unknown error from Judge0.")
+        yield sse_event(failed, event="error")
+        return
+    if cache is not None and key is not None:
+        cache.put(key, result.model_dump(exclude={"cached"}))
+    yield sse_event(result.model_dump(exclude={"stdout", "stderr"}), event="result")
+
+
+@router.post("/stream", response_class=StreamingResponse, dependencies=[Depends(get_current_user)])
+async def stream_code_execution(
+    request: Request,
+    payload: CodeRunRequest,
+    _: None = Depends(enforce_run_rate_limit),
+    identity: tuple[str, str] = Depends(get_run_identity),
+) -> StreamingResponse:
+    """SSE variant of ``POST /run/``: ``stdout``/``stderr`` events, then one ``result`` event.
+
+    Python in the local sandbox streams output as the program writes it, capped
+    at the sandbox's output limit, and is killed as soon as the client goes
+    away. Other executors send their output in one piece when they finish.
+    """
+
+    admit(request, identity)
+    executor = select_executor(payload)
+    if executor is _execute_locally and payload.language.lower() in PYTHON_LANGUAGES:
+        events = _streamed_run_events(request, payload, identity)
+    else:
+        events = _buffered_run_events(request, payload, executor, identity)
+    generator = stream_events(request, events, heartbeat_interval=settings.sse_heartbeat_seconds)
+    return StreamingResponse(generator, media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+async def _execute_with_judge0(payload: CodeRunRequest) -> CodeRunResponse:
+    """Run code on Judge0 through the shared batching dispatcher."""
+
+    try:
+        result = await judge0_dispatcher.run(payload.language, payload.source, payload.stdin)
+    except UnsupportedLanguage as exc:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, str(exc)) from exc
+    except Judge0Error as exc:
+        raise HTTPException(status.HTTP_502_BAD_GATEWAY, str(exc)) from exc
+    return CodeRunResponse(
+        stdout=result.stdout,
+        stderr=result.stderr,
+        status=result.status,
+        execution_time_ms=result.execution_time_ms,
+    )
+
+
+def get_run_jobs(request: Request) -> RunJobStore:
+    jobs: RunJobStore | None = getattr(request.app.state, "run_jobs", None)
+    if jobs is None:
+        raise HTTPException(status.HTTP_503_SERVICE_UNAVAILABLE, "Run jobs are not available")
+    return jobs
+
+
+def _job_response(job: RunJob) -> RunJobResponse:
+    return RunJobResponse(
+        job_id=job.job_id,
+        status=job.status,
+        result=CodeRunResponse(**job.result) if job.result else None,
+    )
+
+
+@router.post(
+    "/jobs",
+    response_model=RunJobResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+    dependencies=[Depends(get_current_user)],
+)
+async def submit_run_job(
+    request: Request,
+    payload: CodeRunRequest,
+    _: None = Depends(enforce_run_rate_limit),
+    jobs: RunJobStore = Depends(get_run_jobs),
+    identity: tuple[str, str] = Depends(get_run_identity),
+) -> RunJobResponse:
+    """Queue a run and return its id at once; fetch or stream the result separately."""
+
+    admit(request, identity)
+    executor = select_executor(payload)
+
+    async def work() -> dict[str, Any]:
+        try:
+            result = await execute(request, payload, executor, identity)
+        except HTTPException as exc:
+            result = CodeRunResponse(stdout="", stderr=str(exc.detail), status="error")
+        return result.model_dump()
+
+    return _job_response(jobs.submit(work, owner=identity[1]))
+
+
+def _owned_job(jobs: RunJobStore, job_id: str, identity: tuple[str, str]) -> RunJob:
+    """The caller's own job; someone else's job is reported as unknown (404)."""
+
+    job = jobs.get(job_id, owner=identity[1])
+    if job is None:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "Unknown run job")
+    return job
+
+
+@router.get("/jobs/{job_id}", response_model=RunJobResponse)
+async def get_run_job(
+    job_id: str,
+    jobs: RunJobStore = Depends(get_run_jobs),
+    identity: tuple[str, str] = Depends(get_run_identity),
+) -> RunJobResponse:
+    return _job_response(_owned_job(jobs, job_id, identity))
+
+
+@router.get("/jobs/{job_id}/events", response_class=StreamingResponse)
+async def stream_run_job(
+    job_id: str,
+    request: Request,
+    jobs: RunJobStore = Depends(get_run_jobs),
+    identity: tuple[str, str] = Depends(get_run_identity),
+) -> StreamingResponse:
+    """SSE ``status`` events for each change of the job, ending once it has finished."""
+
+    _owned_job(jobs, job_id, identity)
+
+    async def events() -> AsyncGenerator[str, None]:
+        seen = -1
+        while (job := await jobs.wait(job_id, seen)) is not None:
+            seen = job.version
+            yield sse_event(_job_response(job).model_dump(), event="status")
+            if job.done:
+                return
+        yield sse_event({"job_id": job_id, "detail": "Unknown run job"}, event="error")
+
+    generator = stream_events(request, events(), heartbeat_interval=settings.sse_heartbeat_seconds)
+    return StreamingResponse(generator, media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@router.get("/stats", dependencies=[Depends(get_current_user)])
+async def run_stats(request: Request) -> dict[str, dict[str, Any]]:
+    """Run cache hit rate, coalesced runs, scheduler queues, Judge0 batching and warm workers."""
+
+    stats: dict[str, dict[str, Any]] = {}
+    cache: RunResultCache | None = getattr(request.app.state, "run_cache", None)
+    if cache is not None:
+        stats["run_cache"] = {"entries": len(cache), **cache.stats.as_dict()}
+    flights: SingleFlight[CodeRunResponse] | None = getattr(request.app.state, "run_flights", None)
+    if flights is not None:
+        stats["coalescing"] = {"in_flight": len(flights), **flights.stats.as_dict()}
+    scheduler: ExecutionScheduler | None = getattr(request.app.state, "run_scheduler", None)
+    if scheduler is not None:
+        stats["scheduler"] = scheduler.stats()
+    stats["judge0"] = judge0_dispatcher.stats()
+    stats["sandbox"] = {"idle_workers": python_sandbox.idle_workers}
+    return stats
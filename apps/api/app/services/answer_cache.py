@@ -0,0 +1,146 @@
+"""Semantic cache of generated tutor answers for near-duplicate questions."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Iterable
+
+import numpy as np
+
+from app.services.metadata_index import MetadataFilter
+
+
+@dataclass(slots=True)
+class AnswerCacheStats:
+    """Counters for the answer cache; ``hit_rate`` is hits over lookups."""
+
+    hits: int = 0
+    misses: int = 0
+    stores: int = 0
+    evictions: int = 0
+    expirations: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def as_dict(self) -> dict[str, float]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": round(self.hit_rate, 4),
+        }
+
+
+@dataclass(slots=True)
+class CachedAnswer:
+    query: str
+    answer: str
+    similarity: float
+
+
+@dataclass(slots=True)
+class _Entry:
+    context: str
+    query: str
+    vector: np.ndarray
+    answer: str
+    expires_at: float
+
+
+class SemanticAnswerCache:
+    """Bounded LRU of answers keyed by retrieval context and matched by query similarity.
+
+    An answer is only replayed for a question whose retrieval produced the same
+    chunks (under the same index version and filters) *and* whose embedding is
+    within ``threshold`` cosine similarity of the original question, so the
+    cached answer was generated from exactly the context the new one would use.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 2048,
+        ttl_seconds: float = 3600.0,
+        threshold: float = 0.9,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self.stats = AnswerCacheStats()
+        self._clock = clock
+        self._entries: OrderedDict[int, _Entry] = OrderedDict()
+        self._contexts: dict[str, set[int]] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def context_key(
+        index_version: str, chunk_ids: Iterable[int], filters: MetadataFilter | None = None
+    ) -> str:
+        normalised = {
+            field: sorted([value] if isinstance(value, str) else value)
+            for field, value in (filters or {}).items()
+        }
+        raw = json.dumps([index_version, sorted(chunk_ids), normalised], sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def lookup(self, query_vector: np.ndarray, context: str) -> CachedAnswer | None:
+        with self._lock:
+            now = self._clock()
+            best: tuple[float, int] | None = None
+            for entry_id in list(self._contexts.get(context, ())):
+                entry = self._entries[entry_id]
+                if entry.expires_at <= now:
+                    self._drop(entry_id)
+                    self.stats.expirations += 1
+                    continue
+                similarity = float(entry.vector @ query_vector)
+                if similarity >= self.threshold and (best is None or similarity > best[0]):
+                    best = (similarity, entry_id)
+            if best is None:
+                self.stats.misses += 1
+                return None
+            self.stats.hits += 1
+            self._entries.move_to_end(best[1])
+            entry = self._entries[best[1]]
+            return CachedAnswer(entry.query, entry.answer, best[0])
+
+    def store(self, query: str, query_vector: np.ndarray, context: str, answer: str) -> None:
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = _Entry(
+                context,
+                query,
+                np.asarray(query_vector, dtype="float32"),
+                answer,
+                self._clock() + self.ttl_seconds,
+            )
+            self._contexts.setdefault(context, set()).add(entry_id)
+            self.stats.stores += 1
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.stats.evictions += 1
+
+    def _drop(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id)
+        siblings = self._contexts[entry.context]
+        siblings.discard(entry_id)
+        if not siblings:
+            del self._contexts[entry.context]
+
+
+__all__ = ["AnswerCacheStats", "CachedAnswer", "SemanticAnswerCache"]
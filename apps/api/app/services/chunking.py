@@ -0,0 +1,223 @@
+"""Token-aware markdown chunker that respects headings, code fences and tables."""
+
+from __future__ import annotations
+
+import math
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Callable
+
+try:  # declared dependency; exact counts for OpenAI embedding models
+    import tiktoken
+except ImportError:  # pragma: no cover - bare dev environments
+    tiktoken = None  # type: ignore
+
+_HEADING = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+_FENCE = re.compile(r"^\s*(```|~~~)")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_APPROX_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+HEADING_SEPARATOR = " > "
+
+# The embedding model's hard input limit; fenced code is only split beyond it.
+_MAX_EMBEDDING_TOKENS = 8191
+
+
+@lru_cache(maxsize=1)
+def _encoder() -> Callable[[str], list[int]] | None:
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding("cl100k_base").encode
+    except Exception:  # pragma: no cover - encoding files unavailable offline
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens with ``cl100k_base`` when tiktoken is available, else approximate.
+
+    tiktoken is a declared dependency, so deployed counts are exact. The fallback
+    (no tiktoken installed, or its encoding files unreachable offline) counts
+    punctuation as one token and words as one token per four characters: an
+    estimate only, which can miss chunk and prompt budgets by a few percent.
+    """
+
+    encode = _encoder()
+    if encode is not None:
+        return len(encode(text))
+    return sum(math.ceil(len(piece) / 4) for piece in _APPROX_TOKEN.findall(text))
+
+
+@dataclass(slots=True)
+class MarkdownChunk:
+    text: str
+    tokens: int
+    headings: list[str] = field(default_factory=list)
+
+    @property
+    def heading_path(self) -> str:
+        return HEADING_SEPARATOR.join(self.headings)
+
+
+@dataclass(slots=True)
+class _Block:
+    text: str
+    kind: str  # "heading" | "code" | "table" | "text"
+    headings: list[str]
+    tokens: int = 0
+
+
+def _blocks(markdown: str) -> list[_Block]:
+    """Split markdown into headings, whole fenced code blocks, tables and paragraphs."""
+
+    blocks: list[_Block] = []
+    path: list[str] = []
+    buffer: list[str] = []
+    buffer_kind = "text"
+
+    def flush() -> None:
+        nonlocal buffer, buffer_kind
+        text = "\n".join(buffer).strip("\n")
+        if text.strip():
+            blocks.append(_Block(text, buffer_kind, [title for title in path if title]))
+        buffer, buffer_kind = [], "text"
+
+    lines = markdown.splitlines()
+    position = 0
+    while position < len(lines):
+        line = lines[position]
+        fence = _FENCE.match(line)
+        heading = _HEADING.match(line)
+        if fence:
+            flush()
+            marker = fence.group(1)
+            code = [line]
+            position += 1
+            while position < len(lines):
+                code.append(lines[position])
+                if lines[position].strip().startswith(marker):
+                    break
+                position += 1
+            buffer, buffer_kind = code, "code"
+            flush()
+        elif heading:
+            flush()
+            level = len(heading.group(1))
+            del path[level - 1 :]
+            path.extend([""] * (level - 1 - len(path)))
+            path.append(heading.group(2))
+            blocks.append(_Block(line.strip(), "heading", [title for title in path if title]))
+        elif line.lstrip().startswith("|"):
+            if buffer_kind != "table":
+                flush()
+                buffer_kind = "table"
+            buffer.append(line)
+        elif not line.strip():
+            flush()
+        else:
+            if buffer_kind == "table":
+                flush()
+            buffer.append(line)
+        position += 1
+    flush()
+    for block in blocks:
+        block.tokens = count_tokens(block.text)
+    return blocks
+
+
+def _split_oversized(block: _Block, max_tokens: int) -> list[_Block]:
+    """Split a block that alone exceeds the budget into budget-sized pieces."""
+
+    if block.kind == "code" and block.tokens <= _MAX_EMBEDDING_TOKENS:
+        return [block]  # keep fenced code intact
+    if block.kind == "text":
+        units = _SENTENCE_END.split(block.text)
+        if any(count_tokens(unit) > max_tokens for unit in units):
+            units = block.text.split()
+        joiner = " "
+    else:
+        units = block.text.splitlines()
+        joiner = "\n"
+    pieces: list[_Block] = []
+    current: list[str] = []
+    current_tokens = 0
+    for unit in units:
+        unit_tokens = count_tokens(unit)
+        if current and current_tokens + unit_tokens > max_tokens:
+            pieces.append(_Block(joiner.join(current), block.kind, block.headings, current_tokens))
+            current, current_tokens = [], 0
+        current.append(unit)
+        current_tokens += unit_tokens
+    if current:
+        pieces.append(_Block(joiner.join(current), block.kind, block.headings, current_tokens))
+    return pieces
+
+
+def _overlap(blocks: list[_Block], overlap_tokens: int) -> list[_Block]:
+    """Trailing prose sentences of a closed chunk, carried into the next one."""
+
+    if overlap_tokens <= 0 or not blocks or blocks[-1].kind != "text":
+        return []
+    last = blocks[-1]
+    carried: list[str] = []
+    budget = 0
+    for sentence in reversed(_SENTENCE_END.split(last.text)):
+        tokens = count_tokens(sentence)
+        if budget + tokens > overlap_tokens:
+            break
+        carried.insert(0, sentence)
+        budget += tokens
+    if not carried:
+        return []
+    return [_Block(" ".join(carried), "text", last.headings, budget)]
+
+
+def chunk_markdown(
+    markdown: str, max_tokens: int = 350, overlap_tokens: int = 40
+) -> list[MarkdownChunk]:
+    """Pack markdown blocks into chunks of at most ``max_tokens`` tokens.
+
+    Headings start a new chunk once the current one is a quarter full, fenced
+    code blocks and tables are never split mid-way unless they alone exceed the
+    budget (code only beyond the embedding model's limit), and consecutive
+    chunks within a section share up to ``overlap_tokens`` of trailing prose.
+    """
+
+    chunks: list[MarkdownChunk] = []
+    current: list[_Block] = []
+    current_tokens = 0
+
+    def close(carry_overlap: bool, incoming: int = 0) -> None:
+        nonlocal current, current_tokens
+        # Keep a trailing "heading + lead-in" together with the block it introduces.
+        lead_in = max((i for i, block in enumerate(current) if block.kind == "heading"), default=0)
+        carried: list[_Block] = []
+        lead_in_tokens = sum(block.tokens for block in current[lead_in:])
+        if lead_in > 0 and lead_in_tokens + incoming <= max_tokens:
+            current, carried = current[:lead_in], current[lead_in:]
+        if any(block.kind != "heading" for block in current):
+            text = "\n\n".join(block.text for block in current)
+            chunks.append(MarkdownChunk(text, count_tokens(text), current[0].headings))
+            if not carried and carry_overlap:
+                carried = _overlap(current, overlap_tokens)
+            current = carried
+        else:
+            current = current + carried
+        current_tokens = sum(block.tokens for block in current)
+
+    for block in _blocks(markdown):
+        if block.kind == "heading" and current_tokens >= max_tokens // 4:
+            close(carry_overlap=False)
+        for piece in _split_oversized(block, max_tokens) if block.tokens > max_tokens else [block]:
+            if current and current_tokens + piece.tokens > max_tokens:
+                close(carry_overlap=True, incoming=piece.tokens)
+                if current_tokens + piece.tokens > max_tokens:
+                    current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += piece.tokens
+    close(carry_overlap=False)
+    return chunks
+
+
+__all__ = ["HEADING_SEPARATOR", "MarkdownChunk", "chunk_markdown", "count_tokens"]
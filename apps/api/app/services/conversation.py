@@ -0,0 +1,243 @@
+"""Per-conversation memory: recent turns, a rolling summary and reusable chunk ids."""
+
+from __future__ import annotations
+
+import json
+import re
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Protocol
+
+from app.core.config import settings
+from app.services.chunking import count_tokens
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+# Earlier retrieved chunks kept per conversation as candidates for follow-ups.
+_MAX_CHUNK_IDS = 12
+
+
+def _gist(text: str, max_tokens: int) -> str:
+    """Leading sentences of ``text`` that fit in ``max_tokens`` (at least one, clipped)."""
+
+    kept: list[str] = []
+    used = 0
+    for sentence in _SENTENCE_END.split(" ".join(text.split())):
+        tokens = count_tokens(sentence)
+        if kept and used + tokens > max_tokens:
+            break
+        kept.append(sentence)
+        used += tokens
+    gist = " ".join(kept)
+    if used > max_tokens:  # a single long first sentence
+        gist = " ".join(gist.split()[: max(1, max_tokens * 3 // 4)]) + " …"
+    return gist
+
+
+@dataclass(slots=True)
+class ConversationTurn:
+    question: str
+    answer: str
+    chunk_ids: list[int] = field(default_factory=list)
+
+
+@dataclass(slots=True)
+class Conversation:
+    """Recent turns verbatim, older turns folded into one-line summary entries."""
+
+    turns: list[ConversationTurn] = field(default_factory=list)
+    summary: list[str] = field(default_factory=list)
+    # Most recent first; candidates a follow-up question can reuse without a search.
+    chunk_ids: list[int] = field(default_factory=list)
+
+    @property
+    def has_history(self) -> bool:
+        return bool(self.turns or self.summary)
+
+    def append(self, turn: ConversationTurn, recent_turns: int, summary_tokens: int) -> None:
+        """Record ``turn``, folding turns beyond ``recent_turns`` into the summary."""
+
+        self.turns.append(turn)
+        while len(self.turns) > recent_turns:
+            old = self.turns.pop(0)
+            self.summary.append(f"{_gist(old.question, 20)} → {_gist(old.answer, 25)}")
+        while len(self.summary) > 1 and count_tokens("\n".join(self.summary)) > summary_tokens:
+            self.summary.pop(0)
+        self.chunk_ids = list(dict.fromkeys([*turn.chunk_ids, *self.chunk_ids]))[:_MAX_CHUNK_IDS]
+
+    def history(self, token_budget: int, answer_tokens: int = 60) -> str:
+        """Compressed transcript for a prompt: newest turns first to fill the budget."""
+
+        lines: list[str] = []
+        used = 0
+        for turn in reversed(self.turns):
+            entry = f"Siswa: {_gist(turn.question, 40)}\nTutor: {_gist(turn.answer, answer_tokens)}"
+            tokens = count_tokens(entry)
+            if used + tokens > token_budget:
+                break
+            lines.insert(0, entry)
+            used += tokens
+        else:
+            if self.summary:
+                summary = "Sebelumnya:\n" + "\n".join(f"- {line}" for line in self.summary)
+                if used + count_tokens(summary) <= token_budget:
+                    lines.insert(0, summary)
+        return "\n".join(lines)
+
+    def to_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, payload: dict[str, Any]) -> "Conversation":
+        return cls(
+            turns=[ConversationTurn(**turn) for turn in payload.get("turns", [])],
+            summary=list(payload.get("summary", [])),
+            chunk_ids=list(payload.get("chunk_ids", [])),
+        )
+
+
+def conversation_key(user_id: str, conversation_id: str) -> str:
+    """Store key of a client-chosen ``conversation_id``, scoped to the user who owns it."""
+
+    return f"{user_id}:{conversation_id}"
+
+
+class ConversationStore(Protocol):
+    """Async key-value store of :class:`Conversation` by :func:`conversation_key`."""
+
+    async def get(self, conversation_id: str) -> Conversation:
+        """The stored conversation, or an empty one when unknown or expired."""
+        ...
+
+    async def save(self, conversation_id: str, conversation: Conversation) -> None:
+        """Store ``conversation``, replacing what was kept under ``conversation_id``."""
+        ...
+
+    async def append(
+        self, conversation_id: str, turn: ConversationTurn, recent_turns: int, summary_tokens: int
+    ) -> None:
+        """Add ``turn`` to the latest stored conversation without losing concurrent turns."""
+        ...
+
+
+class InMemoryConversationStore(ConversationStore):
+    """Process-local LRU with a TTL; the stand-in when Redis is not configured."""
+
+    def __init__(
+        self,
+        max_conversations: int = 10_000,
+        ttl_seconds: float = 86_400.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.max_conversations = max_conversations
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(self, conversation_id: str) -> Conversation:
+        entry = self._entries.get(conversation_id)
+        if entry is None or entry[0] <= self._clock():
+            self._entries.pop(conversation_id, None)
+            return Conversation()
+        self._entries.move_to_end(conversation_id)
+        # Stored serialised so callers never share (and mutate) a cached object.
+        return Conversation.from_dict(json.loads(entry[1]))
+
+    async def save(self, conversation_id: str, conversation: Conversation) -> None:
+        payload = json.dumps(conversation.to_dict(), ensure_ascii=False)
+        self._entries[conversation_id] = (self._clock() + self.ttl_seconds, payload)
+        self._entries.move_to_end(conversation_id)
+        while len(self._entries) > self.max_conversations:
+            self._entries.popitem(last=False)
+
+    async def append(
+        self, conversation_id: str, turn: ConversationTurn, recent_turns: int, summary_tokens: int
+    ) -> None:
+        # Nothing here awaits, so the read-modify-write cannot interleave with another turn.
+        conversation = await self.get(conversation_id)
+        conversation.append(turn, recent_turns, summary_tokens)
+        await self.save(conversation_id, conversation)
+
+
+class RedisConversationStore(ConversationStore):
+    """Conversations as JSON strings in Redis, shared by every API worker."""
+
+    def __init__(
+        self, client: Any, ttl_seconds: float = 86_400.0, prefix: str = "conversation:"
+    ) -> None:
+        self._client = client
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str, ttl_seconds: float = 86_400.0) -> "RedisConversationStore":
+        import redis.asyncio as redis
+
+        return cls(redis.from_url(url, decode_responses=True), ttl_seconds)
+
+    async def get(self, conversation_id: str) -> Conversation:
+        payload = await self._client.get(self.prefix + conversation_id)
+        return Conversation.from_dict(json.loads(payload)) if payload else Conversation()
+
+    async def save(self, conversation_id: str, conversation: Conversation) -> None:
+        payload = json.dumps(conversation.to_dict(), ensure_ascii=False)
+        await self._client.set(self.prefix + conversation_id, payload, ex=int(self.ttl_seconds))
+
+    async def append(
+        self, conversation_id: str, turn: ConversationTurn, recent_turns: int, summary_tokens: int
+    ) -> None:
+        from redis.exceptions import WatchError
+
+        key = self.prefix + conversation_id
+        async with self._client.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    # WATCH makes the write fail if another worker saved a turn in between.
+                    await pipe.watch(key)
+                    payload = await pipe.get(key)
+                    conversation = (
+                        Conversation.from_dict(json.loads(payload)) if payload else Conversation()
+                    )
+                    conversation.append(turn, recent_turns, summary_tokens)
+                    pipe.multi()
+                    pipe.set(
+                        key,
+                        json.dumps(conversation.to_dict(), ensure_ascii=False),
+                        ex=int(self.ttl_seconds),
+                    )
+                    await pipe.execute()
+                    return
+                except WatchError:
+                    continue
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+
+def conversation_store_from_settings() -> ConversationStore:
+    if settings.conversation_store == "redis":
+        if not settings.redis_url:
+            raise ValueError("conversation_store=redis requires REDIS_URL")
+        return RedisConversationStore.from_url(
+            settings.redis_url, settings.conversation_ttl_seconds
+        )
+    if settings.conversation_store == "memory":
+        return InMemoryConversationStore(
+            settings.conversation_max_entries, settings.conversation_ttl_seconds
+        )
+    raise ValueError(f"Unknown conversation store '{settings.conversation_store}'")
+
+
+__all__ = [
+    "Conversation",
+    "ConversationStore",
+    "ConversationTurn",
+    "InMemoryConversationStore",
+    "RedisConversationStore",
+    "conversation_key",
+    "conversation_store_from_settings",
+]
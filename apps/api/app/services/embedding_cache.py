@@ -0,0 +1,147 @@
+"""Content-addressed embedding cache with an LRU memory tier and a SQLite disk tier."""
+
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Sequence
+
+import numpy as np
+
+CacheKey = tuple[str, int, str]
+
+_SQLITE_MAX_PARAMS = 500
+
+
+@dataclass(slots=True)
+class CacheStats:
+    """Hit/miss counters for the embedding cache."""
+
+    memory_hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.memory_hits + self.disk_hits + self.misses
+        return (self.memory_hits + self.disk_hits) / total if total else 0.0
+
+    def as_dict(self) -> dict[str, float]:
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hit_rate, 4),
+        }
+
+
+def text_digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Two-tier cache mapping ``(model, dimension, sha256(text))`` to a vector.
+
+    The memory tier is a bounded LRU; the optional disk tier is a SQLite table so
+    vectors survive restarts and re-ingests.
+    """
+
+    def __init__(self, max_entries: int = 10_000, path: Path | str | None = None) -> None:
+        self.max_entries = max_entries
+        self.stats = CacheStats()
+        self._memory: OrderedDict[CacheKey, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: sqlite3.Connection | None = None
+        if path:
+            db_path = Path(path)
+            db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(db_path), check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, dimension INTEGER NOT NULL, digest TEXT NOT NULL, "
+                "vector BLOB NOT NULL, PRIMARY KEY (model, dimension, digest))"
+            )
+            self._db.commit()
+
+    @property
+    def has_disk_tier(self) -> bool:
+        """Whether lookups and stores may block on SQLite I/O."""
+
+        return self._db is not None
+
+    def get_many(self, model: str, dimension: int, texts: Sequence[str]) -> list[np.ndarray | None]:
+        """Return cached vectors aligned with ``texts``; ``None`` marks a miss."""
+
+        keys = [(model, dimension, text_digest(text)) for text in texts]
+        results: list[np.ndarray | None] = [None] * len(keys)
+        pending: dict[str, list[int]] = {}
+        with self._lock:
+            for position, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    self.stats.memory_hits += 1
+                    results[position] = vector
+                else:
+                    pending.setdefault(key[2], []).append(position)
+            if pending and self._db is not None:
+                for digest, vector in self._load(model, dimension, list(pending)):
+                    self._remember((model, dimension, digest), vector)
+                    for position in pending.pop(digest):
+                        results[position] = vector
+                        self.stats.disk_hits += 1
+            self.stats.misses += sum(len(positions) for positions in pending.values())
+        return results
+
+    def put_many(
+        self, model: str, dimension: int, texts: Sequence[str], vectors: np.ndarray
+    ) -> None:
+        rows = []
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                digest = text_digest(text)
+                stored = np.array(vector, dtype="float32")
+                self._remember((model, dimension, digest), stored)
+                rows.append((model, dimension, digest, stored.tobytes()))
+            if self._db is not None and rows:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (model, dimension, digest, vector) "
+                    "VALUES (?, ?, ?, ?)",
+                    rows,
+                )
+                self._db.commit()
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _remember(self, key: CacheKey, vector: np.ndarray) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _load(self, model: str, dimension: int, digests: list[str]) -> list[tuple[str, np.ndarray]]:
+        assert self._db is not None
+        found: list[tuple[str, np.ndarray]] = []
+        for offset in range(0, len(digests), _SQLITE_MAX_PARAMS):
+            window = digests[offset : offset + _SQLITE_MAX_PARAMS]
+            placeholders = ",".join("?" * len(window))
+            cursor = self._db.execute(
+                f"SELECT digest, vector FROM embeddings WHERE model = ? AND dimension = ? "
+                f"AND digest IN ({placeholders})",
+                (model, dimension, *window),
+            )
+            found.extend(
+                (digest, np.frombuffer(blob, dtype="float32").copy()) for digest, blob in cursor
+            )
+        return found
+
+
+__all__ = ["CacheStats", "EmbeddingCache", "text_digest"]
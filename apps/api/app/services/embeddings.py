@@ -0,0 +1,260 @@
+"""Batched embedding backends used by the RAG service."""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import random
+import time
+from functools import lru_cache
+from typing import Any, Iterator, Sequence
+
+import httpx
+import numpy as np
+from openai import (
+    APIConnectionError,
+    APITimeoutError,
+    AsyncOpenAI,
+    InternalServerError,
+    OpenAI,
+    RateLimitError,
+)
+from openai.types import CreateEmbeddingResponse
+
+from app.core.config import settings
+from app.core.http import http_clients
+from app.services.embedding_cache import EmbeddingCache
+
+_RETRYABLE_ERRORS = (APIConnectionError, APITimeoutError, InternalServerError, RateLimitError)
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap upper-bound token estimate used to size embedding batches."""
+
+    return max(1, len(text) // 3)
+
+
+def iter_batches(
+    texts: Sequence[str], max_items: int, max_tokens: int
+) -> Iterator[tuple[int, int]]:
+    """Yield ``(start, end)`` slices bounded by item count and estimated tokens."""
+
+    start = 0
+    budget = 0
+    for position, text in enumerate(texts):
+        cost = estimate_tokens(text)
+        if position > start and (position - start >= max_items or budget + cost > max_tokens):
+            yield start, position
+            start, budget = position, 0
+        budget += cost
+    if start < len(texts):
+        yield start, len(texts)
+
+
+@lru_cache(maxsize=65536)
+def _token_bucket(token: str, dimension: int) -> int:
+    token_hash = hashlib.sha256(token.encode("utf-8")).hexdigest()
+    return int(token_hash[:8], 16) % dimension
+
+
+def hash_embed_batch(texts: Sequence[str], dimension: int) -> np.ndarray:
+    """Vectorised bag-of-hashed-tokens fallback returning one L2-normalised matrix."""
+
+    matrix = np.zeros((len(texts), dimension), dtype="float32")
+    rows: list[int] = []
+    cols: list[int] = []
+    for row, text in enumerate(texts):
+        for token in text.lower().split():
+            rows.append(row)
+            cols.append(_token_bucket(token, dimension))
+    if rows:
+        np.add.at(matrix, (np.asarray(rows), np.asarray(cols)), 1.0)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+
+@lru_cache(maxsize=4)
+def get_openai_client(api_key: str) -> OpenAI:
+    """Return a process-wide OpenAI client so connections are pooled across calls."""
+
+    return OpenAI(api_key=api_key, max_retries=0)
+
+
+def get_async_openai_client(api_key: str) -> AsyncOpenAI:
+    """Async counterpart of :func:`get_openai_client` on the shared ``openai`` HTTP pool."""
+
+    return _async_openai_client(api_key, http_clients.get("openai"))
+
+
+@lru_cache(maxsize=4)
+def _async_openai_client(api_key: str, http_client: httpx.AsyncClient) -> AsyncOpenAI:
+    return AsyncOpenAI(api_key=api_key, max_retries=0, http_client=http_client)
+
+
+class Embedder:
+    """Embeds texts in size- and token-bounded batches with retry and backoff.
+
+    Uses OpenAI when an API key is configured, otherwise the deterministic hash
+    fallback so local development and tests work offline.
+    """
+
+    def __init__(
+        self,
+        dimension: int,
+        *,
+        model: str | None = None,
+        api_key: str | None = None,
+        max_batch_size: int | None = None,
+        max_batch_tokens: int | None = None,
+        max_retries: int | None = None,
+        cache: EmbeddingCache | None = None,
+    ) -> None:
+        self.dimension = dimension
+        self.model = model or settings.embedding_model
+        self.api_key = api_key if api_key is not None else settings.openai_api_key
+        self.max_batch_size = max_batch_size or settings.embedding_batch_size
+        self.max_batch_tokens = max_batch_tokens or settings.embedding_batch_tokens
+        self.max_retries = settings.embedding_max_retries if max_retries is None else max_retries
+        self.cache = cache
+        self.requests_sent = 0
+
+    @property
+    def uses_remote(self) -> bool:
+        return bool(self.api_key)
+
+    @property
+    def cache_namespace(self) -> str:
+        return self.model if self.uses_remote else "hash"
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """Embed ``texts`` into a ``(len(texts), dimension)`` float32 matrix.
+
+        Cached vectors are reused and each distinct missing text is embedded once.
+        """
+
+        output, missing = self._lookup(texts)
+        if missing:
+            self._store(output, missing, self._compute(list(missing)))
+        return output
+
+    async def aembed(self, texts: Sequence[str]) -> np.ndarray:
+        """Async variant of :meth:`embed`; remote batches go through ``AsyncOpenAI``.
+
+        A SQLite cache tier is read and written in a worker thread so disk I/O
+        (and its lock) never stalls the event loop.
+        """
+
+        off_loop = self.cache is not None and self.cache.has_disk_tier
+        if off_loop:
+            output, missing = await asyncio.to_thread(self._lookup, texts)
+        else:
+            output, missing = self._lookup(texts)
+        if missing:
+            computed = await self._acompute(list(missing))
+            if off_loop:
+                await asyncio.to_thread(self._store, output, missing, computed)
+            else:
+                self._store(output, missing, computed)
+        return output
+
+    def embed_one(self, text: str) -> np.ndarray:
+        vector: np.ndarray = self.embed([text])[0]
+        return vector
+
+    async def aembed_one(self, text: str) -> np.ndarray:
+        vector: np.ndarray = (await self.aembed([text]))[0]
+        return vector
+
+    def _lookup(self, texts: Sequence[str]) -> tuple[np.ndarray, dict[str, list[int]]]:
+        output = np.empty((len(texts), self.dimension), dtype="float32")
+        missing: dict[str, list[int]] = {}
+        if self.cache is None:
+            for position, text in enumerate(texts):
+                missing.setdefault(text, []).append(position)
+            return output, missing
+        cached = self.cache.get_many(self.cache_namespace, self.dimension, texts)
+        for position, (text, vector) in enumerate(zip(texts, cached)):
+            if vector is None:
+                missing.setdefault(text, []).append(position)
+            else:
+                output[position] = vector
+        return output, missing
+
+    def _store(
+        self, output: np.ndarray, missing: dict[str, list[int]], computed: np.ndarray
+    ) -> None:
+        if self.cache is not None:
+            self.cache.put_many(self.cache_namespace, self.dimension, list(missing), computed)
+        for positions, vector in zip(missing.values(), computed):
+            output[positions] = vector
+
+    def _compute(self, texts: Sequence[str]) -> np.ndarray:
+        if not self.uses_remote:
+            return hash_embed_batch(texts, self.dimension)
+        output = np.empty((len(texts), self.dimension), dtype="float32")
+        for start, end in iter_batches(texts, self.max_batch_size, self.max_batch_tokens):
+            output[start:end] = self._embed_remote(texts[start:end])
+        return output
+
+    async def _acompute(self, texts: Sequence[str]) -> np.ndarray:
+        if not self.uses_remote:
+            return hash_embed_batch(texts, self.dimension)
+        output = np.empty((len(texts), self.dimension), dtype="float32")
+        for start, end in iter_batches(texts, self.max_batch_size, self.max_batch_tokens):
+            output[start:end] = await self._aembed_remote(texts[start:end])
+        return output
+
+    def _request_options(self, texts: Sequence[str]) -> dict[str, Any]:
+        return {"input": list(texts), "model": self.model, "dimensions": self.dimension}
+
+    def _embed_remote(self, texts: Sequence[str]) -> np.ndarray:
+        client = get_openai_client(self.api_key or "")
+        attempt = 0
+        while True:
+            try:
+                self.requests_sent += 1
+                response = client.embeddings.create(**self._request_options(texts))
+                break
+            except _RETRYABLE_ERRORS:
+                if attempt >= self.max_retries:
+                    raise
+                time.sleep(_backoff(attempt))
+                attempt += 1
+        return _response_matrix(response)
+
+    async def _aembed_remote(self, texts: Sequence[str]) -> np.ndarray:
+        client = get_async_openai_client(self.api_key or "")
+        attempt = 0
+        while True:
+            try:
+                self.requests_sent += 1
+                response = await client.embeddings.create(**self._request_options(texts))
+                break
+            except _RETRYABLE_ERRORS:
+                if attempt >= self.max_retries:
+                    raise
+                await asyncio.sleep(_backoff(attempt))
+                attempt += 1
+        return _response_matrix(response)
+
+
+def _backoff(attempt: int) -> float:
+    """Exponential backoff with jitter, capped at 30 seconds."""
+
+    return min(30.0, 0.5 * 2.0**attempt) * (0.5 + random.random() / 2)
+
+
+def _response_matrix(response: CreateEmbeddingResponse) -> np.ndarray:
+    ordered = sorted(response.data, key=lambda item: item.index)
+    return np.asarray([item.embedding for item in ordered], dtype="float32")
+
+
+__all__ = [
+    "Embedder",
+    "estimate_tokens",
+    "get_async_openai_client",
+    "get_openai_client",
+    "hash_embed_batch",
+    "iter_batches",
+]
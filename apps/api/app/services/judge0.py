@@ -0,0 +1,333 @@
+"""Judge0 client and a dispatcher that batches submissions and polls them together."""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, Callable
+
+import httpx
+
+from app.core.config import settings
+from app.core.http import http_clients
+
+# Judge0 CE language ids for the names students pick in the editor.
+LANGUAGE_IDS = {
+    "python": 71,
+    "python3": 71,
+    "py": 71,
+    "javascript": 63,
+    "js": 63,
+    "typescript": 74,
+    "ts": 74,
+    "c": 50,
+    "cpp": 54,
+    "c++": 54,
+    "java": 62,
+    "go": 60,
+    "csharp": 51,
+    "c#": 51,
+    "php": 68,
+    "ruby": 72,
+}
+
+# Judge0 status ids (GET /statuses).
+_IN_QUEUE, _PROCESSING, _ACCEPTED, _WRONG_ANSWER, _TIME_LIMIT, _COMPILATION_ERROR = 1, 2, 3, 4, 5, 6
+_RUNTIME_ERRORS = range(7, 13)  # SIGSEGV, SIGXFSZ, SIGFPE, SIGABRT, NZEC, other
+_PENDING = {_IN_QUEUE, _PROCESSING}
+
+_FIELDS = "token,stdout,stderr,compile_output,message,status,time"
+# How long the instance's language list (names with compiler versions) is trusted.
+_LANGUAGES_TTL_SECONDS = 3600.0
+
+
+class Judge0Error(RuntimeError):
+    """Judge0 rejected a submission, failed internally or did not answer in time."""
+
+
+class UnsupportedLanguage(ValueError):
+    pass
+
+
+@dataclass(slots=True)
+class Judge0Result:
+    stdout: str
+    stderr: str | None
+    status: str  # "completed", "error" or "timeout"
+    execution_time_ms: int | None
+
+
+def language_id(language: str) -> int:
+    try:
+        return LANGUAGE_IDS[language.lower()]
+    except KeyError:
+        raise UnsupportedLanguage(f"Judge0 does not run '{language}'.") from None
+
+
+def parse_submission(payload: dict[str, Any]) -> Judge0Result | None:
+    """Map one Judge0 submission to a result; ``None`` while it is still queued or running."""
+
+    status_id = (payload.get("status") or {}).get("id")
+    if status_id in _PENDING:
+        return None
+    seconds = payload.get("time")
+    elapsed = round(float(seconds) * 1000) if seconds else None
+    stdout = payload.get("stdout") or ""
+    if status_id in (_ACCEPTED, _WRONG_ANSWER):  # no expected_output is sent, so 4 is not a failure
+        return Judge0Result(stdout, payload.get("stderr") or None, "completed", elapsed)
+    if status_id == _TIME_LIMIT:
+        return Judge0Result(stdout, "Execution exceeded time limit.", "timeout", elapsed)
+    if status_id == _COMPILATION_ERROR:
+        return Judge0Result("", payload.get("compile_output") or "Compilation failed.", "error", 0)
+    if status_id in _RUNTIME_ERRORS:
+        stderr = payload.get("stderr") or payload.get("message") or "Runtime error."
+        return Judge0Result(stdout, stderr, "error", elapsed)
+    description = (payload.get("status") or {}).get("description", "unknown status")
+    raise Judge0Error(f"Judge0 failed: {payload.get('message') or description}")
+
+
+class Judge0Client:
+    """The two batch endpoints of a Judge0 instance (RapidAPI or self-hosted)."""
+
+    def __init__(
+        self,
+        base_url: str,
+        api_key: str | None = None,
+        client: Callable[[], httpx.AsyncClient] = lambda: http_clients.get("judge0"),
+    ) -> None:
+        self.base_url = base_url.rstrip("/")
+        self._client = client
+        host = httpx.URL(self.base_url).host
+        if host.endswith("rapidapi.com"):
+            self.headers = {"x-rapidapi-host": host, "x-rapidapi-key": api_key or ""}
+        else:
+            self.headers = {"X-Auth-Token": api_key} if api_key else {}
+
+    async def submit_batch(self, submissions: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """POST ``submissions``; one ``{"token": ...}`` (or ``{"error": ...}``) each, in order."""
+
+        response = await self._client().post(
+            f"{self.base_url}/submissions/batch",
+            params={"base64_encoded": "false"},
+            json={"submissions": submissions},
+            headers=self.headers,
+        )
+        if response.status_code not in (200, 201):
+            raise Judge0Error(f"Judge0 batch submission failed ({response.status_code})")
+        tokens: list[dict[str, Any]] = response.json()
+        return tokens
+
+    async def get_batch(self, tokens: list[str]) -> list[dict[str, Any]]:
+        response = await self._client().get(
+            f"{self.base_url}/submissions/batch",
+            params={"tokens": ",".join(tokens), "base64_encoded": "false", "fields": _FIELDS},
+            headers=self.headers,
+        )
+        if response.status_code != 200:
+            raise Judge0Error(f"Judge0 batch poll failed ({response.status_code})")
+        results: list[dict[str, Any]] = response.json()["submissions"]
+        return results
+
+    async def languages(self) -> dict[int, str]:
+        """``GET /languages``: language id -> name with version, e.g. ``"Python (3.8.1)"``."""
+
+        response = await self._client().get(f"{self.base_url}/languages", headers=self.headers)
+        if response.status_code != 200:
+            raise Judge0Error(f"Judge0 language list failed ({response.status_code})")
+        return {int(entry["id"]): str(entry["name"]) for entry in response.json()}
+
+
+@dataclass(slots=True)
+class _Pending:
+    submission: dict[str, Any]
+    future: asyncio.Future[Judge0Result]
+    deadline: float
+
+
+class Judge0Dispatcher:
+    """Collects concurrent runs into batch submissions and polls every open token at once.
+
+    A run waits at most ``batch_window`` seconds for others to join its batch
+    (up to ``batch_size``, Judge0's default batch limit); open tokens are then
+    fetched together every ``poll_interval`` seconds. A classroom submitting at
+    the same moment costs one POST plus a GET per poll round instead of a
+    blocking request per student.
+    """
+
+    def __init__(
+        self,
+        client: Judge0Client,
+        batch_size: int = 20,
+        batch_window: float = 0.05,
+        poll_interval: float = 0.5,
+        timeout: float = 30.0,
+    ) -> None:
+        self.client = client
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self._queue: asyncio.Queue[_Pending] = asyncio.Queue()
+        self._open: dict[str, _Pending] = {}
+        self._tasks: list[asyncio.Task[None]] = []
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._languages: dict[int, str] = {}
+        self._languages_expire = 0.0
+        self.batches_submitted = 0
+        self.polls = 0
+        self.submissions = 0
+
+    @classmethod
+    def from_settings(cls) -> "Judge0Dispatcher":
+        return cls(
+            Judge0Client(settings.judge0_url or "", settings.judge0_api_key),
+            batch_size=settings.judge0_batch_size,
+            batch_window=settings.judge0_batch_window_seconds,
+            poll_interval=settings.judge0_poll_interval_seconds,
+            timeout=settings.judge0_timeout_seconds,
+        )
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "submissions": self.submissions,
+            "batches_submitted": self.batches_submitted,
+            "polls": self.polls,
+            "open": len(self._open),
+            "queued": self._queue.qsize(),
+        }
+
+    async def runtime_version(self, language: str) -> str | None:
+        """``"<language id>:<name and version>"`` Judge0 runs ``language`` with.
+
+        ``None`` when the language is unsupported or the instance's language
+        list cannot be fetched; the list is refreshed every hour so a Judge0
+        upgrade changes the version within that time.
+        """
+
+        try:
+            lang_id = language_id(language)
+        except UnsupportedLanguage:
+            return None
+        if self._languages_expire <= time.monotonic():
+            try:
+                self._languages = await self.client.languages()
+            except (Judge0Error, httpx.HTTPError, ValueError, KeyError, TypeError):
+                return None
+            self._languages_expire = time.monotonic() + _LANGUAGES_TTL_SECONDS
+        name = self._languages.get(lang_id)
+        return f"{lang_id}:{name}" if name else None
+
+    async def run(self, language: str, source: str, stdin: str = "") -> Judge0Result:
+        submission = {"language_id": language_id(language), "source_code": source, "stdin": stdin}
+        self._ensure_running()
+        future: asyncio.Future[Judge0Result] = asyncio.get_running_loop().create_future()
+        self.submissions += 1
+        await self._queue.put(_Pending(submission, future, time.monotonic() + self.timeout))
+        return await future
+
+    async def aclose(self) -> None:
+        if self._loop is not asyncio.get_running_loop():
+            return
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for pending in self._open.values():
+            if not pending.future.done():
+                pending.future.set_exception(Judge0Error("Judge0 dispatcher stopped"))
+        self._open.clear()
+
+    def _ensure_running(self) -> None:
+        # Queue and tasks belong to one loop; a new loop (tests, Celery) starts afresh.
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or not self._tasks or any(task.done() for task in self._tasks):
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._open = {}
+            self._tasks = [
+                loop.create_task(self._submit_loop()),
+                loop.create_task(self._poll_loop()),
+            ]
+
+    async def _next_batch(self) -> list[_Pending]:
+        batch = [await self._queue.get()]
+        closes = time.monotonic() + self.batch_window
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), closes - time.monotonic()))
+            except TimeoutError:
+                break
+        return [pending for pending in batch if not pending.future.done()]
+
+    async def _submit_loop(self) -> None:
+        while True:
+            batch = await self._next_batch()
+            if not batch:
+                continue
+            try:
+                tokens = await self.client.submit_batch([pending.submission for pending in batch])
+            except (Judge0Error, httpx.HTTPError) as exc:
+                for pending in batch:
+                    _fail(pending, Judge0Error(f"Judge0 unavailable: {exc}"))
+                continue
+            self.batches_submitted += 1
+            for pending, entry in zip(batch, tokens):
+                if "token" in entry:
+                    self._open[entry["token"]] = pending
+                else:
+                    _fail(pending, Judge0Error(f"Judge0 rejected the submission: {entry}"))
+
+    async def _poll_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            now = time.monotonic()
+            for token, pending in list(self._open.items()):
+                if pending.future.done() or pending.deadline <= now:
+                    del self._open[token]
+                    _fail(pending, Judge0Error("Judge0 did not finish in time"))
+            tokens = list(self._open)
+            for start in range(0, len(tokens), self.batch_size):
+                await self._poll(tokens[start : start + self.batch_size])
+
+    async def _poll(self, tokens: list[str]) -> None:
+        try:
+            submissions = await self.client.get_batch(tokens)
+        except (Judge0Error, httpx.HTTPError):
+            return  # transient; retried next round until each run's deadline
+        self.polls += 1
+        for payload in submissions:
+            pending = self._open.get(payload.get("token", ""))
+            if pending is None:
+                continue
+            try:
+                result = parse_submission(payload)
+            except Judge0Error as exc:
+                del self._open[payload["token"]]
+                _fail(pending, exc)
+                continue
+            if result is not None:
+                del self._open[payload["token"]]
+                if not pending.future.done():
+                    pending.future.set_result(result)
+
+
+def _fail(pending: _Pending, exc: Exception) -> None:
+    if not pending.future.done():
+        pending.future.set_exception(exc)
+
+
+judge0_dispatcher = Judge0Dispatcher.from_settings()
+
+
+__all__ = [
+    "Judge0Client",
+    "Judge0Dispatcher",
+    "Judge0Error",
+    "Judge0Result",
+    "LANGUAGE_IDS",
+    "UnsupportedLanguage",
+    "judge0_dispatcher",
+    "language_id",
+    "parse_submission",
+]
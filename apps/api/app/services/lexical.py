@@ -0,0 +1,162 @@
+"""BM25 lexical index with an Indonesian- and code-aware tokenizer."""
+
+from __future__ import annotations
+
+import json
+import math
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Iterable, Sequence
+
+import numpy as np
+
+# Identifiers such as ``csv.reader`` / ``range(5)`` are kept whole, then split into parts.
+_TOKEN_PATTERN = re.compile(r"[a-z_][\w]*(?:\.[a-z_]\w*)+(?:\([^()\s]*\))?|\w+\([^()\s]*\)|\w+")
+_PART_PATTERN = re.compile(r"\w+")
+
+_STOPWORDS = frozenset(
+    """
+    yang dan di ke dari ini itu untuk dengan adalah atau pada dalam juga akan
+    bisa dapat tidak ada oleh sebagai karena jika maka agar saya kamu kita kami
+    mereka apa bagaimana mengapa kenapa tersebut lebih sudah telah sangat seperti
+    """.split()
+)
+_PARTICLE_SUFFIXES = ("nya", "lah", "kah", "pun")
+_MIN_STEM_LENGTH = 4
+
+
+def _strip_particle(word: str) -> str:
+    for suffix in _PARTICLE_SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= _MIN_STEM_LENGTH:
+            return word[: -len(suffix)]
+    return word
+
+
+def tokenize(text: str) -> list[str]:
+    """Lower-case tokens: whole code identifiers, their parts, words and word bigrams.
+
+    Indonesian particles (``-nya``, ``-lah``, ``-kah``, ``-pun``) are stripped and
+    common Indonesian function words dropped; English/Python keywords such as
+    ``for`` and ``in`` are kept because they are meaningful in code questions.
+    """
+
+    tokens: list[str] = []
+    words: list[str] = []
+    for match in _TOKEN_PATTERN.finditer(text.lower()):
+        raw = match.group()
+        parts = _PART_PATTERN.findall(raw)
+        if len(parts) > 1:
+            tokens.append(raw)
+        for part in parts:
+            word = _strip_particle(part)
+            words.append(word)
+            if word not in _STOPWORDS:
+                tokens.append(word)
+    tokens.extend(f"{left} {right}" for left, right in zip(words, words[1:]))
+    return tokens
+
+
+class BM25Index:
+    """Okapi BM25 over documents addressed by the same ids as the vector index."""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        self._postings: dict[str, dict[int, int]] = {}
+        self._lengths: dict[int, int] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def add(self, doc_id: int, text: str) -> None:
+        counts = Counter(tokenize(text))
+        for term, tf in counts.items():
+            self._postings.setdefault(term, {})[doc_id] = tf
+        length = sum(counts.values())
+        self._lengths[doc_id] = length
+        self._total_length += length
+
+    def remove(self, doc_id: int, text: str) -> None:
+        length = self._lengths.pop(doc_id, None)
+        if length is None:
+            return
+        self._total_length -= length
+        for term in set(tokenize(text)):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+
+    def search(
+        self, query: str, top_k: int, allowed: np.ndarray | None = None
+    ) -> list[tuple[float, int]]:
+        """Return ``(score, doc_id)`` pairs, best first.
+
+        ``allowed`` is an optional boolean mask indexed by doc id.
+        """
+
+        if not self._lengths:
+            return []
+        n_docs = len(self._lengths)
+        avg_length = self._total_length / n_docs or 1.0
+        scores: dict[int, float] = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            ids = np.fromiter(postings.keys(), dtype=np.int64, count=len(postings))
+            tfs = np.fromiter(postings.values(), dtype=np.float32, count=len(postings))
+            if allowed is not None:
+                keep = ids < len(allowed)
+                keep[keep] = allowed[ids[keep]]
+                ids, tfs = ids[keep], tfs[keep]
+                if not len(ids):
+                    continue
+            lengths = np.fromiter((self._lengths[i] for i in ids), dtype=np.float32, count=len(ids))
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * lengths / avg_length)
+            weights = idf * tfs * (self.k1 + 1) / (tfs + norm)
+            for doc_id, value in zip(ids.tolist(), weights.tolist()):
+                scores[doc_id] = scores.get(doc_id, 0.0) + value
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [(score, doc_id) for doc_id, score in ranked]
+
+    def dump(self, path: Path) -> None:
+        payload = {
+            "k1": self.k1,
+            "b": self.b,
+            "lengths": self._lengths,
+            "postings": self._postings,
+        }
+        path.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+
+    @classmethod
+    def load(cls, path: Path) -> "BM25Index":
+        payload = json.loads(path.read_text(encoding="utf-8"))
+        index = cls(k1=payload["k1"], b=payload["b"])
+        index._lengths = {int(doc_id): length for doc_id, length in payload["lengths"].items()}
+        index._total_length = sum(index._lengths.values())
+        index._postings = {
+            term: {int(doc_id): tf for doc_id, tf in postings.items()}
+            for term, postings in payload["postings"].items()
+        }
+        return index
+
+
+def reciprocal_rank_fusion(
+    rankings: Iterable[Sequence[int]], k: int = 60
+) -> list[tuple[float, int]]:
+    """Fuse ranked id lists with RRF: ``score(d) = sum(1 / (k + rank(d)))``."""
+
+    fused: dict[int, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+    ranked = sorted(fused.items(), key=lambda item: (-item[1], item[0]))
+    return [(score, doc_id) for doc_id, score in ranked]
+
+
+__all__ = ["BM25Index", "reciprocal_rank_fusion", "tokenize"]
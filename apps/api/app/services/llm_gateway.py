@@ -0,0 +1,558 @@
+"""Multi-provider LLM gateway with latency tracking, circuit breaking and hedging."""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import json
+import logging
+import math
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Coroutine, Sequence, TypeVar
+
+import httpx
+
+from app.core.config import settings
+from app.core.http import http_clients
+
+logger = logging.getLogger(__name__)
+
+_T = TypeVar("_T")
+
+# Samples a provider needs before its own p95 replaces the configured hedge delay.
+_MIN_HEDGE_SAMPLES = 20
+
+
+class LLMProviderError(RuntimeError):
+    """A provider answered, but not with usable text."""
+
+
+def describe_error(error: BaseException) -> str:
+    """Loggable summary of a provider error.
+
+    Only the type (and HTTP status) is kept: ``httpx`` messages carry the
+    request URL, and provider error bodies may echo request headers.
+    """
+
+    if isinstance(error, httpx.HTTPStatusError):
+        return f"{type(error).__name__} (HTTP {error.response.status_code})"
+    return type(error).__name__
+
+
+class AllProvidersFailed(RuntimeError):
+    """Every eligible provider failed (or none was eligible) for one request."""
+
+    def __init__(self, errors: Sequence[tuple[str, BaseException]]) -> None:
+        self.errors = list(errors)
+        detail = "; ".join(f"{name}: {describe_error(error)}" for name, error in self.errors)
+        super().__init__(detail or "no LLM provider available")
+
+
+@dataclass(slots=True, frozen=True)
+class LLMRequest:
+    """Provider-neutral prompt: a static system instruction plus the per-turn text."""
+
+    system: str
+    prompt: str
+
+
+class LLMProvider(ABC):
+    """Base class for generation backends; subclasses raise on any failure."""
+
+    name = "provider"
+
+    @property
+    def configured(self) -> bool:
+        return True
+
+    @abstractmethod
+    async def generate(self, request: LLMRequest) -> str:
+        """The complete answer."""
+
+    @abstractmethod
+    def stream(self, request: LLMRequest) -> AsyncIterator[str]:
+        """Text deltas as they arrive; closing the iterator aborts the request."""
+
+
+def _candidate_text(data: dict[str, Any]) -> str:
+    """Text of the first candidate of a (streamed) ``GenerateContentResponse``."""
+
+    candidates = data.get("candidates") or []
+    if not candidates:
+        return ""
+    parts = candidates[0].get("content", {}).get("parts", [])
+    return "".join(part.get("text", "") for part in parts)
+
+
+class GeminiProvider(LLMProvider):
+    name = "gemini"
+
+    def __init__(
+        self,
+        model: str = "gemini-2.5-flash",
+        base_url: str = "https://generativelanguage.googleapis.com/v1",
+        api_key: str | None = None,
+    ) -> None:
+        self.model = model
+        self.base_url = base_url.rstrip("/")
+        self._api_key = api_key
+
+    @property
+    def api_key(self) -> str | None:
+        return self._api_key or settings.google_gemini_api_key
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.api_key)
+
+    def url(self, method: str) -> str:
+        # Streaming responses are requested as server-sent events.
+        sse = "?alt=sse" if method == "streamGenerateContent" else ""
+        return f"{self.base_url}/models/{self.model}:{method}{sse}"
+
+    def _headers(self) -> dict[str, str]:
+        # A header rather than ``?key=``, which would end up in URLs that get logged.
+        return {"x-goog-api-key": self.api_key or ""}
+
+    def payload(self, request: LLMRequest) -> dict[str, Any]:
+        # The static system instruction goes first and the per-turn text last, so
+        # requests share a byte-identical prefix. That is all this code does for
+        # caching: Gemini's implicit caching decides on its own whether to reuse
+        # it (no explicit ``cachedContents`` are created).
+        return {
+            "systemInstruction": {"parts": [{"text": request.system}]},
+            "contents": [{"role": "user", "parts": [{"text": request.prompt}]}],
+        }
+
+    async def generate(self, request: LLMRequest) -> str:
+        response = await http_clients.get("gemini").post(
+            self.url("generateContent"), json=self.payload(request), headers=self._headers()
+        )
+        response.raise_for_status()
+        text = _candidate_text(response.json())
+        if not text:
+            raise LLMProviderError("No response from Gemini")
+        return text
+
+    async def stream(self, request: LLMRequest) -> AsyncIterator[str]:
+        async with http_clients.get("gemini").stream(
+            "POST",
+            self.url("streamGenerateContent"),
+            json=self.payload(request),
+            headers=self._headers(),
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line.startswith("data:"):
+                    text = _candidate_text(json.loads(line[5:]))
+                    if text:
+                        yield text
+
+
+class OpenAIProvider(LLMProvider):
+    """OpenAI (or any compatible server) via the chat completions endpoint."""
+
+    name = "openai"
+
+    def __init__(
+        self,
+        model: str = "gpt-4o-mini",
+        base_url: str = "https://api.openai.com/v1",
+        api_key: str | None = None,
+    ) -> None:
+        self.model = model
+        self.base_url = base_url.rstrip("/")
+        self._api_key = api_key
+
+    @property
+    def api_key(self) -> str | None:
+        return self._api_key or settings.openai_api_key
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.api_key)
+
+    def payload(self, request: LLMRequest, stream: bool = False) -> dict[str, Any]:
+        return {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": request.system},
+                {"role": "user", "content": request.prompt},
+            ],
+            "stream": stream,
+        }
+
+    def _headers(self) -> dict[str, str]:
+        return {"Authorization": f"Bearer {self.api_key}"}
+
+    async def generate(self, request: LLMRequest) -> str:
+        response = await http_clients.get("openai").post(
+            f"{self.base_url}/chat/completions", json=self.payload(request), headers=self._headers()
+        )
+        response.raise_for_status()
+        choices = response.json().get("choices") or [{}]
+        text = (choices[0].get("message") or {}).get("content") or ""
+        if not text:
+            raise LLMProviderError("No response from OpenAI")
+        return text
+
+    async def stream(self, request: LLMRequest) -> AsyncIterator[str]:
+        async with http_clients.get("openai").stream(
+            "POST",
+            f"{self.base_url}/chat/completions",
+            json=self.payload(request, stream=True),
+            headers=self._headers(),
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:") or line[5:].strip() == "[DONE]":
+                    continue
+                choices = json.loads(line[5:]).get("choices") or [{}]
+                text = (choices[0].get("delta") or {}).get("content")
+                if text:
+                    yield text
+
+
+class LocalProvider(LLMProvider):
+    """Offline stand-in that restates the prompt context; for development and tests."""
+
+    name = "local"
+
+    def __init__(self, delay: float = 0.0) -> None:
+        self.delay = delay
+
+    def _answer(self, request: LLMRequest) -> str:
+        return "Berikut materi yang relevan dengan pertanyaanmu:\n\n" + request.prompt
+
+    async def generate(self, request: LLMRequest) -> str:
+        await asyncio.sleep(self.delay)
+        return self._answer(request)
+
+    async def stream(self, request: LLMRequest) -> AsyncIterator[str]:
+        await asyncio.sleep(self.delay)
+        for line in self._answer(request).splitlines(keepends=True):
+            yield line
+
+
+PROVIDERS: dict[str, Callable[[], LLMProvider]] = {
+    "gemini": lambda: GeminiProvider(model=settings.gemini_model),
+    "openai": lambda: OpenAIProvider(
+        model=settings.openai_chat_model, base_url=settings.openai_base_url
+    ),
+    "local": LocalProvider,
+}
+
+
+class LatencyTracker:
+    """Sliding window of recent latencies (seconds) with nearest-rank percentiles."""
+
+    def __init__(self, window: int = 200) -> None:
+        self._samples: deque[float] = deque(maxlen=window)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, q: float) -> float | None:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: ``closed`` -> ``open`` -> one ``half_open`` trial.
+
+    After ``failure_threshold`` failures in a row the provider is skipped for
+    ``reset_timeout`` seconds; then a single trial call is let through, which
+    closes the breaker on success and re-opens it on failure.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if self._trial_in_flight or self._clock() >= self._opened_at + self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        """Whether a call may start now; claims the trial slot when half-open."""
+
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self._trial_in_flight or self._failures >= self.failure_threshold:
+            self._opened_at = self._clock()
+        self._trial_in_flight = False
+
+    def record_abandoned(self) -> None:
+        """A call was cancelled (e.g. lost a hedge) before it could succeed or fail."""
+
+        self._trial_in_flight = False
+
+
+class _ProviderState:
+    def __init__(self, provider: LLMProvider, breaker: CircuitBreaker) -> None:
+        self.provider = provider
+        self.breaker = breaker
+        self.latency = LatencyTracker()  # full response, for ``generate``
+        self.first_token = LatencyTracker()  # time to first delta, for ``stream``
+        self.successes = 0
+        self.failures = 0
+        self.hedges = 0
+        self.wins = 0
+
+    def as_dict(self) -> dict[str, Any]:
+        def ms(value: float | None) -> float | None:
+            return None if value is None else round(value * 1000, 1)
+
+        return {
+            "state": self.breaker.state,
+            "successes": self.successes,
+            "failures": self.failures,
+            "hedges": self.hedges,
+            "wins": self.wins,
+            "p50_ms": ms(self.latency.percentile(50)),
+            "p95_ms": ms(self.latency.percentile(95)),
+            "first_token_p50_ms": ms(self.first_token.percentile(50)),
+            "first_token_p95_ms": ms(self.first_token.percentile(95)),
+        }
+
+
+@dataclass(slots=True)
+class _Attempt:
+    state: _ProviderState
+    started: float
+    hedge: bool
+    deltas: AsyncIterator[str] | None = None
+
+
+class LLMGateway:
+    """Routes generation across providers in preference order.
+
+    A request goes to the first provider whose circuit breaker admits it. If
+    that provider has not answered (or, when streaming, produced its first
+    delta) by its own recent p95 latency, the next provider is started as a
+    hedge and whichever finishes first wins; the loser is cancelled. A failed
+    attempt fails over to the next provider. :class:`AllProvidersFailed` is
+    raised when nothing is left to try.
+    """
+
+    def __init__(
+        self,
+        providers: Sequence[LLMProvider],
+        *,
+        timeout: float = 30.0,
+        hedging: bool = True,
+        hedge_default_delay: float = 3.0,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.timeout = timeout
+        self.hedging = hedging
+        self.hedge_default_delay = hedge_default_delay
+        self._clock = clock
+        self._states = [
+            _ProviderState(provider, CircuitBreaker(failure_threshold, reset_timeout, clock))
+            for provider in providers
+        ]
+
+    @classmethod
+    def from_settings(cls) -> "LLMGateway":
+        names = [name.strip() for name in settings.llm_providers.split(",") if name.strip()]
+        unknown = [name for name in names if name not in PROVIDERS]
+        if unknown:
+            raise ValueError(f"Unknown LLM provider(s): {', '.join(unknown)}")
+        return cls(
+            [PROVIDERS[name]() for name in names],
+            timeout=settings.llm_timeout_seconds,
+            hedging=settings.llm_hedging_enabled,
+            hedge_default_delay=settings.llm_hedge_default_seconds,
+            failure_threshold=settings.llm_breaker_failure_threshold,
+            reset_timeout=settings.llm_breaker_reset_seconds,
+        )
+
+    @property
+    def configured(self) -> bool:
+        return any(state.provider.configured for state in self._states)
+
+    def stats(self) -> dict[str, dict[str, Any]]:
+        return {state.provider.name: state.as_dict() for state in self._states}
+
+    def _hedge_delay(self, tracker: LatencyTracker) -> float | None:
+        if not self.hedging:
+            return None
+        if len(tracker) < _MIN_HEDGE_SAMPLES:
+            return self.hedge_default_delay
+        return tracker.percentile(95)
+
+    def _next_state(self, tried: set[int]) -> _ProviderState | None:
+        for position, state in enumerate(self._states):
+            if position in tried or not state.provider.configured:
+                continue
+            tried.add(position)
+            if state.breaker.allow():
+                return state
+        return None
+
+    async def _race(
+        self,
+        start: Callable[[_Attempt], Coroutine[Any, Any, _T]],
+        tracker: Callable[[_ProviderState], LatencyTracker],
+    ) -> tuple[_Attempt, _T]:
+        """Run ``start`` against providers with hedging and failover; return the winner."""
+
+        tried: set[int] = set()
+        pending: dict[asyncio.Task[_T], _Attempt] = {}
+        errors: list[tuple[str, BaseException]] = []
+        hedged = False
+
+        def launch(hedge: bool) -> bool:
+            state = self._next_state(tried)
+            if state is None:
+                return False
+            attempt = _Attempt(state, self._clock(), hedge)
+            state.hedges += hedge
+            pending[asyncio.create_task(start(attempt))] = attempt
+            return True
+
+        launch(hedge=False)
+        try:
+            while pending:
+                delay = None
+                if not hedged and len(pending) == 1:
+                    (first,) = pending.values()
+                    delay = self._hedge_delay(tracker(first.state))
+                    if delay is not None:
+                        delay = max(0.0, first.started + delay - self._clock())
+                done, _ = await asyncio.wait(
+                    pending, timeout=delay, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    hedged = True
+                    launch(hedge=True)
+                    continue
+                for task in done:
+                    attempt = pending.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        attempt.state.wins += attempt.hedge
+                        return attempt, task.result()
+                    attempt.state.failures += 1
+                    attempt.state.breaker.record_failure()
+                    name = attempt.state.provider.name
+                    errors.append((name, error))
+                    logger.warning("LLM provider %s failed: %s", name, describe_error(error))
+                if not pending:
+                    launch(hedge=False)
+            raise AllProvidersFailed(errors)
+        finally:
+            for task, attempt in pending.items():
+                task.cancel()
+                with contextlib.suppress(asyncio.CancelledError, Exception):
+                    await task
+                attempt.state.breaker.record_abandoned()
+                if attempt.deltas is not None:
+                    with contextlib.suppress(Exception):
+                        await attempt.deltas.aclose()  # type: ignore[attr-defined]
+
+    async def generate(self, request: LLMRequest) -> str:
+        async def start(attempt: _Attempt) -> str:
+            async with asyncio.timeout(self.timeout):
+                return await attempt.state.provider.generate(request)
+
+        attempt, text = await self._race(start, lambda state: state.latency)
+        attempt.state.latency.record(self._clock() - attempt.started)
+        attempt.state.successes += 1
+        attempt.state.breaker.record_success()
+        return text
+
+    async def stream(self, request: LLMRequest) -> AsyncIterator[str]:
+        """Yield deltas from the provider that produced a first delta soonest.
+
+        ``timeout`` bounds the wait for the first delta. Hedging and failover only
+        apply until then; a provider that fails later ends the stream with its
+        error, since switching would repeat or contradict text already sent.
+        """
+
+        async def start(attempt: _Attempt) -> str:
+            attempt.deltas = attempt.state.provider.stream(request)
+            async with asyncio.timeout(self.timeout):
+                try:
+                    return await anext(attempt.deltas)
+                except StopAsyncIteration:
+                    raise LLMProviderError(f"Empty stream from {attempt.state.provider.name}")
+
+        attempt, first = await self._race(start, lambda state: state.first_token)
+        state, deltas = attempt.state, attempt.deltas
+        assert deltas is not None
+        state.first_token.record(self._clock() - attempt.started)
+        try:
+            yield first
+            async for delta in deltas:
+                yield delta
+        except (GeneratorExit, asyncio.CancelledError):
+            state.breaker.record_abandoned()
+            raise
+        except Exception:
+            state.failures += 1
+            state.breaker.record_failure()
+            raise
+        else:
+            state.latency.record(self._clock() - attempt.started)
+            state.successes += 1
+            state.breaker.record_success()
+        finally:
+            await deltas.aclose()  # type: ignore[attr-defined]
+
+
+llm_gateway = LLMGateway.from_settings()
+
+
+__all__ = [
+    "AllProvidersFailed",
+    "CircuitBreaker",
+    "GeminiProvider",
+    "LLMGateway",
+    "LLMProvider",
+    "LLMProviderError",
+    "LLMRequest",
+    "LatencyTracker",
+    "LocalProvider",
+    "OpenAIProvider",
+    "PROVIDERS",
+    "describe_error",
+    "llm_gateway",
+]
@@ -0,0 +1,63 @@
+"""Ingest manifest tracking which vectors belong to which source document."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+
+@dataclass(slots=True)
+class DocumentRecord:
+    """Content hash of an ingested document and the vector ids of its chunks."""
+
+    content_hash: str
+    vector_ids: list[int] = field(default_factory=list)
+
+
+@dataclass(slots=True)
+class IngestManifest:
+    """Document hash -> vector ids, plus the id allocator state of the index."""
+
+    documents: dict[str, DocumentRecord] = field(default_factory=dict)
+    next_id: int = 0
+    # Ids removed logically from indexes that cannot delete vectors (HNSW).
+    tombstones: set[int] = field(default_factory=set)
+
+    def allocate(self, count: int) -> list[int]:
+        start = self.next_id
+        self.next_id += count
+        return list(range(start, self.next_id))
+
+    def dump(self, path: Path) -> None:
+        payload = {
+            "next_id": self.next_id,
+            "tombstones": sorted(self.tombstones),
+            "documents": {doc_id: asdict(record) for doc_id, record in self.documents.items()},
+        }
+        path.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    @classmethod
+    def load(cls, path: Path) -> "IngestManifest":
+        payload = json.loads(path.read_text(encoding="utf-8"))
+        return cls(
+            documents={
+                doc_id: DocumentRecord(**record) for doc_id, record in payload["documents"].items()
+            },
+            next_id=payload["next_id"],
+            tombstones=set(payload.get("tombstones", [])),
+        )
+
+
+def content_hash(*parts: str) -> str:
+    """Stable hash of a document's raw content (and anything that affects chunking)."""
+
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+__all__ = ["DocumentRecord", "IngestManifest", "content_hash"]
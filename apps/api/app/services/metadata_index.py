@@ -0,0 +1,125 @@
+"""Inverted indexes from chunk metadata values to vector-id bitmaps."""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Mapping, Sequence
+
+import numpy as np
+
+FILTERABLE_FIELDS = ("kelas", "topik", "level", "tags", "content_id")
+
+# Multi-valued fields are stored comma-joined in chunk metadata.
+_MULTI_VALUED_FIELDS = {"tags"}
+
+MetadataFilter = Mapping[str, str | Sequence[str]]
+
+
+def _field_values(field: str, raw: str | None) -> list[str]:
+    if not raw:
+        return []
+    if field in _MULTI_VALUED_FIELDS:
+        return [value.strip() for value in raw.split(",") if value.strip()]
+    return [raw]
+
+
+class MetadataIndex:
+    """Per-field ``value -> bitmap`` postings over FAISS vector ids.
+
+    Bitmaps use FAISS' ``IDSelectorBitmap`` layout (bit ``i & 7`` of byte ``i >> 3``),
+    so a combined filter can be handed to FAISS without conversion.
+    """
+
+    def __init__(self) -> None:
+        self._postings: dict[str, dict[str, bytearray]] = {field: {} for field in FILTERABLE_FIELDS}
+        self._live = bytearray()
+        self.size = 0
+
+    @staticmethod
+    def _set(bitmap: bytearray, vector_id: int) -> None:
+        byte, bit = divmod(vector_id, 8)
+        if len(bitmap) <= byte:
+            bitmap.extend(b"\x00" * (byte + 1 - len(bitmap)))
+        bitmap[byte] |= 1 << bit
+
+    def add(self, vector_id: int, metadata: Mapping[str, str]) -> None:
+        self.size = max(self.size, vector_id + 1)
+        self._set(self._live, vector_id)
+        for field, postings in self._postings.items():
+            for value in _field_values(field, metadata.get(field)):
+                self._set(postings.setdefault(value, bytearray()), vector_id)
+
+    def remove(self, vector_id: int, metadata: Mapping[str, str]) -> None:
+        byte, bit = divmod(vector_id, 8)
+        if byte < len(self._live):
+            self._live[byte] &= ~(1 << bit) & 0xFF
+        for field, postings in self._postings.items():
+            for value in _field_values(field, metadata.get(field)):
+                bitmap = postings.get(value)
+                if bitmap is not None and byte < len(bitmap):
+                    bitmap[byte] &= ~(1 << bit) & 0xFF
+
+    def values(self, field: str) -> list[str]:
+        return sorted(self._postings[field])
+
+    def select(self, filters: MetadataFilter) -> np.ndarray:
+        """Return the packed bitmap of live ids matching ``filters``.
+
+        Values of one field are OR-ed; different fields are AND-ed. An empty filter
+        selects every live id.
+        """
+
+        n_bytes = (self.size + 7) // 8
+        selected = np.zeros(n_bytes, dtype=np.uint8)
+        selected[: len(self._live)] = np.frombuffer(bytes(self._live), dtype=np.uint8)
+        for field, wanted in filters.items():
+            if field not in self._postings:
+                raise ValueError(
+                    f"Cannot filter on '{field}'. Filterable fields: {', '.join(FILTERABLE_FIELDS)}"
+                )
+            values = [wanted] if isinstance(wanted, str) else list(wanted)
+            field_bits = np.zeros(n_bytes, dtype=np.uint8)
+            for value in values:
+                bitmap = self._postings[field].get(value)
+                if bitmap:
+                    field_bits[: len(bitmap)] |= np.frombuffer(bytes(bitmap), dtype=np.uint8)
+            selected &= field_bits
+        return selected
+
+    @staticmethod
+    def ids(bitmap: np.ndarray) -> np.ndarray:
+        return np.flatnonzero(np.unpackbits(bitmap, bitorder="little")).astype("int64")
+
+    def dump(self, path: Path) -> None:
+        """Write all bitmaps as one ``.npz`` so loading needs no payload decoding."""
+
+        keys = [(field, value) for field, postings in self._postings.items() for value in postings]
+        bitmaps = [self._postings[field][value] for field, value in keys]
+        offsets = np.zeros(len(bitmaps) + 1, dtype=np.int64)
+        np.cumsum([len(bitmap) for bitmap in bitmaps], out=offsets[1:])
+        with path.open("wb") as handle:
+            np.savez(
+                handle,
+                size=np.int64(self.size),
+                live=np.frombuffer(bytes(self._live), dtype=np.uint8),
+                keys=np.array([f"{field}\x1f{value}" for field, value in keys], dtype=str),
+                offsets=offsets,
+                bitmaps=np.frombuffer(b"".join(bitmaps), dtype=np.uint8),
+            )
+
+    @classmethod
+    def load(cls, path: Path) -> "MetadataIndex":
+        index = cls()
+        with np.load(path) as data:
+            index.size = int(data["size"])
+            index._live = bytearray(data["live"].tobytes())
+            offsets, bitmaps = data["offsets"], data["bitmaps"]
+            for position, key in enumerate(data["keys"].tolist()):
+                field, value = key.split("\x1f", 1)
+                start, end = offsets[position], offsets[position + 1]
+                bitmap = bytearray(bitmaps[start:end].tobytes())
+                index._postings.setdefault(field, {})[value] = bitmap
+        return index
+
+
+__all__ = ["FILTERABLE_FIELDS", "MetadataFilter", "MetadataIndex"]
@@ -0,0 +1,152 @@
+"""Offset-indexed, memory-mapped chunk payload store with lazy decoding."""
+
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import struct
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Generic, Iterator, Mapping, MutableMapping, TypeVar
+
+import numpy as np
+
+T = TypeVar("T")
+
+# File layout: header | ids int64[count] (sorted) | offsets int64[count + 1] | records.
+# Every record is the compact UTF-8 JSON object of one payload.
+_MAGIC = b"WPS1"
+_HEADER = struct.Struct("<4sIQ")  # magic, format flags (unused), record count
+
+
+@contextmanager
+def atomic_path(path: Path) -> Iterator[Path]:
+    """Yield a temporary sibling of ``path`` and move it into place on success.
+
+    Readers that memory-mapped the previous file keep a valid mapping of the old
+    inode instead of seeing it truncated underneath them.
+    """
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        yield tmp
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+class PayloadStore(MutableMapping[int, T], Generic[T]):
+    """Payloads by vector id, backed by an optional read-only mapped file.
+
+    Ids and offsets are NumPy views over the mapping and a record is only decoded
+    (via ``factory(**record)``) when it is accessed, so opening a store is O(1) and
+    workers mapping the same file share its pages through the OS page cache.
+    Writes and deletes go to an in-memory overlay until the next :meth:`dump`.
+    """
+
+    def __init__(self, factory: Callable[..., T], path: Path | None = None) -> None:
+        self._factory = factory
+        self._overlay: dict[int, T] = {}
+        # Ids of the mapped file that were deleted or shadowed by the overlay.
+        self._hidden: set[int] = set()
+        self._buffer: mmap.mmap | None = None
+        self._ids = np.empty(0, dtype="<i8")
+        self._offsets = np.zeros(1, dtype="<i8")
+        self._data_start = 0
+        if path is not None:
+            self._open(path)
+
+    def _open(self, path: Path) -> None:
+        with path.open("rb") as handle:
+            self._buffer = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, _, count = _HEADER.unpack_from(self._buffer)
+        if magic != _MAGIC:
+            raise ValueError(f"{path} is not a payload store")
+        self._ids = np.frombuffer(self._buffer, dtype="<i8", count=count, offset=_HEADER.size)
+        self._offsets = np.frombuffer(
+            self._buffer, dtype="<i8", count=count + 1, offset=_HEADER.size + 8 * count
+        )
+        self._data_start = _HEADER.size + 8 * (2 * count + 1)
+
+    @property
+    def mapped(self) -> bool:
+        return self._buffer is not None
+
+    def _position(self, vector_id: int) -> int:
+        position = int(np.searchsorted(self._ids, vector_id))
+        if position < len(self._ids) and self._ids[position] == vector_id:
+            return position
+        return -1
+
+    def _raw(self, position: int) -> bytes:
+        assert self._buffer is not None
+        start, end = self._offsets[position : position + 2] + self._data_start
+        return self._buffer[start:end]
+
+    def __getitem__(self, vector_id: int) -> T:
+        if vector_id in self._overlay:
+            return self._overlay[vector_id]
+        if vector_id in self._hidden:
+            raise KeyError(vector_id)
+        position = self._position(vector_id)
+        if position < 0:
+            raise KeyError(vector_id)
+        return self._factory(**json.loads(self._raw(position)))
+
+    def __setitem__(self, vector_id: int, value: T) -> None:
+        if self._position(vector_id) >= 0:
+            self._hidden.add(vector_id)
+        self._overlay[vector_id] = value
+
+    def __delitem__(self, vector_id: int) -> None:
+        if vector_id in self._overlay:
+            del self._overlay[vector_id]
+        elif vector_id not in self._hidden and self._position(vector_id) >= 0:
+            self._hidden.add(vector_id)
+        else:
+            raise KeyError(vector_id)
+
+    def __contains__(self, vector_id: object) -> bool:
+        if vector_id in self._overlay:
+            return True
+        return (
+            isinstance(vector_id, (int, np.integer))
+            and vector_id not in self._hidden
+            and self._position(int(vector_id)) >= 0
+        )
+
+    def __iter__(self) -> Iterator[int]:
+        for vector_id in self._ids.tolist():
+            if vector_id not in self._hidden:
+                yield vector_id
+        yield from self._overlay
+
+    def __len__(self) -> int:
+        return len(self._ids) - len(self._hidden) + len(self._overlay)
+
+    def dump(self, path: Path, encode: Callable[[T], Mapping[str, Any]]) -> None:
+        """Write every live payload to ``path``; unchanged mapped records are copied raw."""
+
+        records: list[tuple[int, bytes]] = [
+            (vector_id, self._raw(position))
+            for position, vector_id in enumerate(self._ids.tolist())
+            if vector_id not in self._hidden
+        ]
+        for vector_id, value in self._overlay.items():
+            record = json.dumps(encode(value), ensure_ascii=False, separators=(",", ":"))
+            records.append((vector_id, record.encode()))
+        records.sort(key=lambda record: record[0])
+        ids = np.fromiter((vector_id for vector_id, _ in records), dtype="<i8", count=len(records))
+        offsets = np.zeros(len(records) + 1, dtype="<i8")
+        np.cumsum([len(raw) for _, raw in records], out=offsets[1:])
+        with atomic_path(path) as tmp, tmp.open("wb") as handle:
+            handle.write(_HEADER.pack(_MAGIC, 0, len(records)))
+            handle.write(ids.tobytes())
+            handle.write(offsets.tobytes())
+            for _, raw in records:
+                handle.write(raw)
+
+
+__all__ = ["PayloadStore", "atomic_path"]
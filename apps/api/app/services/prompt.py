@@ -0,0 +1,165 @@
+"""Token-budgeted assembly of retrieved context for LLM prompts."""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Sequence
+
+from app.services.chunking import HEADING_SEPARATOR, count_tokens
+
+if TYPE_CHECKING:  # pragma: no cover
+    from app.services.rag import RetrievedChunk
+
+_FENCE = re.compile(r"^\s*(```|~~~)")
+_HEADING = re.compile(r"^#{1,6}\s")
+_BLOCK_LINE = re.compile(r"^\s*([-*+]\s|\d+[.)]\s|\|)")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_WORD = re.compile(r"\w+")
+
+# Query words shorter than this (``di``, ``itu``, ``a``) carry no topical signal.
+_MIN_TERM_LENGTH = 3
+
+
+@dataclass(slots=True)
+class _Unit:
+    """A sentence, heading, list item, table row or whole code block of one chunk."""
+
+    position: int
+    text: str
+    tokens: int
+    relevance: float
+    inline: bool  # prose sentences are rejoined on one line
+
+
+@dataclass(slots=True)
+class PromptContext:
+    """Context block for a prompt plus what it took to fit the budget."""
+
+    text: str
+    tokens: int
+    chunks_used: int
+    units_dropped: int
+
+
+def _terms(text: str) -> set[str]:
+    return {word for word in _WORD.findall(text.lower()) if len(word) >= _MIN_TERM_LENGTH}
+
+
+def _normalise(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def _segments(text: str, skip_headings: bool) -> list[tuple[str, bool]]:
+    """Split markdown into ``(text, inline)`` units; fenced code is never split."""
+
+    segments: list[tuple[str, bool]] = []
+    paragraph: list[str] = []
+    fence: list[str] | None = None
+
+    def flush() -> None:
+        if paragraph:
+            prose = " ".join(line.strip() for line in paragraph)
+            segments.extend((sentence, True) for sentence in _SENTENCE_END.split(prose) if sentence)
+            paragraph.clear()
+
+    for line in text.splitlines():
+        if fence is not None:
+            fence.append(line)
+            if _FENCE.match(line):
+                segments.append(("\n".join(fence), False))
+                fence = None
+        elif _FENCE.match(line):
+            flush()
+            fence = [line]
+        elif not line.strip():
+            flush()
+        elif _HEADING.match(line):
+            flush()
+            if not skip_headings:
+                segments.append((line.strip(), False))
+        elif _BLOCK_LINE.match(line):
+            flush()
+            segments.append((line.rstrip(), False))
+        else:
+            paragraph.append(line)
+    flush()
+    if fence is not None:  # unterminated fence at the end of a chunk
+        segments.append(("\n".join(fence), False))
+    return segments
+
+
+def _label(index: int, metadata: dict[str, str]) -> str:
+    # Topic and heading path tell the model where a passage comes from; ids,
+    # ordinals, token counts and filter fields are retrieval bookkeeping.
+    parts = [part for part in (metadata.get("topik", ""), metadata.get("headings", "")) if part]
+    source = HEADING_SEPARATOR.join(parts)
+    return f"[{index}] {source}" if source else f"[{index}]"
+
+
+def build_context(query: str, chunks: Sequence[RetrievedChunk], token_budget: int) -> PromptContext:
+    """Render ``chunks`` (best first) into at most ``token_budget`` tokens of context.
+
+    Sentences, list items and code blocks already emitted by a higher-ranked
+    chunk are skipped, which removes the overlap the chunker adds between
+    neighbours as well as duplicate hits. Each chunk gets an even share of the
+    remaining budget (unused share rolls over to the next one); a chunk that
+    does not fit keeps its most query-relevant units, in their original order.
+    """
+
+    query_terms = _terms(query)
+    seen: set[str] = set()
+    candidates: list[tuple[RetrievedChunk, list[_Unit]]] = []
+    for chunk in chunks:
+        units: list[_Unit] = []
+        segments = _segments(chunk.text, "headings" in chunk.metadata)
+        for position, (text, inline) in enumerate(segments):
+            key = _normalise(text)
+            if key in seen:
+                continue
+            seen.add(key)
+            terms = _terms(text)
+            relevance = len(terms & query_terms) / (len(terms) ** 0.5) if terms else 0.0
+            units.append(_Unit(position, text, count_tokens(text), relevance, inline))
+        if units:
+            candidates.append((chunk, units))
+
+    blocks: list[str] = []
+    used = 0
+    dropped = 0
+    for rank, (chunk, units) in enumerate(candidates):
+        label = _label(len(blocks) + 1, chunk.metadata)
+        share = (token_budget - used) // (len(candidates) - rank) - count_tokens(label)
+        if sum(unit.tokens for unit in units) <= share:
+            kept = units
+        else:
+            kept = []
+            remaining = share
+            for unit in sorted(units, key=lambda unit: (-unit.relevance, unit.position)):
+                if unit.relevance <= 0 and kept:
+                    break
+                if unit.tokens <= remaining:
+                    kept.append(unit)
+                    remaining -= unit.tokens
+            kept.sort(key=lambda unit: unit.position)
+        dropped += len(units) - len(kept)
+        if not kept:
+            continue
+
+        lines = [label]
+        for previous, unit in zip([None, *kept], kept):
+            if unit.inline and previous is not None and previous.inline:
+                lines[-1] += " " + unit.text
+            else:
+                lines.append(unit.text)
+        block = "\n".join(lines)
+        blocks.append(block)
+        used += count_tokens(block)
+
+    text = "\n\n".join(blocks)
+    return PromptContext(
+        text=text, tokens=count_tokens(text), chunks_used=len(blocks), units_dropped=dropped
+    )
+
+
+__all__ = ["PromptContext", "build_context"]
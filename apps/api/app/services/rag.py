@@ -2,18 +2,63 @@
 
 from __future__ import annotations
 
-import hashlib
-import httpx
+import asyncio
 import json
-from dataclasses import dataclass
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import asdict, dataclass
 from pathlib import Path
-from typing import Iterable, Sequence
+from typing import Any, AsyncIterator, Iterable, Sequence
 
 import faiss
+import httpx
 import numpy as np
-from openai import OpenAI
 
+from app.celery_app import celery_app
 from app.core.config import settings
+from app.services.embedding_cache import EmbeddingCache
+from app.services.embeddings import Embedder, get_openai_client
+from app.services.lexical import BM25Index, reciprocal_rank_fusion
+from app.services.llm_gateway import (
+    AllProvidersFailed,
+    LLMGateway,
+    LLMProviderError,
+    LLMRequest,
+    describe_error,
+    llm_gateway,
+)
+from app.services.manifest import DocumentRecord, IngestManifest
+from app.services.metadata_index import MetadataFilter, MetadataIndex
+from app.services.payload_store import PayloadStore, atomic_path
+from app.services.prompt import build_context
+from app.services.rerank import CosineReRanker, ReRanker, get_reranker
+from app.services.vector_index import (
+    IndexSpec,
+    apply_search_params,
+    build_index,
+    ensure_id_mapped,
+    is_id_mapped,
+    is_outgrown,
+    search_parameters,
+    stores_exact_vectors,
+)
+
+# Filtered selections up to this size are scored exactly instead of via the ANN index.
+_EXACT_SCAN_LIMIT = 4096
+# Candidates pulled from each retriever before reciprocal-rank fusion.
+_HYBRID_MIN_CANDIDATES = 20
+
+RETRIEVAL_MODES = ("vector", "hybrid")
+
+logger = logging.getLogger(__name__)
+
+# Runs the lexical search alongside the embedding call and FAISS search.
+_lexical_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="bm25")
+# Bounded pool for FAISS searches and re-ranking issued from async code; FAISS
+# releases the GIL, so these overlap with the event loop and with each other.
+_search_pool = ThreadPoolExecutor(
+    max_workers=settings.rag_search_threads, thread_name_prefix="faiss"
+)
 
 
 @dataclass(slots=True)
@@ -24,6 +69,7 @@ class RetrievedChunk:
     text: str
     metadata: dict[str, str]
     score: float
+    vector_id: int = -1
 
 
 @dataclass(slots=True)
@@ -38,148 +84,581 @@ class ChunkPayload:
 class RagService:
     """Simple FAISS-backed retriever with a hookable re-ranker."""
 
-    def __init__(self, dimension: int = 384) -> None:
+    def __init__(
+        self,
+        dimension: int = 384,
+        embedder: Embedder | None = None,
+        reranker: ReRanker | str | None = None,
+        index_spec: IndexSpec | None = None,
+        retrieval_mode: str | None = None,
+        llm: LLMGateway | None = None,
+    ) -> None:
         self.dimension = dimension
-        self._index = faiss.IndexFlatIP(self.dimension)
-        self._chunks: list[ChunkPayload] = []
-
-    @staticmethod
-    def _embed(text: str, dimension: int) -> np.ndarray:
-        if settings.openai_api_key:
-            client = OpenAI(api_key=settings.openai_api_key)
-            response = client.embeddings.create(
-                input=text,
-                model="text-embedding-3-small"
+        self.llm = llm or llm_gateway
+        self.retrieval_mode = retrieval_mode or settings.rag_retrieval_mode
+        if self.retrieval_mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode '{self.retrieval_mode}'")
+        self.index_spec = index_spec or IndexSpec.from_settings()
+        # Trainable (IVF) indexes are built on the first ingest batch and
+        # retrained as the corpus outgrows it.
+        self._index: faiss.Index | None = (
+            None if self.index_spec.needs_training else build_index(self.index_spec, dimension)
+        )
+        # True while ``_index`` views a memory-mapped file and must not be mutated.
+        self._index_mapped = False
+        self._chunks: PayloadStore[ChunkPayload] = PayloadStore(ChunkPayload)
+        self._manifest = IngestManifest()
+        self._metadata = MetadataIndex()
+        self._lexical = BM25Index()
+        # Set while a dumped BM25 index is still being parsed in the background.
+        self._lexical_loading: Future[BM25Index] | None = None
+        self._embedder = embedder or Embedder(
+            dimension,
+            cache=EmbeddingCache(settings.embedding_cache_size, settings.embedding_cache_path),
+        )
+        reranker = reranker or settings.rag_reranker
+        self._reranker = get_reranker(reranker) if isinstance(reranker, str) else reranker
+
+    @property
+    def embedder(self) -> Embedder:
+        return self._embedder
+
+    def _embed(self, text: str) -> np.ndarray:
+        return self._embedder.embed_one(text)
+
+    def _lexical_index(self) -> BM25Index:
+        if self._lexical_loading is not None:
+            self._lexical = self._lexical_loading.result()
+            self._lexical_loading = None
+        return self._lexical
+
+    def _writable_index(self) -> faiss.Index | None:
+        """Return the index for mutation, copying a memory-mapped one into owned memory."""
+
+        if self._index is not None and self._index_mapped:
+            # FAISS aborts the process when a mapped vector store is resized.
+            self._index = faiss.deserialize_index(faiss.serialize_index(self._index))
+            apply_search_params(self._index, self.index_spec)
+            self._index_mapped = False
+        return self._index
+
+    def index(
+        self, payloads: Iterable[ChunkPayload], vectors: np.ndarray | None = None
+    ) -> list[int]:
+        """Embed chunks in batches and add them to the FAISS index.
+
+        ``vectors`` may carry embeddings computed elsewhere (e.g. by the async ingest
+        pipeline). Returns the vector ids assigned to the chunks.
+        """
+
+        batch = list(payloads)
+        if not batch:
+            return []
+        if vectors is None:
+            vectors = self._embedder.embed([payload.text for payload in batch])
+        index = self._writable_index()
+        if index is None:
+            index = self._index = build_index(self.index_spec, self.dimension, training=vectors)
+        ids = self._manifest.allocate(len(batch))
+        index.add_with_ids(vectors, np.asarray(ids, dtype="int64"))
+        for vector_id, payload in zip(ids, batch):
+            self._metadata.add(vector_id, payload.metadata)
+            self._lexical_index().add(vector_id, payload.text)
+            self._chunks[vector_id] = payload
+        if is_outgrown(index, self.index_spec, index.ntotal):
+            self._retrain()
+        return ids
+
+    def _retrain(self) -> None:
+        """Rebuild the trainable index on every live vector (see ``is_outgrown``)."""
+
+        index = self._index
+        assert index is not None
+        ids = np.fromiter(self._chunks, dtype="int64")
+        if stores_exact_vectors(index):
+            vectors = index.reconstruct_batch(ids)
+        else:  # PQ codes only approximate the vectors; train on the embeddings again
+            vectors = self._embedder.embed([self._chunks[int(vector_id)].text for vector_id in ids])
+        rebuilt = build_index(self.index_spec, self.dimension, training=vectors)
+        rebuilt.add_with_ids(vectors, ids)
+        logger.info("Retrained %s index on %d vectors", self.index_spec.kind, len(ids))
+        self._index = rebuilt
+
+    @property
+    def index_version(self) -> str:
+        """Changes on every add or remove, and matches across processes loading one dump."""
+
+        # next_id only grows on adds and the live count only shrinks on removes.
+        return f"{self._manifest.next_id}-{len(self._chunks)}"
+
+    @property
+    def documents(self) -> dict[str, DocumentRecord]:
+        return self._manifest.documents
+
+    def is_current(self, doc_id: str, content_hash: str) -> bool:
+        record = self._manifest.documents.get(doc_id)
+        return record is not None and record.content_hash == content_hash
+
+    def upsert_document(
+        self,
+        doc_id: str,
+        content_hash: str,
+        payloads: Iterable[ChunkPayload],
+        vectors: np.ndarray | None = None,
+    ) -> bool:
+        """Idempotently (re)index one source document.
+
+        Returns ``False`` without embedding anything when ``content_hash`` matches the
+        manifest; otherwise the document's previous vectors are replaced.
+        """
+
+        if self.is_current(doc_id, content_hash):
+            return False
+        self.remove_document(doc_id)
+        vector_ids = self.index(payloads, vectors)
+        self._manifest.documents[doc_id] = DocumentRecord(content_hash, vector_ids)
+        return True
+
+    def remove_document(self, doc_id: str) -> bool:
+        record = self._manifest.documents.pop(doc_id, None)
+        if record is None:
+            return False
+        self.remove(record.vector_ids)
+        return True
+
+    def remove(self, vector_ids: Sequence[int]) -> None:
+        """Delete vectors by id from FAISS, the metadata postings and BM25."""
+
+        live = [vector_id for vector_id in vector_ids if vector_id in self._chunks]
+        index = self._writable_index() if live else None
+        if index is None:
+            return
+        ids = np.asarray(live, dtype="int64")
+        try:
+            index.remove_ids(faiss.IDSelectorArray(ids))
+        except RuntimeError:
+            # HNSW graphs cannot delete; searches mask these ids out instead.
+            self._manifest.tombstones.update(live)
+        for vector_id in live:
+            payload = self._chunks.pop(vector_id)
+            self._metadata.remove(vector_id, payload.metadata)
+            self._lexical_index().remove(vector_id, payload.text)
+
+    def set_search_params(self, nprobe: int | None = None, ef_search: int | None = None) -> None:
+        """Tune the recall/latency trade-off of IVF (``nprobe``) or HNSW (``efSearch``)."""
+
+        if nprobe is not None:
+            self.index_spec.nprobe = nprobe
+        if ef_search is not None:
+            self.index_spec.ef_search = ef_search
+        if self._index is not None:
+            apply_search_params(self._index, self.index_spec)
+
+    def retrieve(
+        self, query: str, top_k: int = 5, filters: MetadataFilter | None = None
+    ) -> list[RetrievedChunk]:
+        """Return the ``top_k`` chunks for ``query``, optionally restricted by metadata.
+
+        ``filters`` maps a field in ``FILTERABLE_FIELDS`` to one value or a list of
+        accepted values; the restriction is applied inside the search, not after it.
+        """
+
+        if not self._chunks or self._index is None:
+            return []
+        depth, bitmap = self._plan(top_k, filters)
+        lexical_future = None
+        if self.retrieval_mode == "hybrid":
+            lexical_future = _lexical_pool.submit(self._lexical_search, query, depth, bitmap)
+        query_vec = self._embed(query)
+        dense = self._search(query_vec, depth, bitmap)
+        lexical = lexical_future.result() if lexical_future is not None else None
+        results = self._collect(self._fuse(dense, lexical, top_k))
+        if self._keeps_fused_order(lexical):
+            return results
+        return self.re_rank(query, results, query_vector=query_vec)
+
+    async def aretrieve(
+        self, query: str, top_k: int = 5, filters: MetadataFilter | None = None
+    ) -> list[RetrievedChunk]:
+        """Async :meth:`retrieve` that never blocks the event loop.
+
+        The query is embedded through the async OpenAI client while BM25 runs in
+        its thread pool; FAISS search and re-ranking (which release the GIL) run
+        in the bounded ``_search_pool``.
+        """
+
+        if not self._chunks or self._index is None:
+            return []
+        loop = asyncio.get_running_loop()
+        depth, bitmap = self._plan(top_k, filters)
+        lexical_future = None
+        if self.retrieval_mode == "hybrid":
+            lexical_future = loop.run_in_executor(
+                _lexical_pool, self._lexical_search, query, depth, bitmap
             )
-            return np.array(response.data[0].embedding, dtype="float32")
-        else:
-            # Fallback to dummy hash
-            tokens = text.lower().split()
-            vector = np.zeros(dimension, dtype="float32")
-            for token in tokens:
-                token_hash = hashlib.sha256(token.encode("utf-8")).hexdigest()
-                index = int(token_hash[:8], 16) % dimension
-                vector[index] += 1
-            return vector / np.linalg.norm(vector) if np.linalg.norm(vector) > 0 else vector
-
-    def index(self, payloads: Iterable[ChunkPayload]) -> None:
-        """Add chunks to the FAISS index."""
-
-        vectors = []
-        for payload in payloads:
-            embedding = self._embed(payload.text, self.dimension)
-            vectors.append(embedding)
-            self._chunks.append(payload)
-        if vectors:
-            stacked = np.vstack(vectors)
-            self._index.add(stacked)
-
-    def retrieve(self, query: str, top_k: int = 5) -> list[RetrievedChunk]:
-        if not self._chunks:
+        query_vec = await self._embedder.aembed_one(query)
+        dense = await loop.run_in_executor(_search_pool, self._search, query_vec, depth, bitmap)
+        lexical = await lexical_future if lexical_future is not None else None
+        results = self._collect(self._fuse(dense, lexical, top_k))
+        if self._keeps_fused_order(lexical):
+            return results
+        return await self.are_rank(query, results, query_vector=query_vec)
+
+    async def arescore(
+        self, query: str, vector_ids: Iterable[int], filters: MetadataFilter | None = None
+    ) -> list[RetrievedChunk]:
+        """Score already-known chunks (e.g. a conversation's earlier hits) against ``query``.
+
+        Costs one query embedding and a vector reconstruct instead of a search.
+        Ids that were removed since, or fall outside ``filters``, are skipped.
+        Returns the chunks best first, scored by cosine similarity.
+        """
+
+        unique_ids = dict.fromkeys(vector_ids)
+        candidates = [vector_id for vector_id in unique_ids if vector_id in self._chunks]
+        if candidates and filters:
+            allowed = set(MetadataIndex.ids(self._metadata.select(filters)).tolist())
+            candidates = [vector_id for vector_id in candidates if vector_id in allowed]
+        if not candidates:
             return []
-        query_vec = self._embed(query, self.dimension)[np.newaxis, :]
-        scores, indices = self._index.search(query_vec, min(top_k, len(self._chunks)))
+        chunks = self._collect([(0.0, vector_id) for vector_id in candidates])
+        query_vec = await self._embedder.aembed_one(query)
+        vectors = await asyncio.get_running_loop().run_in_executor(
+            _search_pool, self._stored_vectors, chunks
+        )
+        if vectors is None:
+            vectors = await self._embedder.aembed([chunk.text for chunk in chunks])
+        for chunk, score in zip(chunks, vectors @ query_vec):
+            chunk.score = float(score)
+        return sorted(chunks, key=lambda chunk: -chunk.score)
+
+    async def aretrieve_followup(
+        self,
+        query: str,
+        earlier_ids: Sequence[int],
+        top_k: int = 3,
+        filters: MetadataFilter | None = None,
+        reuse_threshold: float | None = None,
+    ) -> list[RetrievedChunk]:
+        """Answer a follow-up from a conversation's earlier chunks when they still fit.
+
+        Earlier chunks scoring at least ``reuse_threshold`` are returned without a
+        search; when none does (the student changed topic) this is :meth:`aretrieve`.
+        """
+
+        threshold = reuse_threshold
+        if threshold is None:
+            threshold = settings.conversation_reuse_threshold
+        if earlier_ids:
+            earlier = await self.arescore(query, earlier_ids, filters)
+            reusable = [chunk for chunk in earlier if chunk.score >= threshold]
+            if reusable:
+                return reusable[:top_k]
+        return await self.aretrieve(query, top_k=top_k, filters=filters)
+
+    def _plan(self, top_k: int, filters: MetadataFilter | None) -> tuple[int, np.ndarray | None]:
+        """Candidate depth per retriever and the id bitmap to search within (if any)."""
+
+        bitmap = None
+        if filters or self._manifest.tombstones:
+            bitmap = self._metadata.select(filters or {})
+        if self.retrieval_mode == "hybrid":
+            return min(max(top_k * 4, _HYBRID_MIN_CANDIDATES), len(self._chunks)), bitmap
+        return top_k, bitmap
+
+    def _lexical_search(
+        self, query: str, depth: int, bitmap: np.ndarray | None
+    ) -> list[tuple[float, int]]:
+        allowed = None
+        if bitmap is not None:
+            allowed = np.unpackbits(bitmap, bitorder="little").astype(bool)
+        return self._lexical_index().search(query, depth, allowed)
+
+    @staticmethod
+    def _fuse(
+        dense: list[tuple[float, int]], lexical: list[tuple[float, int]] | None, top_k: int
+    ) -> list[tuple[float, int]]:
+        if lexical is None:
+            return dense
+        rankings = [[idx for _, idx in dense], [idx for _, idx in lexical]]
+        return reciprocal_rank_fusion(rankings)[:top_k]
+
+    def _keeps_fused_order(self, lexical: list[tuple[float, int]] | None) -> bool:
+        """Whether fused results skip re-ranking.
+
+        The cosine re-rank sorts by vector similarity alone, which would discard
+        BM25's share of the fused order; the dense ranking is already part of it.
+        """
+
+        return lexical is not None and self._reranker.name == CosineReRanker.name
+
+    def _collect(self, hits: list[tuple[float, int]]) -> list[RetrievedChunk]:
         results: list[RetrievedChunk] = []
-        for score, idx in zip(scores[0], indices[0]):
-            if idx == -1:
-                continue
+        for score, idx in hits:
             payload = self._chunks[idx]
             results.append(
                 RetrievedChunk(
                     chunk_id=payload.chunk_id,
                     text=payload.text,
                     metadata=payload.metadata,
-                    score=float(score),
+                    score=score,
+                    vector_id=idx,
                 )
             )
-        return self.re_rank(query, results)
+        return results
+
+    def _search(
+        self, query_vec: np.ndarray, top_k: int, bitmap: np.ndarray | None
+    ) -> list[tuple[float, int]]:
+        assert self._index is not None
+        if bitmap is None:
+            k = min(top_k, len(self._chunks))
+            scores, indices = self._index.search(query_vec[np.newaxis, :], k)
+            hits = zip(scores[0], indices[0])
+            return [(float(score), int(idx)) for score, idx in hits if idx != -1]
+
+        ids = MetadataIndex.ids(bitmap)
+        if not len(ids):
+            return []
+        k = min(top_k, len(ids))
+        if len(ids) <= _EXACT_SCAN_LIMIT:
+            # Small selections are scored exactly; ANN graphs/lists degrade on tight filters.
+            try:
+                scores = self._index.reconstruct_batch(ids) @ query_vec
+                best = np.argsort(-scores, kind="stable")[:k]
+                return [(float(scores[i]), int(ids[i])) for i in best]
+            except RuntimeError:
+                pass
+        selector = faiss.IDSelectorBitmap(len(bitmap), faiss.swig_ptr(bitmap))
+        params = search_parameters(self._index, self.index_spec, selector)
+        scores, indices = self._index.search(query_vec[np.newaxis, :], k, params=params)
+        return [(float(score), int(idx)) for score, idx in zip(scores[0], indices[0]) if idx != -1]
+
+    def re_rank(
+        self,
+        query: str,
+        chunks: Sequence[RetrievedChunk],
+        query_vector: np.ndarray | None = None,
+    ) -> list[RetrievedChunk]:
+        """Re-order candidates with the configured strategy using their stored vectors."""
 
-    def re_rank(self, query: str, chunks: Sequence[RetrievedChunk]) -> list[RetrievedChunk]:
-        """Simple re-ranking hook using cosine similarity fallback."""
+        if not chunks:
+            return []
+        if query_vector is None:
+            query_vector = self._embed(query)
+        vectors = self._stored_vectors(chunks)
+        if vectors is None:
+            vectors = self._embedder.embed([chunk.text for chunk in chunks])
+        return self._apply_reranker(query, chunks, query_vector, vectors)
+
+    async def are_rank(
+        self,
+        query: str,
+        chunks: Sequence[RetrievedChunk],
+        query_vector: np.ndarray | None = None,
+    ) -> list[RetrievedChunk]:
+        """Async :meth:`re_rank`; only unknown chunks are embedded, over the async client."""
 
         if not chunks:
             return []
-        query_vec = self._embed(query, self.dimension)
-        scored = []
-        for chunk in chunks:
-            chunk_vec = self._embed(chunk.text, self.dimension)
-            rerank_score = float(np.dot(query_vec, chunk_vec))
-            scored.append((rerank_score, chunk))
-        scored.sort(key=lambda item: item[0], reverse=True)
-        return [chunk for _, chunk in scored]
+        loop = asyncio.get_running_loop()
+        if query_vector is None:
+            query_vector = await self._embedder.aembed_one(query)
+        vectors = await loop.run_in_executor(_search_pool, self._stored_vectors, chunks)
+        if vectors is None:
+            vectors = await self._embedder.aembed([chunk.text for chunk in chunks])
+        return await loop.run_in_executor(
+            _search_pool, self._apply_reranker, query, chunks, query_vector, vectors
+        )
+
+    def _apply_reranker(
+        self,
+        query: str,
+        chunks: Sequence[RetrievedChunk],
+        query_vector: np.ndarray,
+        vectors: np.ndarray,
+    ) -> list[RetrievedChunk]:
+        texts = [chunk.text for chunk in chunks]
+        order = self._reranker.rerank(query, query_vector, vectors, texts)
+        return [chunks[position] for position in order]
+
+    def _stored_vectors(self, chunks: Sequence[RetrievedChunk]) -> np.ndarray | None:
+        """Reconstruct candidate vectors from the index; ``None`` if they must be embedded."""
+
+        ids = [chunk.vector_id for chunk in chunks]
+        if self._index is not None and all(vector_id >= 0 for vector_id in ids):
+            try:
+                vectors: np.ndarray = self._index.reconstruct_batch(np.asarray(ids, dtype="int64"))
+                return vectors
+            except RuntimeError:
+                pass  # index type without reconstruction support
+        return None
 
     def dump(self, path: Path) -> None:
-        """Persist the in-memory index and payloads."""
-
-        path.parent.mkdir(parents=True, exist_ok=True)
-        faiss.write_index(self._index, str(path))
-        payload_path = path.with_suffix(".json")
-        payload_path.write_text(
-            json.dumps([chunk.__dict__ for chunk in self._chunks], ensure_ascii=False, indent=2),
-            encoding="utf-8",
-        )
+        """Persist the index, payloads, metadata bitmaps, BM25 postings and manifest.
+
+        Every file is written to a temporary sibling and renamed into place, so
+        workers that memory-mapped the previous dump keep reading a consistent copy.
+        """
+
+        with atomic_path(path) as tmp:
+            faiss.write_index(self._index or build_index(IndexSpec(), self.dimension), str(tmp))
+        self._chunks.dump(path.with_suffix(".payloads.bin"), asdict)
+        with atomic_path(path.with_suffix(".meta.npz")) as tmp:
+            self._metadata.dump(tmp)
+        with atomic_path(path.with_suffix(".bm25.json")) as tmp:
+            self._lexical_index().dump(tmp)
+        with atomic_path(path.with_suffix(".manifest.json")) as tmp:
+            self._manifest.dump(tmp)
 
     @classmethod
-    def load(cls, path: Path) -> "RagService":
-        service = cls()
+    def load(cls, path: Path, *, mmap: bool | None = None, **options: Any) -> "RagService":
+        """Load a dump written by :meth:`dump`; ``options`` go to the constructor.
+
+        With ``mmap`` (default ``settings.rag_index_mmap``) vectors and payloads are
+        memory-mapped rather than read, and payloads are decoded only when a search
+        returns them. The first write copies the index into process memory.
+        """
+
+        service = cls(**options)
         if path.exists():
-            service._index = faiss.read_index(str(path))
-            payload_file = path.with_suffix(".json")
-            if payload_file.exists():
-                payloads = json.loads(payload_file.read_text(encoding="utf-8"))
-                service._chunks = [ChunkPayload(**payload) for payload in payloads]
+            mapped = settings.rag_index_mmap if mmap is None else mmap
+            flags = faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY if mapped else 0
+            index = faiss.read_index(str(path), flags)
+            if mapped and not is_id_mapped(index):
+                # Upgrading a positional dump rewrites its storage, which a mapping cannot do.
+                index, mapped = faiss.read_index(str(path)), False
+            service._index = ensure_id_mapped(index)
+            service._index_mapped = mapped
+            apply_search_params(service._index, service.index_spec)
+            store_file = path.with_suffix(".payloads.bin")
+            metadata_file = path.with_suffix(".meta.npz")
+            legacy_file = path.with_suffix(".json")
+            if store_file.exists():
+                service._chunks = PayloadStore(ChunkPayload, store_file if mapped else None)
+                if not mapped:
+                    for vector_id, chunk in PayloadStore(ChunkPayload, store_file).items():
+                        service._chunks[vector_id] = chunk
+            elif legacy_file.exists():
+                payloads = json.loads(legacy_file.read_text(encoding="utf-8"))
+                for position, payload in enumerate(payloads):
+                    # Older dumps have no ids: vectors were stored positionally.
+                    vector_id = payload.pop("vector_id", position)
+                    service._chunks[vector_id] = ChunkPayload(**payload)
+            if metadata_file.exists():
+                service._metadata = MetadataIndex.load(metadata_file)
+            else:
+                for vector_id, chunk in service._chunks.items():
+                    service._metadata.add(vector_id, chunk.metadata)
+            lexical_file = path.with_suffix(".bm25.json")
+            if lexical_file.exists():
+                # Parsing the postings dominates load time; overlap it with startup.
+                service._lexical_loading = _lexical_pool.submit(BM25Index.load, lexical_file)
+            else:
+                for vector_id, chunk in service._chunks.items():
+                    service._lexical.add(vector_id, chunk.text)
+            manifest_file = path.with_suffix(".manifest.json")
+            if manifest_file.exists():
+                service._manifest = IngestManifest.load(manifest_file)
+            else:
+                service._manifest.next_id = max(service._chunks, default=-1) + 1
         return service
 
-    async def generate_response(self, query: str, retrieved_chunks: list[RetrievedChunk]) -> str:
-        """Generate adaptive response using Google Gemini API directly."""
-        if not settings.google_gemini_api_key:
-            return "LLM not configured. Retrieved chunks: " + "; ".join([c.text for c in retrieved_chunks])
+    async def generate_response(
+        self, query: str, retrieved_chunks: list[RetrievedChunk], history: str = ""
+    ) -> str:
+        """Generate an adaptive response through the LLM gateway.
+
+        ``history`` is a compressed transcript of the conversation so far. When
+        every provider fails the student still gets the retrieved material (a
+        retrieval-only answer) instead of an error message.
+        """
+        if not self.llm.configured:
+            return "LLM not configured. Retrieved chunks: " + _chunk_texts(retrieved_chunks)
 
         try:
-            url = f"https://generativelanguage.googleapis.com/v1/models/gemini-2.5-flash:generateContent?key={settings.google_gemini_api_key}"
-            system_prompt = """Anda adalah Tutor Informatika untuk siswa SMA.
+            return await self.llm.generate(_llm_request(query, retrieved_chunks, history))
+        except AllProvidersFailed as exc:
+            logger.warning("Falling back to a retrieval-only answer: %s", exc)
+            return _retrieval_only_answer(retrieved_chunks)
+
+    async def stream_response(
+        self, query: str, retrieved_chunks: list[RetrievedChunk], history: str = ""
+    ) -> AsyncIterator[str]:
+        """Yield the answer as text deltas as soon as they arrive.
+
+        Closing or cancelling the iterator closes the upstream HTTP response,
+        which aborts generation on the provider's side. If the providers fail,
+        the retrieval-only answer is yielded instead (or appended, when the
+        failure happens mid-answer).
+        """
+        if not self.llm.configured:
+            yield "LLM not configured. Retrieved chunks: " + _chunk_texts(retrieved_chunks)
+            return
+
+        streamed = False
+        try:
+            async for delta in self.llm.stream(_llm_request(query, retrieved_chunks, history)):
+                streamed = True
+                yield delta
+        except (AllProvidersFailed, LLMProviderError, httpx.HTTPError) as exc:
+            logger.warning("Falling back to a retrieval-only answer: %s", describe_error(exc))
+            yield ("\n\n" if streamed else "") + _retrieval_only_answer(retrieved_chunks)
+
+
+_TUTOR_SYSTEM_PROMPT = """Anda adalah Tutor Informatika untuk siswa SMA.
 Tugas: jelaskan konsep dengan bahasa sederhana, gunakan analogi keseharian,
 berikan contoh kode Python kecil, dan latihan 5–10 menit.
 Jangan selesaikan PR penuh; aktifkan "hint policy".
 Tunjukkan langkah berpikir, sebutkan kesalahan umum, dan tutup dengan refleksi.
 Jika topik di luar konteks, katakan tidak yakin dan sarankan eksperimen aman.
-Di akhir respons: berikan 1–2 latihan dan 1 pertanyaan refleksi."""
+Di akhir respons: berikan 1–2 latihan dan 1 pertanyaan refleksi.
 
-            context = "\n".join([f"- {chunk.text} (metadata: {chunk.metadata})" for chunk in retrieved_chunks])
-            prompt = f"{system_prompt}\n\nBased on the following context, answer the query adaptively:\n\nContext:\n{context}\n\nQuery: {query}\n\nProvide a helpful, educational response."
+Based on the numbered context passages the user provides, answer the query adaptively
+and provide a helpful, educational response."""
 
-            payload = {
-                "contents": [{"parts": [{"text": prompt}]}]
-            }
 
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url, json=payload, timeout=30.0)
-                response.raise_for_status()
-                data = response.json()
+def _llm_request(
+    query: str, retrieved_chunks: Sequence[RetrievedChunk], history: str = ""
+) -> LLMRequest:
+    context = build_context(query, retrieved_chunks, settings.llm_context_token_budget)
+    prompt = f"Context:\n{context.text}\n\nQuery: {query}"
+    if history:
+        prompt = f"Conversation so far:\n{history}\n\n{prompt}"
+    return LLMRequest(system=_TUTOR_SYSTEM_PROMPT, prompt=prompt)
 
-            if "candidates" in data and data["candidates"]:
-                return data["candidates"][0]["content"]["parts"][0]["text"]
-            else:
-                return f"No response from Gemini. Retrieved chunks: " + "; ".join([c.text for c in retrieved_chunks])
 
-        except Exception as e:
-            return f"Error calling Gemini API: {str(e)}. Retrieved chunks: " + "; ".join([c.text for c in retrieved_chunks])
+def _chunk_texts(retrieved_chunks: Sequence[RetrievedChunk]) -> str:
+    return "; ".join([c.text for c in retrieved_chunks])
 
 
-# Celery task
-from app.celery_app import celery_app
+def _retrieval_only_answer(retrieved_chunks: Sequence[RetrievedChunk]) -> str:
+    return "LLM unavailable. Retrieved chunks: " + _chunk_texts(retrieved_chunks)
+
+
+_FALLBACK_MARKERS = (
+    "LLM not configured. Retrieved chunks: ",
+    "LLM unavailable. Retrieved chunks: ",
+)
 
+
+def is_fallback_response(text: str) -> bool:
+    """Whether ``text`` is (or ends in) a fallback rather than a fully generated answer."""
+
+    return any(marker in text for marker in _FALLBACK_MARKERS)
+
+
+# Celery task
 @celery_app.task
 def embed_text(text: str) -> list[float]:
     """Embed text using OpenAI."""
     if not settings.openai_api_key:
         raise ValueError("OpenAI API key not configured")
-    client = OpenAI(api_key=settings.openai_api_key)
-    response = client.embeddings.create(
+    response = get_openai_client(settings.openai_api_key).embeddings.create(
         input=text,
-        model="text-embedding-3-small"
+        model=settings.embedding_model,
     )
     return response.data[0].embedding
 
 
-__all__ = ["ChunkPayload", "RetrievedChunk", "RagService"]
+__all__ = ["ChunkPayload", "RetrievedChunk", "RagService", "is_fallback_response"]
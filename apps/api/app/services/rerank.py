@@ -0,0 +1,144 @@
+"""Pluggable re-ranking strategies applied to retriever candidates."""
+
+from __future__ import annotations
+
+import re
+from typing import Callable, Protocol, Sequence
+
+import numpy as np
+
+_WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+PairScorer = Callable[[str, Sequence[str]], Sequence[float]]
+
+
+class ReRanker(Protocol):
+    """Orders candidates given the query vector and their stored vectors."""
+
+    name: str
+
+    def rerank(
+        self, query: str, query_vector: np.ndarray, vectors: np.ndarray, texts: Sequence[str]
+    ) -> list[int]:
+        """Return candidate positions, best first."""
+        ...
+
+
+def _normalise(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    normalised: np.ndarray = np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+    return normalised
+
+
+class NoopReRanker:
+    """Keeps the ANN order; the lowest-latency option."""
+
+    name = "none"
+
+    def rerank(
+        self, query: str, query_vector: np.ndarray, vectors: np.ndarray, texts: Sequence[str]
+    ) -> list[int]:
+        return list(range(len(texts)))
+
+
+class CosineReRanker:
+    """Scores all candidates against the query in a single matrix multiply."""
+
+    name = "cosine"
+
+    def rerank(
+        self, query: str, query_vector: np.ndarray, vectors: np.ndarray, texts: Sequence[str]
+    ) -> list[int]:
+        scores = _normalise(vectors) @ _normalise(query_vector)
+        return [int(position) for position in np.argsort(-scores, kind="stable")]
+
+
+class MMRReRanker:
+    """Maximal marginal relevance: trades relevance against redundancy."""
+
+    name = "mmr"
+
+    def __init__(self, diversity: float = 0.3) -> None:
+        self.diversity = diversity
+
+    def rerank(
+        self, query: str, query_vector: np.ndarray, vectors: np.ndarray, texts: Sequence[str]
+    ) -> list[int]:
+        unit = _normalise(vectors)
+        relevance = unit @ _normalise(query_vector)
+        similarity = unit @ unit.T
+        selected: list[int] = []
+        remaining = list(range(len(texts)))
+        while remaining:
+            if selected:
+                redundancy = similarity[np.ix_(remaining, selected)].max(axis=1)
+            else:
+                redundancy = np.zeros(len(remaining), dtype="float32")
+            marginal = (1 - self.diversity) * relevance[remaining] - self.diversity * redundancy
+            selected.append(remaining.pop(int(np.argmax(marginal))))
+        return selected
+
+
+def _term_overlap_scores(query: str, texts: Sequence[str]) -> list[float]:
+    query_terms = _WORD_PATTERN.findall(query.lower())
+    if not query_terms:
+        return [0.0] * len(texts)
+    query_bigrams = set(zip(query_terms, query_terms[1:]))
+    scores = []
+    for text in texts:
+        terms = _WORD_PATTERN.findall(text.lower())
+        vocabulary = set(terms)
+        coverage = sum(term in vocabulary for term in query_terms) / len(query_terms)
+        bigram_hits = len(query_bigrams & set(zip(terms, terms[1:])))
+        scores.append(coverage + 0.5 * bigram_hits / max(len(query_bigrams), 1))
+    return scores
+
+
+class CrossEncoderReRanker:
+    """Scores (query, passage) pairs jointly.
+
+    ``scorer`` can wrap a real cross-encoder model; the default is a local
+    term-coverage stand-in blended with the stored-vector cosine.
+    """
+
+    name = "cross-encoder"
+
+    def __init__(self, scorer: PairScorer | None = None, vector_weight: float = 0.5) -> None:
+        self.scorer = scorer or _term_overlap_scores
+        self.vector_weight = vector_weight
+
+    def rerank(
+        self, query: str, query_vector: np.ndarray, vectors: np.ndarray, texts: Sequence[str]
+    ) -> list[int]:
+        pair_scores = np.asarray(self.scorer(query, texts), dtype="float32")
+        cosine = _normalise(vectors) @ _normalise(query_vector)
+        combined = (1 - self.vector_weight) * pair_scores + self.vector_weight * cosine
+        return [int(position) for position in np.argsort(-combined, kind="stable")]
+
+
+RERANKERS: dict[str, Callable[[], ReRanker]] = {
+    NoopReRanker.name: NoopReRanker,
+    CosineReRanker.name: CosineReRanker,
+    MMRReRanker.name: MMRReRanker,
+    CrossEncoderReRanker.name: CrossEncoderReRanker,
+}
+
+
+def get_reranker(name: str) -> ReRanker:
+    try:
+        return RERANKERS[name]()
+    except KeyError as exc:
+        raise ValueError(
+            f"Unknown re-ranker '{name}'. Choose from: {', '.join(RERANKERS)}"
+        ) from exc
+
+
+__all__ = [
+    "CosineReRanker",
+    "CrossEncoderReRanker",
+    "MMRReRanker",
+    "NoopReRanker",
+    "RERANKERS",
+    "ReRanker",
+    "get_reranker",
+]
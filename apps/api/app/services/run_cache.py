@@ -0,0 +1,146 @@
+"""Cache of code-run results for deterministic submissions (shared starter snippets)."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable
+
+# Sources mentioning any of these may print something different on every run
+# (clock, randomness, object addresses, scheduling); they are never cached.
+_NONDETERMINISTIC = re.compile(
+    r"\b(?:time|datetime|date|clock|now|today|sleep|random|randint|randrange|rand|srand|shuffle"
+    r"|choice|secrets|uuid|urandom|getpid|threading|multiprocessing|asyncio"
+    r"|Random|Math\.random|Date|currentTimeMillis|nanoTime|Instant|LocalDateTime)\b"
+    r"|\b(?:id|hash)\s*\("
+)
+# Reads of files, the environment, the interpreter or the network: the output
+# then depends on the machine, not only on the program. Reading stdin is fine,
+# since stdin is part of the key.
+_MACHINE_IO = re.compile(
+    r"\b(?:open|os|environ|getenv|pathlib|Path|shutil|glob|tempfile|platform|socket|urllib"
+    r"|requests|http|subprocess|fopen|ifstream|File|Files|Paths|getProperty|process|fs)\b"
+)
+_SYS_NAMES = re.compile(r"\bsys\s*\.\s*(\w+)|\bfrom\s+sys\s+import\s+([^\n;]+)")
+_STDIO_SYS_NAMES = frozenset({"stdin", "stdout", "stderr", "exit", "setrecursionlimit", "maxsize"})
+
+# Only outcomes that depend on the program alone; a timeout depends on load.
+_CACHEABLE_STATUSES = frozenset({"completed", "error"})
+
+
+@dataclass(slots=True)
+class RunCacheStats:
+    """Counters for the run cache; ``hit_rate`` is hits over lookups."""
+
+    hits: int = 0
+    misses: int = 0
+    stores: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    skipped: int = 0  # submissions not eligible for caching
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def as_dict(self) -> dict[str, float]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "skipped": self.skipped,
+            "hit_rate": round(self.hit_rate, 4),
+        }
+
+
+def normalize_source(source: str) -> str:
+    """Line endings, trailing whitespace and trailing blank lines removed.
+
+    Lines are otherwise kept as written, so a cached traceback still points at
+    the line numbers the student sees.
+    """
+
+    lines = [line.rstrip() for line in source.replace("\r\n", "\n").replace("\r", "\n").split("\n")]
+    return "\n".join(lines).strip("\n")
+
+
+def is_deterministic(source: str) -> bool:
+    """Whether ``source`` can only depend on itself and its stdin (a conservative guess)."""
+
+    if _NONDETERMINISTIC.search(source) or _MACHINE_IO.search(source):
+        return False
+    for attribute, imported in _SYS_NAMES.findall(source):
+        names = {attribute} if attribute else set(re.findall(r"\w+", imported)) - {"as"}
+        if not names <= _STDIO_SYS_NAMES:
+            return False  # sys.argv, sys.path, sys.version, ...
+    return True
+
+
+class RunResultCache:
+    """Bounded LRU of run results keyed by (language, source hash, stdin, runtime).
+
+    ``key`` returns ``None`` for submissions whose output may differ between
+    runs; callers then execute them as usual. Entries expire after
+    ``ttl_seconds`` so a changed sandbox configuration is picked up eventually,
+    but the runtime version in the key already separates interpreter upgrades.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 4096,
+        ttl_seconds: float = 86_400.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.stats = RunCacheStats()
+        self._clock = clock
+        self._entries: OrderedDict[str, tuple[float, dict[str, Any]]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def key(self, language: str, source: str, stdin: str, runtime: str | None) -> str | None:
+        normalized = normalize_source(source)
+        if runtime is None or not is_deterministic(normalized):
+            self.stats.skipped += 1
+            return None
+        source_hash = hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+        raw = json.dumps([language.lower(), source_hash, stdin, runtime])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> dict[str, Any] | None:
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] <= self._clock():
+            del self._entries[key]
+            self.stats.expirations += 1
+            entry = None
+        if entry is None:
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        self._entries.move_to_end(key)
+        return dict(entry[1])
+
+    def put(self, key: str, result: dict[str, Any]) -> bool:
+        """Store ``result`` if its outcome is cacheable; returns whether it was stored."""
+
+        if result.get("status") not in _CACHEABLE_STATUSES:
+            return False
+        self._entries[key] = (self._clock() + self.ttl_seconds, dict(result))
+        self._entries.move_to_end(key)
+        self.stats.stores += 1
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
+        return True
+
+
+__all__ = ["RunCacheStats", "RunResultCache", "is_deterministic", "normalize_source"]
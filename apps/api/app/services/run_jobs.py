@@ -0,0 +1,124 @@
+"""Background code-run jobs: submit returns an id at once, the result is polled or streamed."""
+
+from __future__ import annotations
+
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable
+
+TERMINAL_STATUSES = frozenset({"completed", "error", "timeout"})
+
+
+@dataclass(slots=True)
+class RunJob:
+    job_id: str
+    owner: str = ""  # user id of the submitter; only they may read the job
+    status: str = "queued"  # "queued", "running", then one of TERMINAL_STATUSES
+    result: dict[str, Any] | None = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: float | None = None
+    version: int = 0  # bumped on every change, so watchers can tell what they have seen
+
+    @property
+    def done(self) -> bool:
+        return self.status in TERMINAL_STATUSES
+
+
+class RunJobStore:
+    """Process-local registry of run jobs, bounded like the other in-memory stores.
+
+    ``submit`` starts ``work`` as a task and returns immediately; the job moves
+    from ``queued`` to ``running`` to the status of the dict ``work`` returns.
+    Finished jobs are kept for ``ttl_seconds`` so clients can still fetch them;
+    at most ``max_jobs`` are retained, oldest first out.
+    """
+
+    def __init__(self, max_jobs: int = 10_000, ttl_seconds: float = 600.0) -> None:
+        self.max_jobs = max_jobs
+        self.ttl_seconds = ttl_seconds
+        self._jobs: OrderedDict[str, RunJob] = OrderedDict()
+        self._changed: dict[str, asyncio.Event] = {}
+        self._tasks: set[asyncio.Task[None]] = set()
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+    def submit(self, work: Callable[[], Awaitable[dict[str, Any]]], owner: str = "") -> RunJob:
+        self._evict()
+        job = RunJob(job_id=uuid.uuid4().hex, owner=owner)
+        self._jobs[job.job_id] = job
+        self._changed[job.job_id] = asyncio.Event()
+        task = asyncio.create_task(self._run(job, work))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    def get(self, job_id: str, owner: str | None = None) -> RunJob | None:
+        """The job, or ``None`` if it is unknown or ``owner`` did not submit it."""
+
+        job = self._jobs.get(job_id)
+        if job is None or (owner is not None and job.owner != owner):
+            return None
+        return job
+
+    async def wait(
+        self, job_id: str, seen_version: int, timeout: float | None = None
+    ) -> RunJob | None:
+        """The job once its version passes ``seen_version`` (or as is after ``timeout``)."""
+
+        job = self._jobs.get(job_id)
+        while job is not None and job.version <= seen_version:
+            changed = self._changed.get(job_id)
+            if changed is None:
+                break
+            try:
+                await asyncio.wait_for(changed.wait(), timeout)
+            except TimeoutError:
+                break
+            job = self._jobs.get(job_id)
+        return job
+
+    async def aclose(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _run(self, job: RunJob, work: Callable[[], Awaitable[dict[str, Any]]]) -> None:
+        self._update(job, "running")
+        try:
+            result = await work()
+        except Exception as exc:  # noqa: BLE001 - a failed run is reported on the job
+            result = {"stdout": "", "stderr": str(exc) or type(exc).__name__, "status": "error"}
+        job.finished_at = time.time()
+        self._update(job, result.get("status", "completed"), result)
+
+    def _update(self, job: RunJob, status: str, result: dict[str, Any] | None = None) -> None:
+        job.status, job.result = status, result
+        job.version += 1
+        # Wake current watchers; later ones wait on a fresh event.
+        changed = self._changed.get(job.job_id)
+        if changed is not None:
+            self._changed[job.job_id] = asyncio.Event()
+            changed.set()
+
+    def _evict(self) -> None:
+        cutoff = time.time() - self.ttl_seconds
+        while self._jobs:
+            oldest = next(iter(self._jobs.values()))
+            if oldest.finished_at is None or oldest.finished_at >= cutoff:
+                break
+            self._drop(oldest.job_id)
+        while len(self._jobs) >= self.max_jobs:
+            self._drop(next(iter(self._jobs)))
+
+    def _drop(self, job_id: str) -> None:
+        self._jobs.pop(job_id, None)
+        changed = self._changed.pop(job_id, None)
+        if changed is not None:
+            changed.set()
+
+
+__all__ = ["RunJob", "RunJobStore", "TERMINAL_STATUSES"]
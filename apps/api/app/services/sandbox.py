@@ -0,0 +1,362 @@
+"""Local Python sandbox backed by a pool of pre-started, resource-limited worker processes."""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import json
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from dataclasses import asdict, astuple, dataclass
+from pathlib import Path
+from typing import AsyncGenerator
+
+from app.core.config import settings
+
+_WORKER_SCRIPT = Path(__file__).with_name("sandbox_worker.py")
+# Protocol overhead allowed on top of the program's output cap when reading a result.
+_RESULT_SLACK_BYTES = 64 * 1024
+# Output beyond the cap the worker may add itself (traceback tail, truncation notice).
+_REPORT_ALLOWANCE_CHARS = 16 * 1024
+_STATUSES = frozenset({"completed", "error"})
+
+
+class SandboxError(RuntimeError):
+    """The sandbox itself failed (worker could not isolate itself or did not start)."""
+
+
+@dataclass(slots=True, frozen=True)
+class SandboxLimits:
+    timeout_seconds: float = 3.0
+    cpu_seconds: int = 3
+    memory_bytes: int = 256 * 1024 * 1024
+    output_bytes: int = 64 * 1024
+    file_bytes: int = 1024 * 1024
+    open_files: int = 64
+
+    @classmethod
+    def from_settings(cls) -> "SandboxLimits":
+        return cls(
+            timeout_seconds=settings.sandbox_timeout_seconds,
+            cpu_seconds=settings.sandbox_cpu_seconds,
+            memory_bytes=settings.sandbox_memory_mb * 1024 * 1024,
+            output_bytes=settings.sandbox_output_bytes,
+        )
+
+
+@dataclass(slots=True)
+class SandboxChunk:
+    stream: str  # "stdout" or "stderr"
+    data: str
+
+
+@dataclass(slots=True)
+class SandboxResult:
+    stdout: str
+    stderr: str
+    status: str  # "completed", "error" or "timeout"
+    exit_code: int | None
+    execution_time_ms: float
+    truncated: bool = False
+    network_isolated: bool = False
+
+
+class _Worker:
+    """One warm interpreter that has locked itself down and waits for a single job."""
+
+    def __init__(
+        self, process: asyncio.subprocess.Process, workdir: str, limits: SandboxLimits
+    ) -> None:
+        self.process = process
+        self.workdir = workdir
+        self.limits = limits
+
+    @classmethod
+    async def start(cls, python: str, limits: SandboxLimits, uid: int) -> "_Worker":
+        workdir = tempfile.mkdtemp(prefix="wahida-run-")
+        process = await asyncio.create_subprocess_exec(
+            python,
+            "-I",
+            str(_WORKER_SCRIPT),
+            json.dumps({**asdict(limits), "uid": uid}),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+            cwd=workdir,
+            env={"PATH": "/usr/bin:/bin", "PYTHONIOENCODING": "utf-8", "PYTHONHASHSEED": "0"},
+            start_new_session=True,
+            # JSON escaping of control characters can grow output up to 6x.
+            limit=limits.output_bytes * 6 + _RESULT_SLACK_BYTES,
+        )
+        worker = cls(process, workdir, limits)
+        assert process.stdout is not None
+        handshake = await process.stdout.readline()
+        if handshake != b"ready\n":
+            await worker.kill()
+            reason = handshake.decode("utf-8", "replace").strip() or "worker exited"
+            raise SandboxError(f"sandbox worker failed to start ({reason})")
+        return worker
+
+    async def run(self, source: str, stdin: str, timeout: float) -> SandboxResult:
+        async for event in self.events(source, stdin, timeout):
+            if isinstance(event, SandboxResult):
+                return event
+        raise SandboxError("sandbox worker sent no result")
+
+    async def events(
+        self, source: str, stdin: str, timeout: float, stream: bool = False
+    ) -> AsyncGenerator[SandboxChunk | SandboxResult, None]:
+        """Output chunks as the program writes them (with ``stream``), then its result.
+
+        The program shares the worker's pipe, so nothing read after the
+        handshake is trusted: the output cap and the run time are enforced
+        and measured here, and a malformed line ends the run as an error.
+        """
+
+        assert self.process.stdin is not None and self.process.stdout is not None
+        job = {"source": source, "stdin": stdin, "stream": stream}
+        started = time.perf_counter()
+        deadline = started + timeout
+        self.process.stdin.write(json.dumps(job).encode("utf-8") + b"\n")
+        self.process.stdin.close()
+
+        budget = self.limits.output_bytes + _REPORT_ALLOWANCE_CHARS
+
+        def elapsed_ms() -> float:
+            return round((time.perf_counter() - started) * 1000, 3)
+
+        def broken(reason: str) -> SandboxResult:
+            return SandboxResult(
+                stdout="",
+                stderr=f"Execution was stopped: {reason}.",
+                status="error",
+                exit_code=None,
+                execution_time_ms=elapsed_ms(),
+                network_isolated=True,
+            )
+
+        while True:
+            try:
+                # Not ``asyncio.timeout``: the caller runs between chunks and must not be cancelled.
+                line = await asyncio.wait_for(
+                    self.process.stdout.readline(), deadline - time.perf_counter()
+                )
+            except TimeoutError:
+                yield SandboxResult(
+                    stdout="",
+                    stderr=f"Execution exceeded the {timeout:g}s time limit.",
+                    status="timeout",
+                    exit_code=None,
+                    execution_time_ms=elapsed_ms(),
+                )
+                return
+            except ValueError:  # a line exceeded the stream limit
+                yield broken("the program produced too much output")
+                return
+            if not line:
+                # Killed by the kernel: SIGXCPU (CPU limit) or SIGKILL (memory).
+                code = await self.process.wait()
+                yield SandboxResult(
+                    stdout="",
+                    stderr="Execution was stopped by the sandbox resource limits.",
+                    status="timeout" if code in (-24, -9) else "error",
+                    exit_code=code,
+                    execution_time_ms=elapsed_ms(),
+                    network_isolated=True,
+                )
+                return
+            try:
+                message = json.loads(line)
+            except ValueError:
+                message = None
+            if not isinstance(message, dict):
+                yield broken("the program wrote to the sandbox's result channel")
+                return
+            if "stream" in message:
+                stream_name, data = message.get("stream"), message.get("data")
+                if stream_name not in ("stdout", "stderr") or not isinstance(data, str):
+                    yield broken("the program wrote to the sandbox's result channel")
+                    return
+                budget -= len(data)
+                if budget < 0:
+                    yield broken("the program produced too much output")
+                    return
+                yield SandboxChunk(stream_name, data)
+                continue
+            result = self._result(message, budget, elapsed_ms())
+            yield (
+                result
+                if result is not None
+                else broken("the program wrote to the sandbox's result channel")
+            )
+            return
+
+    @staticmethod
+    def _result(
+        message: dict[str, object], budget: int, execution_time_ms: float
+    ) -> SandboxResult | None:
+        stdout, stderr = message.get("stdout"), message.get("stderr")
+        status, exit_code = message.get("status"), message.get("exit_code")
+        if not isinstance(stdout, str) or not isinstance(stderr, str) or status not in _STATUSES:
+            return None
+        if len(stdout) + len(stderr) > budget or not (exit_code is None or type(exit_code) is int):
+            return None
+        return SandboxResult(
+            stdout=stdout,
+            stderr=stderr,
+            status=str(status),
+            exit_code=exit_code,
+            execution_time_ms=execution_time_ms,
+            truncated=message.get("truncated") is True,
+            network_isolated=True,
+        )
+
+    async def kill(self) -> None:
+        if self.process.returncode is None:
+            with contextlib.suppress(ProcessLookupError):
+                self.process.kill()
+            await self.process.wait()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+class PythonSandbox:
+    """Runs Python snippets in pre-started worker processes, one process per run.
+
+    ``pool_size`` interpreters are kept started and locked down (private
+    namespaces, a chroot of the read-only standard library, an unprivileged
+    ``uid``, seccomp and rlimits; see ``sandbox_worker``), so a run only pays
+    for sending the job. A worker that cannot isolate itself refuses to run
+    anything and :class:`SandboxError` is raised instead. Every worker is used
+    once and killed, and a replacement is started in the background; at most
+    ``max_concurrency`` programs run at a time.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = 4,
+        max_concurrency: int = 8,
+        limits: SandboxLimits | None = None,
+        python: str = sys.executable,
+        uid: int = 65534,
+    ) -> None:
+        self.pool_size = pool_size
+        self.max_concurrency = max_concurrency
+        self.limits = limits or SandboxLimits()
+        self.python = python
+        self.uid = uid
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._idle: list[_Worker] = []
+        self._starting: set[asyncio.Task[None]] = set()
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    @classmethod
+    def from_settings(cls) -> "PythonSandbox":
+        return cls(
+            pool_size=settings.sandbox_pool_size,
+            max_concurrency=settings.sandbox_max_concurrency,
+            limits=SandboxLimits.from_settings(),
+            uid=settings.sandbox_uid,
+        )
+
+    @property
+    def idle_workers(self) -> int:
+        return len(self._idle)
+
+    @property
+    def runtime_version(self) -> str:
+        """Interpreter and limits: what a run's result depends on besides the program."""
+
+        interpreter = (
+            f"cpython-{platform.python_version()}" if self.python == sys.executable else self.python
+        )
+        return f"{interpreter}/{','.join(str(value) for value in astuple(self.limits))}"
+
+    async def start(self) -> None:
+        """Fill the pool and wait until every worker is warm."""
+
+        self._refill()
+        await asyncio.gather(*self._starting, return_exceptions=True)
+
+    async def run(self, source: str, stdin: str = "") -> SandboxResult:
+        self._bind_loop()
+        async with self._slots:
+            worker = await self._take()
+            self._refill()
+            try:
+                return await worker.run(source, stdin, self.limits.timeout_seconds)
+            finally:
+                await worker.kill()
+
+    async def stream(
+        self, source: str, stdin: str = ""
+    ) -> AsyncGenerator[SandboxChunk | SandboxResult, None]:
+        """Like :meth:`run`, but yields output chunks while the program is running.
+
+        Closing the generator early (e.g. the client went away) kills the
+        program at once instead of letting it run to its time limit.
+        """
+
+        self._bind_loop()
+        async with self._slots:
+            worker = await self._take()
+            self._refill()
+            try:
+                async for event in worker.events(
+                    source, stdin, self.limits.timeout_seconds, stream=True
+                ):
+                    yield event
+            finally:
+                await worker.kill()
+
+    async def aclose(self) -> None:
+        for task in list(self._starting):
+            task.cancel()
+        await asyncio.gather(*self._starting, return_exceptions=True)
+        idle, self._idle = self._idle, []
+        await asyncio.gather(*(worker.kill() for worker in idle))
+
+    async def _take(self) -> _Worker:
+        self._bind_loop()
+        while self._idle:
+            worker = self._idle.pop()
+            if worker.process.returncode is None:
+                return worker
+            await worker.kill()
+        return await _Worker.start(self.python, self.limits, self.uid)
+
+    def _refill(self) -> None:
+        self._bind_loop()
+        for _ in range(self.pool_size - len(self._idle) - len(self._starting)):
+            task = asyncio.create_task(self._add_worker())
+            self._starting.add(task)
+            task.add_done_callback(self._starting.discard)
+
+    async def _add_worker(self) -> None:
+        worker = await _Worker.start(self.python, self.limits, self.uid)
+        self._idle.append(worker)
+
+    def _bind_loop(self) -> None:
+        # Subprocess transports belong to the loop that created them; workers
+        # left on a closed loop see EOF on their job pipe and exit.
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._idle = []
+            self._starting = set()
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+
+
+python_sandbox = PythonSandbox.from_settings()
+
+
+__all__ = [
+    "PythonSandbox",
+    "SandboxChunk",
+    "SandboxError",
+    "SandboxLimits",
+    "SandboxResult",
+    "python_sandbox",
+]
@@ -0,0 +1,478 @@
+"""Bootstrap of one warm sandbox process; runs under ``python -I`` and imports only stdlib.
+
+Before any student code is seen, the worker isolates itself and fails closed
+if any step is refused: private mount and network namespaces (plus a user
+namespace when not started as root), a chroot holding only the read-only
+standard library and shared libraries plus a small tmpfs ``/tmp``, a
+dedicated unprivileged uid (or no capabilities inside the user namespace),
+``PR_SET_NO_NEW_PRIVS`` and a seccomp filter refusing sockets, exec, new
+processes, ptrace and namespace/mount calls. The environment it was started
+with is already scrubbed by the host, and ``/proc`` is not mounted.
+
+Protocol on the inherited stdout pipe: the worker locks itself down, writes
+``ready`` (or ``isolation-failed: <reason>``), reads one JSON job line
+(``source``, ``stdin``, ``stream``) from stdin, runs it and writes one JSON
+result line, then exits. The program's own output is captured in-process, up to
+a byte cap; file descriptors 0-2 point at ``/dev/null`` while it runs, so it
+cannot corrupt the protocol stream. With ``stream`` set, output is instead sent
+as it is produced, in ``{"stream": ..., "data": ...}`` lines ahead of the
+result line. The program can reach the pipe too, so the host treats everything
+after ``ready`` as untrusted (it enforces the byte cap and measures time
+itself).
+"""
+
+from __future__ import annotations
+
+# The unused (F401) imports are loaded up front so classroom snippets do not pay
+# for them per run.
+import collections  # noqa: F401
+import ctypes
+import io
+import itertools  # noqa: F401
+import json
+import linecache
+import math  # noqa: F401
+import os
+import random  # noqa: F401
+import re  # noqa: F401
+import resource
+import string  # noqa: F401
+import sys
+import sysconfig
+import threading
+import time
+import traceback
+from functools import partial
+from typing import Callable
+
+_CLONE_THREAD = 0x00010000
+_CLONE_NEWNS = 0x00020000
+_CLONE_NEWUSER = 0x10000000
+_CLONE_NEWNET = 0x40000000
+
+_MS_RDONLY, _MS_NOSUID, _MS_NODEV, _MS_NOEXEC = 0x1, 0x2, 0x4, 0x8
+_MS_REMOUNT, _MS_BIND, _MS_REC, _MS_PRIVATE = 0x20, 0x1000, 0x4000, 0x40000
+# Flags of a source mount that a read-only bind remount has to keep (the kernel
+# refuses to clear them inside a user namespace).
+_KEPT_MOUNT_FLAGS = {
+    os.ST_NOEXEC: _MS_NOEXEC,
+    os.ST_NOATIME: 0x400,
+    os.ST_NODIRATIME: 0x800,
+    os.ST_RELATIME: 0x200000,
+}
+# Shared-library directories the interpreter's extension modules may load from.
+_LIBRARY_DIRS = ("/lib", "/lib64", "/usr/lib", "/usr/lib64", "/usr/local/lib")
+
+_PR_SET_SECCOMP, _PR_SET_NO_NEW_PRIVS = 22, 38
+_SECCOMP_MODE_FILTER = 2
+_SECCOMP_RET_KILL_PROCESS, _SECCOMP_RET_ALLOW = 0x80000000, 0x7FFF0000
+_SECCOMP_RET_EPERM, _SECCOMP_RET_ENOSYS = 0x00050000 | 1, 0x00050000 | 38
+_BPF_LD_ABS, _BPF_JEQ, _BPF_JGE, _BPF_JSET, _BPF_RET = 0x20, 0x15, 0x35, 0x45, 0x06
+
+# (audit arch, syscall numbers) per machine; anything else fails closed.
+# fmt: off
+_SYSCALLS = {
+    "x86_64": (
+        0xC000003E,
+        {
+            "socket": 41, "connect": 42, "accept": 43, "bind": 49, "listen": 50, "socketpair": 53,
+            "accept4": 288, "clone": 56, "fork": 57, "vfork": 58, "execve": 59, "execveat": 322,
+            "ptrace": 101, "personality": 135, "pivot_root": 155, "chroot": 161, "mount": 165,
+            "umount2": 166, "init_module": 175, "delete_module": 176, "finit_module": 313,
+            "kexec_load": 246, "add_key": 248, "request_key": 249, "keyctl": 250, "unshare": 272,
+            "perf_event_open": 298, "setns": 308, "process_vm_readv": 310, "process_vm_writev": 311,
+            "bpf": 321, "userfaultfd": 323, "io_uring_setup": 425, "clone3": 435,
+        },
+    ),
+    "aarch64": (
+        0xC00000B7,
+        {
+            "socket": 198, "socketpair": 199, "bind": 200, "listen": 201, "accept": 202,
+            "connect": 203, "accept4": 242, "clone": 220, "execve": 221, "execveat": 281,
+            "ptrace": 117, "personality": 92, "pivot_root": 41, "chroot": 51, "mount": 40,
+            "umount2": 39, "init_module": 105, "delete_module": 106, "finit_module": 273,
+            "kexec_load": 104, "add_key": 217, "request_key": 218, "keyctl": 219, "unshare": 97,
+            "perf_event_open": 241, "setns": 268, "process_vm_readv": 270, "process_vm_writev": 271,
+            "bpf": 280, "userfaultfd": 282, "io_uring_setup": 425, "clone3": 435,
+        },
+    ),
+}
+_DENIED_SYSCALLS = (
+    "socket", "socketpair", "connect", "bind", "listen", "accept", "accept4", "fork", "vfork",
+    "execve", "execveat", "ptrace", "personality", "pivot_root", "chroot", "mount", "umount2",
+    "init_module", "delete_module", "finit_module", "kexec_load", "add_key", "request_key",
+    "keyctl", "unshare", "perf_event_open", "setns", "process_vm_readv", "process_vm_writev",
+    "bpf", "userfaultfd", "io_uring_setup",
+)
+# fmt: on
+
+_FILENAME = "<main>"
+# Tail of a traceback kept when reporting an uncaught exception.
+_REPORT_CHARS = 8192
+# Streamed output is shipped at least this often, or sooner once this much is pending.
+_FLUSH_SECONDS = 0.05
+_FLUSH_BYTES = 4096
+
+# Audit events that reach the network or start other programs.
+_BLOCKED_EVENTS = frozenset(
+    {
+        "socket.__new__",
+        "socket.connect",
+        "socket.bind",
+        "socket.getaddrinfo",
+        "socket.sendto",
+        "subprocess.Popen",
+        "os.system",
+        "os.exec",
+        "os.spawn",
+        "os.posix_spawn",
+        "os.fork",
+        "os.forkpty",
+        "pty.spawn",
+        "ctypes.dlopen",
+        "ctypes.dlsym",
+        "ctypes.call_function",
+    }
+)
+
+
+class OutputLimitExceeded(BaseException):
+    """Raised from ``print`` once the program exceeded its output cap."""
+
+
+def _write_line(fd: int, payload: dict[str, object]) -> None:
+    data = json.dumps(payload, ensure_ascii=False).encode("utf-8", "replace") + b"\n"
+    while data:
+        data = data[os.write(fd, data) :]
+
+
+class _Forwarder:
+    """Ships streamed output to the host in batched lines, also while the program sleeps."""
+
+    def __init__(self, fd: int) -> None:
+        self._fd = fd
+        self._pending: list[tuple[str, str]] = []
+        self._pending_bytes = 0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        # Started before the rlimits apply: RLIMIT_NPROC=0 also forbids new threads.
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def add(self, stream: str, text: str) -> None:
+        with self._lock:
+            self._pending.append((stream, text))
+            self._pending_bytes += len(text)
+            if self._pending_bytes >= _FLUSH_BYTES:
+                self._flush()
+
+    def close(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+        with self._lock:
+            self._flush()
+
+    def _loop(self) -> None:
+        while not self._stopped.wait(_FLUSH_SECONDS):
+            with self._lock:
+                self._flush()
+
+    def _flush(self) -> None:
+        # Consecutive writes to the same stream go out as one chunk.
+        merged: list[tuple[str, list[str]]] = []
+        for stream, text in self._pending:
+            if merged and merged[-1][0] == stream:
+                merged[-1][1].append(text)
+            else:
+                merged.append((stream, [text]))
+        self._pending, self._pending_bytes = [], 0
+        for stream, parts in merged:
+            _write_line(self._fd, {"stream": stream, "data": "".join(parts)})
+
+
+class _CappedWriter(io.TextIOBase):
+    def __init__(self, budget: list[int], forward: Callable[[str], None] | None = None) -> None:
+        self._parts: list[str] = []
+        self._budget = budget  # shared by stdout and stderr
+        self._keep = forward or self._parts.append
+        self.truncated = False
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        size = len(text.encode("utf-8", "replace"))
+        if size > self._budget[0]:
+            self._keep(text.encode("utf-8", "replace")[: self._budget[0]].decode("utf-8", "ignore"))
+            self._budget[0] = 0
+            self.truncated = True
+            raise OutputLimitExceeded
+        self._budget[0] -= size
+        self._keep(text)
+        return len(text)
+
+    def report(self, text: str) -> None:
+        """Append the worker's own error report, which does not count against the cap."""
+
+        self._keep(text[-_REPORT_CHARS:])
+
+    def getvalue(self) -> str:
+        return "".join(self._parts)
+
+
+class _SockFilter(ctypes.Structure):
+    _fields_ = [
+        ("code", ctypes.c_uint16),
+        ("jt", ctypes.c_uint8),
+        ("jf", ctypes.c_uint8),
+        ("k", ctypes.c_uint32),
+    ]
+
+
+class _SockFprog(ctypes.Structure):
+    _fields_ = [("len", ctypes.c_ushort), ("filter", ctypes.POINTER(_SockFilter))]
+
+
+def _check(result: int, what: str) -> None:
+    if result != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, f"{what}: {os.strerror(errno)}")
+
+
+def _write_file(path: str, text: str) -> None:
+    with open(path, "w", encoding="ascii") as handle:
+        handle.write(text)
+
+
+def _read_only_paths() -> list[str]:
+    stdlib = {sysconfig.get_path("stdlib"), sysconfig.get_path("platstdlib")}
+    return sorted(path for path in stdlib.union(_LIBRARY_DIRS) if path and os.path.exists(path))
+
+
+def _build_root(libc: ctypes.CDLL, root: str, tmp_bytes: int) -> None:
+    """A tmpfs root with the read-only library paths bound in and a writable ``/tmp``."""
+
+    os.mkdir(root, 0o755)
+    _check(
+        libc.mount(b"tmpfs", root.encode(), b"tmpfs", _MS_NOSUID | _MS_NODEV, b"size=1m,mode=755"),
+        "mount root",
+    )
+    for source in _read_only_paths():
+        target = root + source
+        if os.path.islink(source):  # e.g. /lib -> usr/lib on merged-/usr systems
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.symlink(os.readlink(source), target)
+            continue
+        os.makedirs(target, exist_ok=True)
+        _check(libc.mount(source.encode(), target.encode(), None, _MS_BIND, None), f"bind {source}")
+        kept = os.statvfs(source).f_flag
+        flags = _MS_BIND | _MS_REMOUNT | _MS_RDONLY | _MS_NOSUID | _MS_NODEV
+        flags |= sum(
+            mount_flag for stat_flag, mount_flag in _KEPT_MOUNT_FLAGS.items() if kept & stat_flag
+        )
+        _check(libc.mount(None, target.encode(), None, flags, None), f"read-only {source}")
+    os.mkdir(root + "/tmp")
+    options = f"size={tmp_bytes},mode=1777".encode()
+    _check(
+        libc.mount(
+            b"tmpfs",
+            (root + "/tmp").encode(),
+            b"tmpfs",
+            _MS_NOSUID | _MS_NODEV | _MS_NOEXEC,
+            options,
+        ),
+        "mount /tmp",
+    )
+    _check(
+        libc.mount(
+            None, root.encode(), None, _MS_REMOUNT | _MS_RDONLY | _MS_NOSUID | _MS_NODEV, None
+        ),
+        "read-only root",
+    )
+
+
+def _drop_capabilities(libc: ctypes.CDLL) -> None:
+    header = (ctypes.c_uint32 * 2)(0x20080522, 0)  # _LINUX_CAPABILITY_VERSION_3, this process
+    _check(libc.capset(header, (ctypes.c_uint32 * 6)()), "drop capabilities")
+
+
+def _seccomp_filter() -> list[tuple[int, int, int, int]]:
+    machine = os.uname().machine
+    if machine not in _SYSCALLS:
+        raise OSError(0, f"seccomp: no syscall table for {machine}")
+    arch, numbers = _SYSCALLS[machine]
+    program = [
+        (_BPF_LD_ABS, 0, 0, 4),  # seccomp_data.arch
+        (_BPF_JEQ, 1, 0, arch),
+        (_BPF_RET, 0, 0, _SECCOMP_RET_KILL_PROCESS),
+        (_BPF_LD_ABS, 0, 0, 0),  # seccomp_data.nr
+    ]
+    if machine == "x86_64":  # x32 syscalls would bypass the numbers below
+        program += [(_BPF_JGE, 0, 1, 0x40000000), (_BPF_RET, 0, 0, _SECCOMP_RET_KILL_PROCESS)]
+    for name in _DENIED_SYSCALLS:
+        if name in numbers:
+            program += [(_BPF_JEQ, 0, 1, numbers[name]), (_BPF_RET, 0, 0, _SECCOMP_RET_EPERM)]
+    # clone3 flags live in memory BPF cannot read; glibc falls back to clone.
+    program += [(_BPF_JEQ, 0, 1, numbers["clone3"]), (_BPF_RET, 0, 0, _SECCOMP_RET_ENOSYS)]
+    # clone only for threads: a new process needs a clone without CLONE_THREAD.
+    program += [
+        (_BPF_JEQ, 0, 4, numbers["clone"]),
+        (_BPF_LD_ABS, 0, 0, 16),  # low half of seccomp_data.args[0]
+        (_BPF_JSET, 0, 1, _CLONE_THREAD),
+        (_BPF_RET, 0, 0, _SECCOMP_RET_ALLOW),
+        (_BPF_RET, 0, 0, _SECCOMP_RET_EPERM),
+        (_BPF_RET, 0, 0, _SECCOMP_RET_ALLOW),
+    ]
+    return program
+
+
+def _install_seccomp(libc: ctypes.CDLL) -> None:
+    program = _seccomp_filter()
+    filters = (_SockFilter * len(program))(*(_SockFilter(*instruction) for instruction in program))
+    fprog = _SockFprog(len(program), filters)
+    _check(
+        libc.prctl(
+            ctypes.c_int(_PR_SET_SECCOMP),
+            ctypes.c_ulong(_SECCOMP_MODE_FILTER),
+            ctypes.byref(fprog),
+            None,
+            None,
+        ),
+        "install seccomp filter",
+    )
+
+
+def _isolate(config: dict[str, int]) -> None:
+    """Lock this process down before it reads a job; raises ``OSError`` if any step fails."""
+
+    libc = ctypes.CDLL(None, use_errno=True)
+    uid, gid = os.geteuid(), os.getegid()
+    privileged = uid == 0
+    _check(
+        libc.unshare(_CLONE_NEWNS | _CLONE_NEWNET | (0 if privileged else _CLONE_NEWUSER)),
+        "unshare",
+    )
+    if not privileged:
+        _write_file("/proc/self/setgroups", "deny")
+        _write_file("/proc/self/uid_map", f"0 {uid} 1")
+        _write_file("/proc/self/gid_map", f"0 {gid} 1")
+    _check(libc.mount(None, b"/", None, _MS_REC | _MS_PRIVATE, None), "private mounts")
+    root = os.path.join(os.getcwd(), "root")
+    _build_root(libc, root, max(4 * config["file_bytes"], 1024 * 1024))
+    os.chroot(root)
+    os.chdir("/tmp")
+    if privileged:
+        os.setgroups([])
+        os.setgid(config["uid"])
+        os.setuid(config["uid"])  # from root to another uid clears every capability
+    else:
+        _drop_capabilities(libc)
+    _check(
+        libc.prctl(ctypes.c_int(_PR_SET_NO_NEW_PRIVS), ctypes.c_ulong(1), None, None, None),
+        "no_new_privs",
+    )
+    _install_seccomp(libc)
+
+
+def _apply_limits(limits: dict[str, int]) -> None:
+    for name, value in (
+        ("RLIMIT_CPU", limits["cpu_seconds"]),
+        ("RLIMIT_AS", limits["memory_bytes"]),
+        ("RLIMIT_FSIZE", limits["file_bytes"]),
+        ("RLIMIT_NOFILE", limits["open_files"]),
+        ("RLIMIT_NPROC", 0),
+        ("RLIMIT_CORE", 0),
+    ):
+        kind = getattr(resource, name, None)
+        if kind is None:
+            continue
+        try:
+            resource.setrlimit(kind, (value, value))
+        except (ValueError, OSError):
+            pass  # e.g. a hard limit already below ``value``
+
+
+def _audit(event: str, _args: tuple[object, ...]) -> None:
+    if event in _BLOCKED_EVENTS:
+        raise PermissionError(f"{event} is not permitted in the sandbox")
+
+
+def _format_error(exc: BaseException) -> str:
+    # Only the student's own frames; the worker's and the stdlib's are noise to them.
+    frames = [
+        frame for frame in traceback.extract_tb(exc.__traceback__) if frame.filename == _FILENAME
+    ]
+    lines = (
+        ["Traceback (most recent call last):\n", *traceback.format_list(frames)] if frames else []
+    )
+    return "".join(lines + traceback.format_exception_only(type(exc), exc))
+
+
+def main() -> None:
+    limits = json.loads(sys.argv[1])
+    result_fd = os.dup(1)
+    devnull = os.open(os.devnull, os.O_RDWR)  # before the chroot, which has no /dev
+    try:
+        _isolate(limits)
+    except OSError as exc:
+        os.write(result_fd, f"isolation-failed: {exc}\n".encode("utf-8", "replace"))
+        os._exit(1)
+
+    os.write(result_fd, b"ready\n")
+    with os.fdopen(os.dup(0), "rb") as jobs:
+        job_line = jobs.readline()
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+    job = json.loads(job_line)
+
+    budget = [int(limits["output_bytes"])]
+    forwarder = _Forwarder(result_fd) if job.get("stream") else None
+    stdout = _CappedWriter(
+        budget, partial(forwarder.add, "stdout") if forwarder is not None else None
+    )
+    stderr = _CappedWriter(
+        budget, partial(forwarder.add, "stderr") if forwarder is not None else None
+    )
+    sys.stdout, sys.stderr, sys.stdin = stdout, stderr, io.StringIO(job.get("stdin") or "")
+    source = job["source"]
+    linecache.cache[_FILENAME] = (len(source), None, source.splitlines(True), _FILENAME)
+    _apply_limits(limits)
+    sys.addaudithook(_audit)
+
+    status, exit_code = "completed", 0
+    started = time.perf_counter()
+    try:
+        code = compile(source, _FILENAME, "exec")
+        exec(code, {"__name__": "__main__", "__builtins__": __builtins__})
+    except OutputLimitExceeded:
+        status, exit_code = "error", 1
+    except SystemExit as exc:
+        if exc.code is None or isinstance(exc.code, int):
+            exit_code = exc.code or 0
+        else:  # sys.exit("message") prints the message and exits with 1
+            exit_code = 1
+            stderr.report(f"{exc.code}\n")
+        status = "completed" if exit_code == 0 else "error"
+    except BaseException as exc:  # noqa: BLE001 - everything the program raises is reported
+        status, exit_code = "error", 1
+        stderr.report(_format_error(exc))
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    if stdout.truncated or stderr.truncated:
+        stderr.report(f"\n[output truncated at {limits['output_bytes']} bytes]")
+    if forwarder is not None:
+        forwarder.close()
+    result = {
+        "stdout": stdout.getvalue(),
+        "stderr": stderr.getvalue(),
+        "status": status,
+        "exit_code": exit_code,
+        "execution_time_ms": round(elapsed_ms, 3),
+        "truncated": stdout.truncated or stderr.truncated,
+    }
+    _write_line(result_fd, result)
+    os._exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""Admission control and fair-share scheduling of code-execution slots."""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Callable
+
+from app.core.config import settings
+from app.services.llm_gateway import LatencyTracker
+
+
+class AdmissionRejected(Exception):
+    """The run was refused: a queue is full (429/503) or it waited too long (503)."""
+
+    def __init__(self, message: str, status_code: int, retry_after: int = 1) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+@dataclass(slots=True)
+class _Waiter:
+    class_id: str
+    user_id: str
+    future: asyncio.Future[None]
+    enqueued_at: float
+
+
+@dataclass(slots=True)
+class _ClassQueue:
+    weight: int
+    # One FIFO per user, visited round robin so nobody in the class starves.
+    users: OrderedDict[str, deque[_Waiter]] = field(default_factory=OrderedDict)
+    waiting: int = 0
+
+
+def parse_weights(spec: str) -> dict[str, int]:
+    """``"kelas-a:3,kelas-b:1"`` -> ``{"kelas-a": 3, "kelas-b": 1}``."""
+
+    weights = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, weight = item.rpartition(":")
+        weights[name.strip()] = max(1, int(weight))
+    return weights
+
+
+class ExecutionScheduler:
+    """Global pool of run slots shared fairly between classes and their students.
+
+    At most ``max_concurrency`` runs execute at once. When the pool is busy a
+    run queues under its class and user; freed slots go to classes by weighted
+    round robin (a class with weight ``w`` gets up to ``w`` slots per turn) and,
+    within a class, to its users in turn. Queue-depth limits per user, per class
+    and overall reject a run immediately instead of letting latency grow without
+    bound, and a run that waits longer than ``queue_timeout`` is given up.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        max_queue: int = 200,
+        max_queue_per_class: int = 60,
+        max_queue_per_user: int = 2,
+        queue_timeout: float = 20.0,
+        class_weights: dict[str, int] | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_queue_per_class = max_queue_per_class
+        self.max_queue_per_user = max_queue_per_user
+        self.queue_timeout = queue_timeout
+        self.class_weights = class_weights or {}
+        self._clock = clock
+        self._running = 0
+        self._waiting = 0
+        self._classes: OrderedDict[str, _ClassQueue] = OrderedDict()  # head has the turn
+        self._turn_left = 0  # slots the head class may still take this turn
+        self._waits = LatencyTracker(window=1024)
+        self.admitted = 0
+        self.rejected: dict[str, int] = {
+            "user_queue": 0,
+            "class_queue": 0,
+            "global_queue": 0,
+            "timeout": 0,
+        }
+
+    @classmethod
+    def from_settings(cls) -> "ExecutionScheduler":
+        return cls(
+            max_concurrency=settings.run_max_concurrency,
+            max_queue=settings.run_max_queue,
+            max_queue_per_class=settings.run_max_queue_per_class,
+            max_queue_per_user=settings.run_max_queue_per_user,
+            queue_timeout=settings.run_queue_timeout_seconds,
+            class_weights=parse_weights(settings.run_class_weights),
+        )
+
+    def check(self, class_id: str, user_id: str) -> None:
+        """Raise :class:`AdmissionRejected` if a run for this user would not be queued now."""
+
+        if self._running < self.max_concurrency and not self._waiting:
+            return
+        queue = self._classes.get(class_id)
+        if queue is not None and len(queue.users.get(user_id, ())) >= self.max_queue_per_user:
+            self.rejected["user_queue"] += 1
+            raise AdmissionRejected("You already have runs waiting; try again shortly.", 429)
+        if queue is not None and queue.waiting >= self.max_queue_per_class:
+            self.rejected["class_queue"] += 1
+            raise AdmissionRejected("Your class has too many runs waiting; try again shortly.", 429)
+        if self._waiting >= self.max_queue:
+            self.rejected["global_queue"] += 1
+            raise AdmissionRejected("The code runner is at capacity; try again shortly.", 503, 5)
+
+    @asynccontextmanager
+    async def slot(self, class_id: str, user_id: str) -> AsyncIterator[None]:
+        """Hold one execution slot for the duration of the ``async with`` block."""
+
+        await self.acquire(class_id, user_id)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, class_id: str, user_id: str) -> None:
+        self.check(class_id, user_id)
+        if self._running < self.max_concurrency and not self._waiting:
+            self._running += 1
+            self.admitted += 1
+            self._waits.record(0.0)
+            return
+        waiter = _Waiter(
+            class_id, user_id, asyncio.get_running_loop().create_future(), self._clock()
+        )
+        self._enqueue(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+        except (TimeoutError, asyncio.CancelledError) as exc:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self.release()  # granted in the same instant; hand the slot on
+            else:
+                waiter.future.cancel()
+                self._remove(waiter)
+            if isinstance(exc, TimeoutError):
+                self.rejected["timeout"] += 1
+                raise AdmissionRejected(
+                    "Waited too long for a free runner; try again.", 503, 5
+                ) from None
+            raise
+
+    def release(self) -> None:
+        self._running -= 1
+        self._dispatch()
+
+    def stats(self) -> dict[str, object]:
+        waits: dict[str, float | None] = {}
+        for q in (50, 95, 99):
+            value = self._waits.percentile(q)
+            waits[f"wait_p{q}_ms"] = round(value * 1000, 1) if value is not None else None
+        return {
+            "running": self._running,
+            "waiting": self._waiting,
+            "max_concurrency": self.max_concurrency,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "waiting_by_class": {name: queue.waiting for name, queue in self._classes.items()},
+            **waits,
+        }
+
+    def _enqueue(self, waiter: _Waiter) -> None:
+        queue = self._classes.get(waiter.class_id)
+        if queue is None:
+            weight = self.class_weights.get(waiter.class_id, 1)
+            queue = self._classes[waiter.class_id] = _ClassQueue(weight)
+            if len(self._classes) == 1:
+                self._turn_left = weight
+        queue.users.setdefault(waiter.user_id, deque()).append(waiter)
+        queue.waiting += 1
+        self._waiting += 1
+
+    def _remove(self, waiter: _Waiter) -> None:
+        queue = self._classes.get(waiter.class_id)
+        if queue is None:
+            return
+        pending = queue.users.get(waiter.user_id)
+        if pending is None or waiter not in pending:
+            return
+        pending.remove(waiter)
+        queue.waiting -= 1
+        self._waiting -= 1
+        if not pending:
+            del queue.users[waiter.user_id]
+        if not queue.users:
+            self._drop_class(waiter.class_id)
+
+    def _drop_class(self, class_id: str) -> None:
+        was_head = next(iter(self._classes)) == class_id
+        del self._classes[class_id]
+        if was_head and self._classes:
+            self._turn_left = next(iter(self._classes.values())).weight
+
+    def _dispatch(self) -> None:
+        while self._running < self.max_concurrency and self._waiting:
+            class_id, queue = next(iter(self._classes.items()))
+            user_id, pending = next(iter(queue.users.items()))
+            waiter = pending.popleft()
+            queue.waiting -= 1
+            self._waiting -= 1
+            if pending:
+                queue.users.move_to_end(user_id)  # the next user in the class goes next
+            else:
+                del queue.users[user_id]
+            self._turn_left -= 1
+            if not queue.users:
+                self._drop_class(class_id)
+            elif self._turn_left <= 0:
+                self._classes.move_to_end(class_id)  # turn passes to the next class
+                self._turn_left = next(iter(self._classes.values())).weight
+            if waiter.future.done():  # cancelled while queued
+                continue
+            self._running += 1
+            self.admitted += 1
+            self._waits.record(self._clock() - waiter.enqueued_at)
+            waiter.future.set_result(None)
+
+
+__all__ = ["AdmissionRejected", "ExecutionScheduler", "parse_weights"]
@@ -0,0 +1,126 @@
+"""Single-flight coalescing of identical concurrent streams."""
+
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass
+from typing import AsyncGenerator, AsyncIterator, Callable, Generic, TypeVar
+
+T = TypeVar("T")
+
+
+@dataclass(slots=True)
+class SingleFlightStats:
+    leaders: int = 0
+    followers: int = 0
+
+    @property
+    def coalesced_rate(self) -> float:
+        total = self.leaders + self.followers
+        return self.followers / total if total else 0.0
+
+    def as_dict(self) -> dict[str, float]:
+        return {
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "coalesced_rate": round(self.coalesced_rate, 4),
+        }
+
+
+class _Flight(Generic[T]):
+    """Items produced so far by one shared run, plus completion state."""
+
+    def __init__(self) -> None:
+        self.items: list[T] = []
+        self.done = False
+        self.error: BaseException | None = None
+        self.subscribers = 0
+        self.task: asyncio.Task[None] | None = None
+        self._changed = asyncio.Event()
+
+    def publish(self, item: T) -> None:
+        self.items.append(item)
+        self._notify()
+
+    def finish(self, error: BaseException | None = None) -> None:
+        self.done = True
+        self.error = error
+        self._notify()
+
+    async def wait(self) -> None:
+        await self._changed.wait()
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+
+class SingleFlight(Generic[T]):
+    """Runs at most one producer per key and fans its items out to every subscriber.
+
+    A subscriber that joins mid-flight first replays the items already produced,
+    so each one sees the complete stream. When the last subscriber leaves before
+    the producer finishes, the producer task is cancelled (aborting any upstream
+    call it is awaiting). Finished flights are forgotten immediately; caching
+    completed results is left to the caller.
+    """
+
+    def __init__(self) -> None:
+        self.stats = SingleFlightStats()
+        self._flights: dict[str, _Flight[T]] = {}
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    def stream(self, key: str, produce: Callable[[], AsyncIterator[T]]) -> AsyncGenerator[T, None]:
+        """Subscribe to the flight for ``key``, starting ``produce()`` if none is running."""
+
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _Flight()
+            flight.task = asyncio.create_task(self._run(key, flight, produce()))
+            self.stats.leaders += 1
+        else:
+            self.stats.followers += 1
+        flight.subscribers += 1
+        return self._subscribe(key, flight)
+
+    async def _run(self, key: str, flight: _Flight[T], items: AsyncIterator[T]) -> None:
+        try:
+            async for item in items:
+                flight.publish(item)
+        except asyncio.CancelledError:
+            flight.finish(asyncio.CancelledError())
+            raise
+        except Exception as exc:
+            flight.finish(exc)
+        else:
+            flight.finish()
+        finally:
+            self._forget(key, flight)
+
+    async def _subscribe(self, key: str, flight: _Flight[T]) -> AsyncGenerator[T, None]:
+        position = 0
+        try:
+            while True:
+                if position < len(flight.items):
+                    position += 1
+                    yield flight.items[position - 1]
+                elif flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                else:
+                    await flight.wait()
+        finally:
+            flight.subscribers -= 1
+            if not flight.subscribers and not flight.done and flight.task is not None:
+                flight.task.cancel()
+                self._forget(key, flight)
+
+    def _forget(self, key: str, flight: _Flight[T]) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+
+__all__ = ["SingleFlight", "SingleFlightStats"]
@@ -0,0 +1,193 @@
+"""FAISS index construction for the supported ANN modes."""
+
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+
+import faiss
+import numpy as np
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ("flat", "ivf-flat", "ivf-pq", "hnsw")
+
+# FAISS recommends at least ~39 training points per IVF centroid.
+_MIN_POINTS_PER_CENTROID = 39
+_MAX_TRAINING_POINTS = 100_000
+
+
+@dataclass(slots=True)
+class IndexSpec:
+    """Build- and query-time parameters for a FAISS index."""
+
+    kind: str = "flat"
+    nlist: int = 1024
+    nprobe: int = 16
+    pq_m: int = 48
+    pq_bits: int = 8
+    hnsw_m: int = 32
+    ef_construction: int = 80
+    ef_search: int = 64
+
+    def __post_init__(self) -> None:
+        if self.kind not in INDEX_TYPES:
+            raise ValueError(
+                f"Unknown index type '{self.kind}'. Choose from: {', '.join(INDEX_TYPES)}"
+            )
+
+    @classmethod
+    def from_settings(cls) -> "IndexSpec":
+        return cls(
+            kind=settings.rag_index_type,
+            nlist=settings.rag_ivf_nlist,
+            nprobe=settings.rag_ivf_nprobe,
+            pq_m=settings.rag_pq_m,
+            hnsw_m=settings.rag_hnsw_m,
+            ef_search=settings.rag_hnsw_ef_search,
+        )
+
+    @property
+    def needs_training(self) -> bool:
+        return self.kind.startswith("ivf")
+
+
+def build_index(spec: IndexSpec, dimension: int, training: np.ndarray | None = None) -> faiss.Index:
+    """Create an id-addressable inner-product index for ``spec``.
+
+    Every index accepts ``add_with_ids`` and ``reconstruct`` by vector id: flat and
+    HNSW indexes are wrapped in ``IndexIDMap2``; IVF indexes keep a hashtable direct
+    map. IVF modes train on ``training`` and shrink ``nlist`` to what it supports;
+    IVF-PQ falls back to flat when there are too few vectors to train codebooks.
+    """
+
+    if spec.kind == "flat":
+        return faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+    if spec.kind == "hnsw":
+        graph = faiss.IndexHNSWFlat(dimension, spec.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        graph.hnsw.efConstruction = spec.ef_construction
+        wrapped = faiss.IndexIDMap2(graph)
+        apply_search_params(wrapped, spec)
+        return wrapped
+
+    n_train = 0 if training is None else len(training)
+    if spec.kind == "ivf-pq" and (n_train < 2**spec.pq_bits or dimension % spec.pq_m):
+        logger.warning("Not enough vectors (%d) to train IVF-PQ; using a flat index", n_train)
+        return faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+    if training is None or n_train == 0:
+        raise ValueError(f"Index type '{spec.kind}' requires training vectors")
+    nlist = planned_nlist(spec, n_train)
+    encoding = "Flat" if spec.kind == "ivf-flat" else f"PQ{spec.pq_m}x{spec.pq_bits}"
+    index = faiss.index_factory(dimension, f"IVF{nlist},{encoding}", faiss.METRIC_INNER_PRODUCT)
+    if n_train > _MAX_TRAINING_POINTS:
+        sample = np.random.default_rng(0).choice(n_train, _MAX_TRAINING_POINTS, replace=False)
+        training = training[np.sort(sample)]
+    index.train(np.ascontiguousarray(training, dtype="float32"))
+    # Map vector ids to list positions so vectors can be reconstructed and removed
+    # (DirectMap is missing from faiss' stubs).
+    ivf = faiss.extract_index_ivf(index)
+    ivf.set_direct_map_type(faiss.DirectMap.Hashtable)  # type: ignore[attr-defined]
+    apply_search_params(index, spec)
+    return index
+
+
+def planned_nlist(spec: IndexSpec, n_vectors: int) -> int:
+    """Number of IVF lists ``n_vectors`` training points support (at most ``spec.nlist``)."""
+
+    return max(1, min(spec.nlist, n_vectors // _MIN_POINTS_PER_CENTROID))
+
+
+def is_outgrown(index: faiss.Index, spec: IndexSpec, n_vectors: int) -> bool:
+    """Whether an IVF index should be retrained now that it holds ``n_vectors``.
+
+    An IVF index trained on the first small batch (e.g. the first of many
+    documents upserted one by one) keeps its handful of lists forever. It is
+    worth rebuilding once the corpus supports twice as many lists, or, for an
+    IVF-PQ index that fell back to flat, once the PQ codebooks can be trained;
+    doubling keeps the total retraining work proportional to the corpus size.
+    """
+
+    if not spec.needs_training:
+        return False
+    base = _unwrap(index)
+    if isinstance(base, faiss.IndexIVF):
+        return planned_nlist(spec, n_vectors) >= 2 * base.nlist
+    return spec.kind == "ivf-pq" and n_vectors >= 2**spec.pq_bits and index.d % spec.pq_m == 0
+
+
+def stores_exact_vectors(index: faiss.Index) -> bool:
+    """Whether ``reconstruct`` returns the added vectors rather than a lossy decoding."""
+
+    return isinstance(_unwrap(index), (faiss.IndexFlat, faiss.IndexIVFFlat, faiss.IndexHNSWFlat))
+
+
+def is_id_mapped(index: faiss.Index) -> bool:
+    return isinstance(faiss.downcast_index(index), (faiss.IndexIDMap2, faiss.IndexIVF))
+
+
+def ensure_id_mapped(index: faiss.Index) -> faiss.Index:
+    """Upgrade a positional index from older dumps to an ``IndexIDMap2``.
+
+    Existing vectors keep their positions as ids.
+    """
+
+    if is_id_mapped(index):
+        return index  # the downcast proxy does not own the C++ object
+    vectors = index.reconstruct_n(0, index.ntotal) if index.ntotal else None
+    empty = faiss.clone_index(index)
+    empty.reset()
+    upgraded = faiss.IndexIDMap2(empty)
+    if vectors is not None:
+        upgraded.add_with_ids(vectors, np.arange(len(vectors), dtype="int64"))
+    return upgraded
+
+
+def _unwrap(index: faiss.Index) -> faiss.Index:
+    base = faiss.downcast_index(index)
+    if isinstance(base, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.downcast_index(base.index)
+    return base
+
+
+def apply_search_params(index: faiss.Index, spec: IndexSpec) -> None:
+    """Set query-time knobs (``nprobe`` / ``efSearch``) on a built or loaded index."""
+
+    base = _unwrap(index)
+    if isinstance(base, faiss.IndexHNSW):
+        base.hnsw.efSearch = spec.ef_search
+    elif isinstance(base, faiss.IndexIVF):
+        base.nprobe = spec.nprobe
+
+
+def search_parameters(
+    index: faiss.Index, spec: IndexSpec, selector: faiss.IDSelector
+) -> faiss.SearchParameters:
+    """Per-query parameters restricting the search to ``selector``."""
+
+    # faiss' stubs lack SearchParametersHNSW and the keyword constructors,
+    # which the SWIG wrappers accept at runtime.
+    base = _unwrap(index)
+    if isinstance(base, faiss.IndexHNSW):
+        hnsw: faiss.SearchParameters = faiss.SearchParametersHNSW(  # type: ignore[attr-defined]
+            sel=selector, efSearch=spec.ef_search
+        )
+        return hnsw
+    if isinstance(base, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=spec.nprobe)  # type: ignore[call-arg]
+    return faiss.SearchParameters(sel=selector)  # type: ignore[call-arg]
+
+
+__all__ = [
+    "INDEX_TYPES",
+    "IndexSpec",
+    "apply_search_params",
+    "build_index",
+    "ensure_id_mapped",
+    "is_id_mapped",
+    "is_outgrown",
+    "planned_nlist",
+    "search_parameters",
+    "stores_exact_vectors",
+]
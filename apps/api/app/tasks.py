@@ -2,14 +2,46 @@
 
 from __future__ import annotations
 
+import json
+from collections import defaultdict
+from pathlib import Path
+
 from app.core import celery_app
-from app.services.rag import RagService
+from app.services.manifest import content_hash
+from app.services.rag import ChunkPayload, RagService
 
 
 @celery_app.task
-def index_chunks(chunks: list[dict], index_path: str) -> None:
-    """Index chunks into FAISS asynchronously."""
-    service = RagService.load(index_path)
-    payload_chunks = [RagService.ChunkPayload(**chunk) for chunk in chunks]
-    service.index(payload_chunks)
-    service.dump(index_path)
\ No newline at end of file
+def index_chunks(
+    chunks: list[dict], index_path: str, content_hashes: dict[str, str] | None = None
+) -> None:
+    """Index chunks into FAISS asynchronously.
+
+    Chunks are grouped by ``metadata["content_id"]`` and upserted per document, so
+    re-delivering the same task does not duplicate vectors. ``content_hashes``
+    maps document ids to the hash the ingest script records
+    (``document_hash``), so both paths agree on what is current; documents
+    without one are hashed from their chunk ids, texts and metadata.
+    """
+    path = Path(index_path)
+    service = RagService.load(path)
+    documents: defaultdict[str, list[ChunkPayload]] = defaultdict(list)
+    for chunk in chunks:
+        payload = ChunkPayload(**chunk)
+        documents[payload.metadata.get("content_id", payload.chunk_id)].append(payload)
+    changed = False
+    for doc_id, payloads in documents.items():
+        payloads.sort(key=lambda payload: int(payload.metadata.get("ord", 0)))
+        digest = (content_hashes or {}).get(doc_id) or content_hash(
+            *(
+                json.dumps(
+                    [payload.chunk_id, payload.text, payload.metadata],
+                    sort_keys=True,
+                    ensure_ascii=False,
+                )
+                for payload in payloads
+            )
+        )
+        changed |= service.upsert_document(doc_id, digest, payloads)
+    if changed:
+        service.dump(path)
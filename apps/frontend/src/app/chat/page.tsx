@@ -23,7 +23,8 @@ interface LLMResponse {
 async function streamChat(
   message: string,
   onChunk: (retrievedChunk: RetrievedChunk) => void,
-  onResponse: (llmResponse: LLMResponse) => void
+  onResponse: (llmResponse: LLMResponse) => void,
+  onDelta: (delta: LLMResponse) => void
 ) {
   const response = await authenticatedFetch(`${API_BASE_URL}/api/chat`, {
     method: "POST",
@@ -46,6 +47,8 @@ async function streamChat(
         const payload = JSON.parse(event.replace(/^data:\s*/, ""));
         if (payload.type === "chunk") {
           onChunk(payload as RetrievedChunk);
+        } else if (payload.type === "delta") {
+          onDelta(payload as LLMResponse);
         } else if (payload.type === "response") {
           onResponse(payload as LLMResponse);
         }
@@ -67,6 +70,7 @@ export default function ChatPage() {
     event.preventDefault();
     if (!input.trim()) return;
     setChunks([]);
+    setLlmResponse(null);
     setError(null);
     setLoading(true);
     try {
@@ -77,6 +81,9 @@ export default function ChatPage() {
         },
         (response) => {
           setLlmResponse(response.text);
+        },
+        (delta) => {
+          setLlmResponse((prev) => (prev ?? "") + delta.text);
         }
       );
       setLoading(false);
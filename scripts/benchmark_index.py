@@ -0,0 +1,86 @@
+"""Benchmark recall@k and latency of the ANN index modes against a flat index."""
+
+from __future__ import annotations
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from app.services.vector_index import IndexSpec, apply_search_params, build_index
+
+
+def synthetic_corpus(n: int, dimension: int, clusters: int, seed: int) -> np.ndarray:
+    """Clustered unit vectors, closer to real embeddings than uniform noise."""
+
+    rng = np.random.default_rng(seed)
+    centroids = rng.standard_normal((clusters, dimension)).astype("float32")
+    assignment = rng.integers(0, clusters, size=n)
+    vectors = centroids[assignment] + 0.6 * rng.standard_normal((n, dimension)).astype("float32")
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(row) & set(expected)) for row, expected in zip(found, truth))
+    return hits / truth.size
+
+
+def run_case(index, queries: np.ndarray, truth: np.ndarray, k: int) -> dict[str, float]:
+    latencies = []
+    found = np.empty_like(truth)
+    for row, query in enumerate(queries):
+        started = time.perf_counter()
+        _, ids = index.search(query[np.newaxis, :], k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        found[row] = ids[0]
+    return {
+        f"recall@{k}": round(recall_at_k(found, truth), 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 4),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 4),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=100_000)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 16, 64])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[32, 64, 128])
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    corpus = synthetic_corpus(args.size, args.dimension, clusters=max(16, args.size // 500), seed=args.seed)
+    rng = np.random.default_rng(args.seed + 1)
+    picks = rng.integers(0, args.size, size=args.queries)
+    queries = corpus[picks] + 0.2 * rng.standard_normal((args.queries, args.dimension)).astype("float32")
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    results = []
+    for kind in ("flat", "ivf-flat", "ivf-pq", "hnsw"):
+        spec = IndexSpec(kind=kind)
+        started = time.perf_counter()
+        index = build_index(spec, args.dimension, training=corpus)
+        index.add_with_ids(corpus, np.arange(len(corpus), dtype="int64"))
+        build_seconds = time.perf_counter() - started
+        if kind == "flat":
+            _, truth = index.search(queries, args.k)
+        sweep = [("nprobe", value) for value in args.nprobe] if kind.startswith("ivf") else []
+        sweep += [("ef_search", value) for value in args.ef_search] if kind == "hnsw" else []
+        for param, value in sweep or [(None, None)]:
+            if param:
+                setattr(spec, param, value)
+                apply_search_params(index, spec)
+            case = {"index": kind, "build_s": round(build_seconds, 3), "ntotal": index.ntotal}
+            if param:
+                case[param] = value
+            case.update(run_case(index, queries, truth, args.k))
+            results.append(case)
+
+    print(json.dumps({"size": args.size, "dimension": args.dimension, "results": results}, indent=2))
+
+
+if __name__ == "__main__":  # pragma: no cover - script entrypoint
+    main()
@@ -0,0 +1,245 @@
+"""Benchmark the RAG pipeline (index, retrieve, re-rank) for latency, memory and recall.
+
+Builds synthetic corpora at several sizes plus the real ``content/`` tree, runs
+``RagService.index``/``retrieve``/``re_rank`` against labelled query sets and
+writes one JSON report. Embeddings use the offline hashing embedder, so runs
+are deterministic and need no API key. With ``--baseline`` the run is compared
+to an earlier report and exits non-zero on a latency or recall regression.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import resource
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from app.services.embeddings import Embedder
+from app.services.rag import RETRIEVAL_MODES, ChunkPayload, RagService
+from app.services.vector_index import INDEX_TYPES, IndexSpec
+from ingest_markdown import ChunkingOptions, build_payloads, discover_markdown, parse_markdown
+
+# Candidates handed to the re-ranker per query, mirroring a hybrid search depth.
+_RERANK_CANDIDATES = 20
+
+
+@dataclass(slots=True)
+class LabelledQuery:
+    text: str
+    relevant: set[str]  # chunk ids
+
+
+@dataclass(slots=True)
+class Corpus:
+    name: str
+    payloads: list[ChunkPayload]
+    queries: list[LabelledQuery]
+
+
+def synthetic_corpus(size: int, queries: int, seed: int) -> Corpus:
+    """``size`` chunks mixing shared filler words with a few words unique to each chunk.
+
+    A query takes three of its target chunk's unique words plus shared noise, so
+    exactly one chunk is relevant and ranking quality shows up in recall.
+    """
+
+    rng = np.random.default_rng(seed)
+    filler = [f"umum{index}" for index in range(2_000)]
+    topics = ["loop", "fungsi", "list", "string", "kelas", "file", "rekursi", "sorting"]
+    payloads = []
+    unique: list[list[str]] = []
+    for index in range(size):
+        words = [f"istilah{index}x{slot}" for slot in range(4)]
+        body = list(rng.choice(filler, size=40)) + words
+        rng.shuffle(body)
+        topic = topics[index % len(topics)]
+        payloads.append(
+            ChunkPayload(
+                chunk_id=f"syn-{index}",
+                text=" ".join(body),
+                metadata={"kelas": "X", "topik": topic, "ord": str(index)},
+            )
+        )
+        unique.append(words)
+    labelled = []
+    for target in rng.choice(size, size=min(queries, size), replace=False):
+        words = list(rng.choice(unique[target], size=3, replace=False)) + list(rng.choice(filler, size=3))
+        labelled.append(LabelledQuery(" ".join(words), {f"syn-{target}"}))
+    return Corpus(f"synthetic-{size}", payloads, labelled)
+
+
+def content_corpus(content_dir: Path, chunking: ChunkingOptions) -> Corpus:
+    """Chunks of the real content tree; each heading path becomes a labelled query.
+
+    The query is the document title plus the section heading, and every chunk
+    of that section counts as relevant.
+    """
+
+    payloads: list[ChunkPayload] = []
+    sections: dict[str, set[str]] = {}
+    for path in discover_markdown(content_dir):
+        doc = parse_markdown(path)
+        title = str(doc.metadata.get("title") or doc.metadata.get("topik") or path.stem)
+        for payload in build_payloads(doc, chunking):
+            payloads.append(payload)
+            heading = payload.metadata.get("headings", "").rsplit(" > ", 1)[-1]
+            if heading:
+                sections.setdefault(f"{title} {heading}", set()).add(payload.chunk_id)
+    queries = [LabelledQuery(text, relevant) for text, relevant in sections.items()]
+    return Corpus(f"content-{len(payloads)}", payloads, queries)
+
+
+def percentiles(samples_ms: list[float]) -> dict[str, float]:
+    if not samples_ms:
+        return {}
+    p50, p95, p99 = np.percentile(samples_ms, [50, 95, 99])
+    return {"p50_ms": round(float(p50), 3), "p95_ms": round(float(p95), 3), "p99_ms": round(float(p99), 3)}
+
+
+def rss_mb() -> dict[str, float]:
+    """Current and peak resident set size of this process."""
+
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":  # bytes there, kilobytes on Linux
+        peak_kb //= 1024
+    current_mb = peak_kb / 1024
+    statm = Path("/proc/self/statm")
+    if statm.exists():
+        pages = int(statm.read_text().split()[1])
+        current_mb = pages * resource.getpagesize() / 2**20
+    return {"rss_mb": round(current_mb, 1), "peak_rss_mb": round(peak_kb / 1024, 1)}
+
+
+def recall_at_k(found: list[list[str]], queries: list[LabelledQuery], k: int) -> float:
+    """Mean fraction of the relevant chunks (at most ``k``) found in the top ``k``."""
+
+    scores = [
+        len(set(ids[:k]) & query.relevant) / min(len(query.relevant), k)
+        for ids, query in zip(found, queries)
+    ]
+    return round(float(np.mean(scores)), 4) if scores else 0.0
+
+
+def run_case(corpus: Corpus, index_type: str, retrieval_mode: str, k: int) -> dict[str, object]:
+    rss_before = rss_mb()["rss_mb"]
+    service = RagService(
+        embedder=Embedder(384),
+        index_spec=IndexSpec(kind=index_type),
+        retrieval_mode=retrieval_mode,
+    )
+    started = time.perf_counter()
+    service.index(corpus.payloads)
+    build_s = time.perf_counter() - started
+
+    service.retrieve(corpus.queries[0].text, top_k=k)  # warm-up (thread pools, caches)
+    latencies: list[float] = []
+    found: list[list[str]] = []
+    started = time.perf_counter()
+    for query in corpus.queries:
+        began = time.perf_counter()
+        results = service.retrieve(query.text, top_k=k)
+        latencies.append((time.perf_counter() - began) * 1000)
+        found.append([chunk.chunk_id for chunk in results])
+    retrieve_s = time.perf_counter() - started
+
+    rerank_latencies: list[float] = []
+    for query in corpus.queries:
+        candidates = service.retrieve(query.text, top_k=_RERANK_CANDIDATES)
+        began = time.perf_counter()
+        service.re_rank(query.text, candidates)
+        rerank_latencies.append((time.perf_counter() - began) * 1000)
+
+    memory = rss_mb()
+    return {
+        "corpus": corpus.name,
+        "chunks": len(corpus.payloads),
+        "queries": len(corpus.queries),
+        "index_type": index_type,
+        "retrieval_mode": retrieval_mode,
+        "build_s": round(build_s, 3),
+        "index_chunks_per_s": round(len(corpus.payloads) / build_s, 1) if build_s else None,
+        "retrieve": {"qps": round(len(corpus.queries) / retrieve_s, 1), **percentiles(latencies)},
+        "re_rank": percentiles(rerank_latencies),
+        f"recall@{k}": recall_at_k(found, corpus.queries, k),
+        "rss_delta_mb": round(memory["rss_mb"] - rss_before, 1),
+        **memory,
+    }
+
+
+def regressions(
+    current: dict[str, object], baseline: dict[str, object], tolerance: float
+) -> list[str]:
+    """Cases whose retrieve p95 grew, or recall fell, by more than ``tolerance`` (relative)."""
+
+    def key(case: dict[str, object]) -> tuple[object, ...]:
+        return case["corpus"], case["index_type"], case["retrieval_mode"]
+
+    previous = {key(case): case for case in baseline["results"]}  # type: ignore[index]
+    found = []
+    for case in current["results"]:  # type: ignore[union-attr]
+        old = previous.get(key(case))
+        if old is None:
+            continue
+        for metric in [name for name in case if name.startswith("recall@")]:
+            if case[metric] < old.get(metric, 0) * (1 - tolerance):
+                found.append(f"{key(case)} {metric}: {old[metric]} -> {case[metric]}")
+        new_p95, old_p95 = case["retrieve"]["p95_ms"], old["retrieve"]["p95_ms"]
+        if new_p95 > old_p95 * (1 + tolerance):
+            found.append(f"{key(case)} retrieve p95_ms: {old_p95} -> {new_p95}")
+    return found
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000])
+    parser.add_argument("--queries", type=int, default=200, help="Labelled queries per synthetic corpus")
+    parser.add_argument("--content-dir", type=Path, default=Path("content"))
+    parser.add_argument("--no-content", action="store_true", help="Skip the real content corpus")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, nargs="+", default=["flat"])
+    parser.add_argument("--retrieval-mode", choices=RETRIEVAL_MODES, nargs="+", default=["hybrid"])
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", type=Path, default=None, help="Write the JSON report here")
+    parser.add_argument("--baseline", type=Path, default=None, help="Earlier report to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression")
+    args = parser.parse_args()
+
+    corpora = [synthetic_corpus(size, args.queries, args.seed) for size in args.sizes]
+    if not args.no_content and args.content_dir.exists():
+        corpora.append(content_corpus(args.content_dir, ChunkingOptions()))
+
+    results = [
+        run_case(corpus, index_type, mode, args.k)
+        for corpus in corpora
+        for index_type in args.index_type
+        for mode in args.retrieval_mode
+    ]
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "k": args.k,
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(text + "\n", encoding="utf-8")
+    print(text)
+
+    if args.baseline:
+        found = regressions(report, json.loads(args.baseline.read_text(encoding="utf-8")), args.tolerance)
+        for line in found:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":  # pragma: no cover - script entrypoint
+    main()
@@ -3,15 +3,24 @@
 from __future__ import annotations
 
 import argparse
+import asyncio
 import json
+import os
 import textwrap
-from dataclasses import dataclass
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Iterable
+from typing import Iterable, Iterator
 
+import numpy as np
 import yaml
 
+from app.services.chunking import chunk_markdown
+from app.services.embedding_cache import EmbeddingCache
+from app.services.embeddings import Embedder
+from app.services.manifest import content_hash
 from app.services.rag import ChunkPayload, RagService
+from app.services.vector_index import INDEX_TYPES, IndexSpec
 
 try:  # optional dependency, only used when DSN provided
     import psycopg
@@ -26,28 +35,66 @@ class MarkdownDocument:
     body: str
 
 
-# rest of file remains? need to append? We'll re-add existing content below.
+@dataclass(slots=True)
+class PreparedDocument:
+    """A parsed and chunked document, ready to be embedded."""
+
+    doc_id: str
+    content_hash: str
+    payloads: list[ChunkPayload]
+
+
+@dataclass(slots=True)
+class IngestReport:
+    seen: set[str] = field(default_factory=set)
+    changed: list[str] = field(default_factory=list)
+    removed: list[str] = field(default_factory=list)
+    chunks: int = 0
+
+
+# Bump when the chunking algorithm changes.
+CHUNKER_VERSION = "markdown-v1"
+
+
+@dataclass(frozen=True, slots=True)
+class ChunkingOptions:
+    max_tokens: int = 350
+    overlap_tokens: int = 40
+
+    @property
+    def version(self) -> str:
+        # Part of every document hash, so changing chunking re-ingests everything.
+        return f"{CHUNKER_VERSION}-{self.max_tokens}-{self.overlap_tokens}"
+
+
+_DONE = None  # queue sentinel
+
+
+def discover_markdown(content_dir: Path) -> Iterator[Path]:
+    yield from content_dir.rglob("*.md")
+
+
+def parse_markdown(path: Path) -> MarkdownDocument | None:
+    raw = path.read_text(encoding="utf-8")
+    if not raw.startswith("---"):
+        return None
+    _, front_matter, body = raw.split("---", 2)
+    metadata = yaml.safe_load(front_matter) or {}
+    return MarkdownDocument(path=path, metadata=metadata, body=body.strip())
+
 
 def load_markdown_documents(content_dir: Path) -> list[MarkdownDocument]:
-    documents: list[MarkdownDocument] = []
-    for path in content_dir.rglob("*.md"):
-        raw = path.read_text(encoding="utf-8")
-        if raw.startswith("---"):
-            _, front_matter, body = raw.split("---", 2)
-            metadata = yaml.safe_load(front_matter) or {}
-            documents.append(MarkdownDocument(path=path, metadata=metadata, body=body.strip()))
-    return documents
-
-
-def chunk_text(text: str, chunk_size: int = 500) -> list[str]:
-    words = text.split()
-    if not words:
-        return []
-    chunks = []
-    for i in range(0, len(words), chunk_size):
-        chunk_words = words[i : i + chunk_size]
-        chunks.append(" ".join(chunk_words))
-    return chunks
+    documents = (parse_markdown(path) for path in discover_markdown(content_dir))
+    return [doc for doc in documents if doc is not None]
+
+
+def prepare_document(path: Path, chunking: ChunkingOptions = ChunkingOptions()) -> PreparedDocument | None:
+    """Parse and chunk one file; runs in a worker process."""
+
+    doc = parse_markdown(path)
+    if doc is None:
+        return None
+    return PreparedDocument(document_id(doc), document_hash(doc, chunking), build_payloads(doc, chunking))
 
 
 def upsert_pgvector(dsn: str, payloads: Iterable[ChunkPayload]) -> None:
@@ -69,46 +116,239 @@ def upsert_pgvector(dsn: str, payloads: Iterable[ChunkPayload]) -> None:
                         "content_id": payload.metadata.get("content_id", payload.chunk_id),
                         "ord": int(payload.metadata.get("ord", 0)),
                         "text": payload.text,
-                        "tokens": len(payload.text.split()),
+                        "tokens": int(payload.metadata.get("tokens", 0)),
                         "metadata": json.dumps(payload.metadata),
                     },
                 )
         conn.commit()
 
 
+def build_payloads(doc: MarkdownDocument, chunking: ChunkingOptions = ChunkingOptions()) -> list[ChunkPayload]:
+    doc_id = document_id(doc)
+    chunks = chunk_markdown(doc.body, max_tokens=chunking.max_tokens, overlap_tokens=chunking.overlap_tokens)
+    return [
+        ChunkPayload(
+            chunk_id=f"{doc_id}-{idx}",
+            text=chunk.text,
+            metadata={
+                "kelas": doc.metadata.get("kelas", ""),
+                "topik": doc.metadata.get("topik", ""),
+                "level": doc.metadata.get("level", ""),
+                "tags": ",".join(doc.metadata.get("tags", [])),
+                "content_id": doc_id,
+                "ord": str(idx),
+                "headings": chunk.heading_path,
+                "tokens": str(chunk.tokens),
+            },
+        )
+        for idx, chunk in enumerate(chunks)
+    ]
+
+
+def document_id(doc: MarkdownDocument) -> str:
+    return str(doc.metadata.get("id", doc.path.stem))
+
+
+def document_hash(doc: MarkdownDocument, chunking: ChunkingOptions = ChunkingOptions()) -> str:
+    front_matter = json.dumps(doc.metadata, sort_keys=True, default=str)
+    return content_hash(chunking.version, front_matter, doc.body)
+
+
+def delete_pgvector(dsn: str, content_ids: Iterable[str]) -> None:
+    if not psycopg:
+        raise RuntimeError("psycopg is required for Postgres ingestion")
+    with psycopg.connect(dsn) as conn:
+        with conn.cursor() as cur:
+            for content_id in content_ids:
+                cur.execute("DELETE FROM chunks WHERE content_id = %(content_id)s", {"content_id": content_id})
+        conn.commit()
+
+
+async def _parse_stage(
+    paths: Iterable[Path],
+    pool: Executor,
+    rag: RagService,
+    report: IngestReport,
+    out: asyncio.Queue[PreparedDocument | None],
+    max_in_flight: int,
+    chunking: ChunkingOptions,
+) -> None:
+    """Discover -> parse -> chunk on the process pool, keeping a bounded window in flight."""
+
+    loop = asyncio.get_running_loop()
+    pending: set[asyncio.Future[PreparedDocument | None]] = set()
+
+    async def drain(return_when: str) -> None:
+        nonlocal pending
+        done, pending = await asyncio.wait(pending, return_when=return_when)
+        for future in done:
+            prepared = future.result()
+            if prepared is None:
+                continue
+            report.seen.add(prepared.doc_id)
+            if not rag.is_current(prepared.doc_id, prepared.content_hash):
+                await out.put(prepared)  # blocks when the embed stage falls behind
+
+    for path in paths:
+        pending.add(loop.run_in_executor(pool, prepare_document, path, chunking))
+        if len(pending) >= max_in_flight:
+            await drain(asyncio.FIRST_COMPLETED)
+    if pending:
+        await drain(asyncio.ALL_COMPLETED)
+    await out.put(_DONE)
+
+
+async def _batch_stage(
+    source: asyncio.Queue[PreparedDocument | None],
+    out: asyncio.Queue[list[PreparedDocument] | None],
+    batch_chunks: int,
+    consumers: int,
+) -> None:
+    """Group documents into embedding batches of roughly ``batch_chunks`` chunks."""
+
+    batch: list[PreparedDocument] = []
+    size = 0
+    while (prepared := await source.get()) is not _DONE:
+        batch.append(prepared)
+        size += len(prepared.payloads)
+        if size >= batch_chunks:
+            await out.put(batch)
+            batch, size = [], 0
+    if batch:
+        await out.put(batch)
+    for _ in range(consumers):
+        await out.put(_DONE)
+
+
+async def _embed_stage(
+    embedder: Embedder,
+    source: asyncio.Queue[list[PreparedDocument] | None],
+    out: asyncio.Queue[tuple[list[PreparedDocument], np.ndarray] | None],
+) -> None:
+    while (batch := await source.get()) is not _DONE:
+        texts = [payload.text for prepared in batch for payload in prepared.payloads]
+        await out.put((batch, await embedder.aembed(texts)))
+    await out.put(_DONE)
+
+
+async def _index_stage(
+    rag: RagService,
+    source: asyncio.Queue[tuple[list[PreparedDocument], np.ndarray] | None],
+    producers: int,
+    report: IngestReport,
+    postgres_dsn: str | None,
+) -> None:
+    """Single writer: add vectors to the index, then mirror the batch to pgvector."""
+
+    finished = 0
+    while finished < producers:
+        item = await source.get()
+        if item is _DONE:
+            finished += 1
+            continue
+        batch, vectors = item
+        offset = 0
+        for prepared in batch:
+            count = len(prepared.payloads)
+            rag.upsert_document(
+                prepared.doc_id, prepared.content_hash, prepared.payloads, vectors[offset : offset + count]
+            )
+            offset += count
+            report.changed.append(prepared.doc_id)
+            report.chunks += count
+        if postgres_dsn:
+            await asyncio.to_thread(delete_pgvector, postgres_dsn, [prepared.doc_id for prepared in batch])
+            await asyncio.to_thread(
+                upsert_pgvector, postgres_dsn, [p for prepared in batch for p in prepared.payloads]
+            )
+
+
+async def run_pipeline(
+    content_dir: Path,
+    rag: RagService,
+    *,
+    workers: int,
+    embed_concurrency: int,
+    queue_size: int,
+    postgres_dsn: str | None = None,
+    chunking: ChunkingOptions = ChunkingOptions(),
+) -> IngestReport:
+    """Stream documents through discover -> parse/chunk -> embed -> index -> pgvector.
+
+    Every stage is connected by a bounded queue, so memory stays proportional to
+    ``queue_size`` batches rather than the size of the content tree.
+    """
+
+    report = IngestReport()
+    prepared: asyncio.Queue[PreparedDocument | None] = asyncio.Queue(maxsize=queue_size)
+    batches: asyncio.Queue[list[PreparedDocument] | None] = asyncio.Queue(maxsize=embed_concurrency)
+    embedded: asyncio.Queue[tuple[list[PreparedDocument], np.ndarray] | None] = asyncio.Queue(
+        maxsize=embed_concurrency
+    )
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        await asyncio.gather(
+            _parse_stage(discover_markdown(content_dir), pool, rag, report, prepared, workers * 2, chunking),
+            _batch_stage(prepared, batches, rag.embedder.max_batch_size, embed_concurrency),
+            *(_embed_stage(rag.embedder, batches, embedded) for _ in range(embed_concurrency)),
+            _index_stage(rag, embedded, embed_concurrency, report, postgres_dsn),
+        )
+
+    report.removed = [doc_id for doc_id in list(rag.documents) if doc_id not in report.seen]
+    for doc_id in report.removed:
+        rag.remove_document(doc_id)
+    if postgres_dsn and report.removed:
+        delete_pgvector(postgres_dsn, report.removed)
+    return report
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(description="Ingest markdown content into FAISS index")
     parser.add_argument("--content-dir", type=Path, default=Path("content"), help="Directory with markdown files")
     parser.add_argument("--faiss-path", type=Path, default=Path("data/faiss/index.bin"))
     parser.add_argument("--postgres-dsn", type=str, default=None)
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default=None, help="FAISS index mode")
+    parser.add_argument("--batch-size", type=int, default=None, help="Max chunks per embedding request")
+    parser.add_argument("--rebuild", action="store_true", help="Ignore the existing index and manifest")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Parse/chunk processes")
+    parser.add_argument("--embed-concurrency", type=int, default=4, help="Embedding requests in flight")
+    parser.add_argument("--queue-size", type=int, default=64, help="Parsed documents buffered before embedding")
+    parser.add_argument("--chunk-tokens", type=int, default=350, help="Max tokens per chunk")
+    parser.add_argument("--chunk-overlap", type=int, default=40, help="Prose tokens shared by adjacent chunks")
     args = parser.parse_args()
 
-    documents = load_markdown_documents(args.content_dir)
-    rag = RagService()
-    chunk_payloads: list[ChunkPayload] = []
-    for doc in documents:
-        doc_id = doc.metadata.get("id", doc.path.stem)
-        for idx, chunk in enumerate(chunk_text(doc.body)):
-            chunk_payloads.append(
-                ChunkPayload(
-                    chunk_id=f"{doc_id}-{idx}",
-                    text=chunk,
-                    metadata={
-                        "kelas": doc.metadata.get("kelas", ""),
-                        "topik": doc.metadata.get("topik", ""),
-                        "level": doc.metadata.get("level", ""),
-                        "tags": ",".join(doc.metadata.get("tags", [])),
-                        "content_id": doc_id,
-                        "ord": str(idx),
-                    },
-                )
-            )
-    rag.index(chunk_payloads)
-    args.faiss_path.parent.mkdir(parents=True, exist_ok=True)
-    rag.dump(args.faiss_path)
+    cache = EmbeddingCache(path=args.faiss_path.with_name("embeddings.sqlite"))
+    index_spec = IndexSpec.from_settings()
+    if args.index_type:
+        index_spec.kind = args.index_type
+    options = {
+        "embedder": Embedder(384, max_batch_size=args.batch_size, cache=cache),
+        "index_spec": index_spec,
+    }
+    if args.faiss_path.exists() and not args.rebuild:
+        rag = RagService.load(args.faiss_path, **options)
+    else:
+        rag = RagService(**options)
+
+    report = asyncio.run(
+        run_pipeline(
+            args.content_dir,
+            rag,
+            workers=args.workers,
+            embed_concurrency=args.embed_concurrency,
+            queue_size=args.queue_size,
+            postgres_dsn=args.postgres_dsn,
+            chunking=ChunkingOptions(args.chunk_tokens, args.chunk_overlap),
+        )
+    )
 
-    if args.postgres_dsn:
-        upsert_pgvector(args.postgres_dsn, chunk_payloads)
+    print(
+        f"{len(report.changed)} changed ({report.chunks} chunks), {len(report.removed)} removed, "
+        f"{len(report.seen) - len(report.changed)} unchanged documents; "
+        f"{rag.embedder.requests_sent} embedding requests (cache {cache.stats.as_dict()})"
+    )
+    if report.changed or report.removed or args.rebuild:
+        args.faiss_path.parent.mkdir(parents=True, exist_ok=True)
+        rag.dump(args.faiss_path)
 
 
 if __name__ == "__main__":  # pragma: no cover - script entrypoint
@@ -0,0 +1,52 @@
+"""Tests for the semantic answer cache."""
+
+import numpy as np
+
+from app.services.answer_cache import SemanticAnswerCache
+from app.services.embeddings import Embedder
+from app.services.rag import ChunkPayload, RagService
+
+
+def test_answer_cache_matches_similar_queries_over_the_same_context() -> None:
+    now = [0.0]
+    cache = SemanticAnswerCache(max_entries=2, ttl_seconds=60, threshold=0.8, clock=lambda: now[0])
+    embedder = Embedder(384)
+    context = cache.context_key("10-10", [3, 1, 2], {"kelas": ["X"]})
+    assert context == cache.context_key("10-10", [1, 2, 3], {"kelas": "X"})
+
+    question = "apa itu range di python"
+    cache.store(question, embedder.embed_one(question), context, "range(...)")
+    hit = cache.lookup(embedder.embed_one("apa itu range di python ?"), context)
+    assert hit is not None and hit.answer == "range(...)"
+    assert cache.lookup(embedder.embed_one("bagaimana cara membaca file csv"), context) is None
+    other_version = cache.context_key("11-10", [1, 2, 3], {"kelas": "X"})
+    assert cache.lookup(embedder.embed_one("apa itu range di python"), other_version) is None
+
+    now[0] = 61.0
+    assert cache.lookup(embedder.embed_one("apa itu range di python"), context) is None
+    assert cache.stats.as_dict() == {
+        "hits": 1,
+        "misses": 3,
+        "stores": 1,
+        "evictions": 0,
+        "expirations": 1,
+        "hit_rate": 0.25,
+    }
+
+    vector = np.ones(4, dtype="float32") / 2
+    for key in ("a", "b", "c"):
+        cache.store(key, vector, key, key)
+    assert len(cache) == 2 and cache.stats.evictions == 1
+    assert cache.lookup(vector, "a") is None and cache.lookup(vector, "c") is not None
+
+
+def test_index_version_changes_on_every_mutation() -> None:
+    service = RagService()
+    versions = {service.index_version}
+    ids = service.index([ChunkPayload(chunk_id="a", text="perulangan", metadata={})])
+    versions.add(service.index_version)
+    service.remove(ids)
+    versions.add(service.index_version)
+    service.index([ChunkPayload(chunk_id="b", text="fungsi", metadata={})])
+    versions.add(service.index_version)
+    assert len(versions) == 4
@@ -0,0 +1,53 @@
+"""Tests for the token- and structure-aware markdown chunker."""
+
+from app.services.chunking import chunk_markdown, count_tokens
+
+FILLER = "Kalimat penjelas tentang perulangan. " * 30
+
+MARKDOWN = f"""# Python Dasar
+
+Python adalah bahasa pemrograman yang mudah dibaca. Banyak dipakai untuk data.
+
+## Perulangan
+
+Perulangan mengulang blok kode. {FILLER}
+
+```python
+for i in range(5):
+
+    print(i)
+```
+
+| Kata kunci | Fungsi |
+|------------|--------|
+| for        | ulang  |
+| while      | ulang  |
+
+## Fungsi
+
+Fungsi membungkus logika agar bisa dipakai ulang.
+"""
+
+
+def test_chunks_respect_budget_and_keep_code_fences_whole() -> None:
+    chunks = chunk_markdown(MARKDOWN, max_tokens=80, overlap_tokens=15)
+
+    assert len(chunks) > 2
+    assert all(chunk.tokens <= 80 for chunk in chunks)
+    assert all(chunk.text.count("```") % 2 == 0 for chunk in chunks)
+    code = [chunk for chunk in chunks if "```python" in chunk.text]
+    assert len(code) == 1 and "print(i)" in code[0].text
+    table = [chunk for chunk in chunks if "| for" in chunk.text]
+    assert len(table) == 1 and "| while" in table[0].text
+    assert chunks[0].tokens == count_tokens(chunks[0].text)
+
+
+def test_chunks_record_heading_path_and_share_overlap() -> None:
+    chunks = chunk_markdown(MARKDOWN, max_tokens=80, overlap_tokens=15)
+
+    assert chunks[0].heading_path == "Python Dasar"
+    assert chunks[-1].heading_path == "Python Dasar > Fungsi"
+    assert chunks[-1].text.startswith("## Fungsi")
+    loop_chunks = [chunk for chunk in chunks if chunk.heading_path.endswith("Perulangan")]
+    first, second = loop_chunks[0].text, loop_chunks[1].text
+    assert second.split(". ")[0] in first
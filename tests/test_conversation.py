@@ -0,0 +1,204 @@
+"""Tests for conversation memory and follow-up chunk reuse."""
+
+import asyncio
+import json
+
+from redis.exceptions import WatchError
+
+from app.services.chunking import count_tokens
+from app.services.conversation import (
+    Conversation,
+    ConversationTurn,
+    InMemoryConversationStore,
+    RedisConversationStore,
+    conversation_key,
+)
+from app.services.rag import ChunkPayload, RagService
+
+
+def test_old_turns_fold_into_a_bounded_summary_and_history_fits_its_budget() -> None:
+    conversation = Conversation()
+    for index in range(6):
+        answer = f"Jawaban nomor {index} tentang perulangan. " + "Detail tambahan panjang. " * 20
+        conversation.append(
+            ConversationTurn(f"pertanyaan {index}?", answer, [index, index + 1]),
+            recent_turns=2,
+            summary_tokens=60,
+        )
+    assert [turn.question for turn in conversation.turns] == ["pertanyaan 4?", "pertanyaan 5?"]
+    assert conversation.summary[-1].startswith("pertanyaan 3? → Jawaban nomor 3")
+    assert len(conversation.summary) < 4 and count_tokens("\n".join(conversation.summary)) <= 60
+    assert conversation.chunk_ids[:3] == [5, 6, 4]
+
+    history = conversation.history(token_budget=200, answer_tokens=20)
+    assert count_tokens(history) <= 200
+    assert history.index("pertanyaan 4?") < history.index("pertanyaan 5?")
+    assert "Detail tambahan panjang. " * 5 not in history
+    newest_only = conversation.history(token_budget=100)
+    assert newest_only.startswith("Siswa: pertanyaan 5?") and "pertanyaan 4?" not in newest_only
+
+
+def test_store_round_trips_copies_and_expires() -> None:
+    now = [0.0]
+    store = InMemoryConversationStore(max_conversations=1, ttl_seconds=10, clock=lambda: now[0])
+
+    async def scenario() -> None:
+        conversation = await store.get("c1")
+        assert not conversation.has_history
+        conversation.append(ConversationTurn("apa itu loop?", "Loop mengulang.", [1]), 4, 200)
+        await store.save("c1", conversation)
+        loaded = await store.get("c1")
+        assert loaded == conversation and loaded is not conversation
+        now[0] = 11.0
+        assert not (await store.get("c1")).has_history
+        await store.save("c1", conversation)
+        await store.save("c2", conversation)
+        assert len(store) == 1 and not (await store.get("c1")).has_history
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_turns_of_one_conversation_are_all_kept() -> None:
+    store = InMemoryConversationStore()
+    first = ConversationTurn("apa itu loop?", "Loop mengulang.", [1])
+    second = ConversationTurn("apa itu list?", "List menyimpan data.", [2])
+
+    async def scenario() -> Conversation:
+        # Both requests read the conversation before either answer is finished.
+        await store.get("c1"), await store.get("c1")
+        await asyncio.gather(store.append("c1", first, 4, 200), store.append("c1", second, 4, 200))
+        return await store.get("c1")
+
+    stored = asyncio.run(scenario())
+    assert [turn.question for turn in stored.turns] == ["apa itu loop?", "apa itu list?"]
+    assert stored.chunk_ids == [2, 1]
+
+
+def test_redis_append_retries_when_another_worker_saved_first() -> None:
+    class Pipeline:
+        def __init__(self, client: "Client") -> None:
+            self.client = client
+            self.pending: tuple[str, str] | None = None
+
+        async def __aenter__(self) -> "Pipeline":
+            return self
+
+        async def __aexit__(self, *exc_info: object) -> None:
+            return None
+
+        async def watch(self, key: str) -> None:
+            self.watched = self.client.version
+
+        async def get(self, key: str) -> str | None:
+            return self.client.values.get(key)
+
+        def multi(self) -> None:
+            return None
+
+        def set(self, key: str, value: str, ex: int) -> None:
+            self.pending = (key, value)
+
+        async def execute(self) -> None:
+            if self.client.interleaved:  # another worker's turn lands between GET and EXEC
+                other = Conversation()
+                other.append(ConversationTurn("apa itu list?", "List menyimpan data.", [2]), 4, 200)
+                self.client.values["conversation:c1"] = json.dumps(other.to_dict())
+                self.client.version += 1
+                self.client.interleaved = False
+            if self.watched != self.client.version:
+                raise WatchError()
+            assert self.pending is not None
+            self.client.values[self.pending[0]] = self.pending[1]
+            self.client.version += 1
+
+    class Client:
+        def __init__(self) -> None:
+            self.values: dict[str, str] = {}
+            self.version = 0
+            self.interleaved = True
+
+        def pipeline(self, transaction: bool) -> Pipeline:
+            return Pipeline(self)
+
+        async def get(self, key: str) -> str | None:
+            return self.values.get(key)
+
+    store = RedisConversationStore(Client())
+
+    async def scenario() -> Conversation:
+        await store.append("c1", ConversationTurn("apa itu loop?", "Loop mengulang.", [1]), 4, 200)
+        return await store.get("c1")
+
+    stored = asyncio.run(scenario())
+    assert [turn.question for turn in stored.turns] == ["apa itu list?", "apa itu loop?"]
+
+
+def test_rescore_ranks_earlier_chunks_without_searching() -> None:
+    service = RagService()
+    ids = service.index(
+        [
+            ChunkPayload("a", "perulangan for mengulang blok kode", {"kelas": "X"}),
+            ChunkPayload("b", "percabangan if memilih jalur", {"kelas": "XI"}),
+        ]
+    )
+    service.remove([ids[1]])
+    ids.append(service.index([ChunkPayload(chunk_id="c", text="fungsi def", metadata={})])[0])
+
+    async def scenario() -> tuple[list[str], list[str]]:
+        query = "bagaimana perulangan for bekerja"
+        ranked = await service.arescore(query, [ids[2], ids[1], ids[0]])
+        filtered = await service.arescore("perulangan", ids, filters={"kelas": "XI"})
+        return [chunk.chunk_id for chunk in ranked], [chunk.chunk_id for chunk in filtered]
+
+    ranked, filtered = asyncio.run(scenario())
+    assert ranked == ["a", "c"] and filtered == []
+
+
+def test_conversations_are_scoped_to_their_user() -> None:
+    store = InMemoryConversationStore()
+
+    async def scenario() -> tuple[Conversation, Conversation]:
+        own_key = conversation_key("siswa-a", "c1")
+        conversation = await store.get(own_key)
+        turn = ConversationTurn("nilai ujianku 40, kenapa?", "Mari kita bahas.", [1])
+        conversation.append(turn, 4, 200)
+        await store.save(own_key, conversation)
+        return await store.get(own_key), await store.get(conversation_key("siswa-b", "c1"))
+
+    own, other = asyncio.run(scenario())
+    assert own.turns[0].question == "nilai ujianku 40, kenapa?"
+    assert not other.has_history and other.chunk_ids == []
+
+
+def test_unrelated_follow_ups_search_again_instead_of_reusing_chunks() -> None:
+    service = RagService()
+    loop, _ = service.index(
+        [
+            ChunkPayload(
+                chunk_id="loop",
+                text="Perulangan for di Python mengulang blok kode untuk setiap nilai dalam range.",
+                metadata={},
+            ),
+            ChunkPayload("csv", "csv.reader membaca file csv baris demi baris.", {}),
+        ]
+    )
+    searches = []
+    search = service.aretrieve
+
+    async def counting_search(query, **kwargs):
+        searches.append(query)
+        return await search(query, **kwargs)
+
+    service.aretrieve = counting_search
+    follow_up = "Bagaimana perulangan for mengulang blok kode?"
+    # Shares "di Python", "untuk setiap" with the loop chunk but asks about CSV files.
+    new_topic = "bagaimana membaca file csv di Python untuk setiap baris?"
+
+    async def scenario() -> tuple[list[str], list[str]]:
+        reused = await service.aretrieve_followup(follow_up, [loop], top_k=1)
+        searched = await service.aretrieve_followup(new_topic, [loop], top_k=1)
+        return [chunk.chunk_id for chunk in reused], [chunk.chunk_id for chunk in searched]
+
+    reused, searched = asyncio.run(scenario())
+    assert reused == ["loop"] and searched == ["csv"]
+    assert searches == [new_topic]
@@ -0,0 +1,64 @@
+"""Tests for the batched embedding helpers."""
+
+import asyncio
+import threading
+
+import numpy as np
+
+from app.services.embedding_cache import EmbeddingCache
+from app.services.embeddings import Embedder, hash_embed_batch, iter_batches
+
+
+def test_iter_batches_respects_item_and_token_bounds() -> None:
+    texts = ["kata " * 10] * 7
+    batches = list(iter_batches(texts, max_items=3, max_tokens=10_000))
+    assert batches == [(0, 3), (3, 6), (6, 7)]
+
+    token_bounded = list(iter_batches(texts, max_items=100, max_tokens=40))
+    assert all(end - start == 2 for start, end in token_bounded[:-1])
+    assert token_bounded[-1][1] == len(texts)
+
+
+def test_hash_fallback_is_normalised_matrix() -> None:
+    matrix = hash_embed_batch(["range range python", "", "loop for"], 64)
+    assert matrix.shape == (3, 64)
+    np.testing.assert_allclose(np.linalg.norm(matrix[[0, 2]], axis=1), 1.0, rtol=1e-6)
+    assert not matrix[1].any()
+    np.testing.assert_allclose(Embedder(64, api_key="").embed_one("loop for"), matrix[2])
+
+
+def test_embedding_cache_serves_repeats_from_memory_and_disk(tmp_path) -> None:
+    db_path = tmp_path / "embeddings.sqlite"
+    embedder = Embedder(32, api_key="", cache=EmbeddingCache(max_entries=1, path=db_path))
+    first = embedder.embed(["apa itu range", "apa itu range", "for i in"])
+    assert embedder.cache.stats.misses == 3
+
+    np.testing.assert_allclose(embedder.embed(["for i in"])[0], first[2])
+    assert embedder.cache.stats.memory_hits == 1
+
+    reopened = EmbeddingCache(path=db_path)
+    vectors = reopened.get_many("hash", 32, ["apa itu range", "tidak ada"])
+    np.testing.assert_allclose(vectors[0], first[0])
+    assert vectors[1] is None
+    assert reopened.stats.disk_hits == 1 and reopened.stats.misses == 1
+
+
+def test_async_embedding_keeps_sqlite_io_off_the_event_loop(tmp_path, monkeypatch) -> None:
+    cache = EmbeddingCache(path=tmp_path / "embeddings.sqlite")
+    embedder = Embedder(32, api_key="", cache=cache)
+    threads: list[int] = []
+    for name in ("get_many", "put_many"):
+        method = getattr(cache, name)
+
+        def recording(*args, _method=method):
+            threads.append(threading.get_ident())
+            return _method(*args)
+
+        monkeypatch.setattr(cache, name, recording)
+
+    async def scenario() -> tuple[int, np.ndarray]:
+        return threading.get_ident(), await embedder.aembed(["apa itu range", "for i in"])
+
+    loop_thread, vectors = asyncio.run(scenario())
+    assert len(threads) == 2 and loop_thread not in threads
+    np.testing.assert_allclose(vectors, hash_embed_batch(["apa itu range", "for i in"], 32))
@@ -0,0 +1,67 @@
+"""Tests for streamed LLM generation."""
+
+import asyncio
+import json
+
+from app.core.config import settings
+from app.core.http import http_clients
+from app.services.llm_gateway import GeminiProvider, LLMGateway
+from app.services.rag import RagService
+
+
+def _sse_event(text: str) -> bytes:
+    body = json.dumps({"candidates": [{"content": {"parts": [{"text": text}]}}]})
+    return f"data: {body}\r\n\r\n".encode()
+
+
+def test_stream_response_relays_deltas_and_closes_upstream_early(monkeypatch) -> None:
+    sent: list[int] = []
+    head: list[bytes] = []
+
+    async def fake_gemini(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        while (line := await reader.readline()) not in (b"\r\n", b""):
+            head.append(line.lower())
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"content-type: text/event-stream\r\n"
+            b"transfer-encoding: chunked\r\n\r\n"
+        )
+        try:
+            for index in range(20):
+                event = _sse_event(f"bagian{index} ")
+                writer.write(b"%x\r\n%s\r\n" % (len(event), event))
+                await writer.drain()
+                sent.append(index)
+                await asyncio.sleep(0.02)
+                if reader.at_eof():
+                    break
+        except ConnectionError:
+            pass
+        writer.close()
+
+    async def scenario() -> list[str]:
+        server = await asyncio.start_server(fake_gemini, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        gemini = GeminiProvider(base_url=f"http://127.0.0.1:{port}/v1", api_key="test-key")
+        deltas = RagService(llm=LLMGateway([gemini])).stream_response("apa itu loop?", [])
+        received = [await anext(deltas) for _ in range(3)]
+        await deltas.aclose()  # what the chat router does when the client disconnects
+        await asyncio.sleep(0.1)
+        await http_clients.aclose()
+        server.close()
+        return received
+
+    assert asyncio.run(scenario()) == ["bagian0 ", "bagian1 ", "bagian2 "]
+    assert len(sent) < 10
+    assert b"test-key" not in head[0]  # the request line, which proxies and logs record
+    assert b"x-goog-api-key: test-key\r\n" in head
+
+
+def test_stream_response_without_api_key_yields_fallback(monkeypatch) -> None:
+    monkeypatch.setattr(settings, "google_gemini_api_key", None)
+    monkeypatch.setattr(settings, "openai_api_key", None)
+
+    async def collect() -> list[str]:
+        return [delta async for delta in RagService().stream_response("loop", [])]
+
+    assert asyncio.run(collect())[0].startswith("LLM not configured")
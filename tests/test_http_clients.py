@@ -0,0 +1,44 @@
+"""Tests for the shared outbound HTTP client registry."""
+
+import asyncio
+
+from app.core.http import HttpClients
+
+
+def test_clients_are_pooled_per_upstream_and_reuse_connections() -> None:
+    connections: list[int] = []
+
+    async def server(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        connections.append(1)
+        while True:
+            while (line := await reader.readline()) not in (b"\r\n", b""):
+                pass
+            if not line:
+                break
+            writer.write(b"HTTP/1.1 200 OK\r\ncontent-length: 2\r\n\r\nok")
+            await writer.drain()
+        writer.close()
+
+    async def scenario() -> tuple[bool, bool]:
+        listener = await asyncio.start_server(server, "127.0.0.1", 0)
+        url = f"http://127.0.0.1:{listener.sockets[0].getsockname()[1]}/"
+        clients = HttpClients(http2=False)
+        for _ in range(3):
+            assert (await clients.get("gemini").get(url)).text == "ok"
+        shared = clients.get("gemini") is clients.get("gemini")
+        separate = clients.get("gemini") is not clients.get("judge0")
+        await clients.aclose()
+        listener.close()
+        return shared, separate
+
+    assert asyncio.run(scenario()) == (True, True)
+    assert len(connections) == 1
+
+
+def test_clients_are_rebound_when_the_event_loop_changes() -> None:
+    clients = HttpClients()
+
+    async def current() -> object:
+        return clients.get("openai")
+
+    assert asyncio.run(current()) is not asyncio.run(current())
@@ -0,0 +1,140 @@
+"""Tests for batched Judge0 dispatch and background run jobs, against a local mock Judge0."""
+
+import asyncio
+import itertools
+import json
+
+import httpx
+
+from app.services.judge0 import Judge0Client, Judge0Dispatcher
+from app.services.run_jobs import RunJobStore
+
+
+class MockJudge0:
+    """In-process stand-in for Judge0's batch endpoints.
+
+    A submission stays "Processing" for ``polls_until_done`` polls, then
+    finishes according to its source: ``compile`` fails to compile, ``crash``
+    exits with NZEC, anything else is accepted and echoes its stdin.
+    """
+
+    def __init__(self, polls_until_done: int = 1) -> None:
+        self.polls_until_done = polls_until_done
+        self.posts: list[int] = []
+        self.gets: list[int] = []
+        self._submissions: dict[str, dict] = {}
+        self._polls: dict[str, int] = {}
+        self._tokens = (f"tok-{index}" for index in itertools.count())
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle)
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/languages":
+            self.gets.append(0)
+            languages = [{"id": 71, "name": "Python (3.8.1)"}, {"id": 50, "name": "C (GCC 9.2.0)"}]
+            return httpx.Response(200, json=languages)
+        assert request.url.path == "/submissions/batch"
+        if request.method == "POST":
+            submissions = json.loads(request.content)["submissions"]
+            self.posts.append(len(submissions))
+            tokens = []
+            for submission in submissions:
+                assert {"language_id", "source_code"} <= submission.keys()
+                token = next(self._tokens)
+                self._submissions[token] = submission
+                tokens.append({"token": token})
+            return httpx.Response(201, json=tokens)
+        tokens = request.url.params["tokens"].split(",")
+        self.gets.append(len(tokens))
+        return httpx.Response(200, json={"submissions": [self._state(token) for token in tokens]})
+
+    def _state(self, token: str) -> dict:
+        self._polls[token] = self._polls.get(token, 0) + 1
+        if self._polls[token] < self.polls_until_done:
+            return {"token": token, "status": {"id": 2, "description": "Processing"}}
+        source = self._submissions[token]["source_code"]
+        if source == "compile":
+            return {"token": token, "status": {"id": 6}, "compile_output": "error: expected ';'"}
+        if source == "crash":
+            crashed = {"status": {"id": 11}, "stderr": "ZeroDivisionError", "time": "0.01"}
+            return {"token": token, **crashed}
+        stdin = self._submissions[token].get("stdin", "")
+        return {"token": token, "status": {"id": 3}, "stdout": stdin, "time": "0.02"}
+
+
+def test_concurrent_runs_share_batch_submissions_and_polls() -> None:
+    judge0 = MockJudge0(polls_until_done=2)
+    stats: dict[str, int] = {}
+
+    async def scenario() -> list:
+        async with httpx.AsyncClient(transport=judge0.transport()) as http:
+            dispatcher = Judge0Dispatcher(
+                Judge0Client("http://judge0.local", client=lambda: http),
+                batch_size=20,
+                batch_window=0.05,
+                poll_interval=0.01,
+            )
+            runs = [dispatcher.run("python", "print(input())", f"siswa-{i}") for i in range(25)]
+            runs += [dispatcher.run("c", "compile"), dispatcher.run("java", "crash")]
+            try:
+                return await asyncio.gather(*runs)
+            finally:
+                stats.update(dispatcher.stats())
+                await dispatcher.aclose()
+
+    results = asyncio.run(scenario())
+    assert [result.stdout for result in results[:25]] == [f"siswa-{i}" for i in range(25)]
+    assert {result.status for result in results[:25]} == {"completed"}
+    assert results[0].execution_time_ms == 20
+    assert (results[25].status, results[25].stderr) == ("error", "error: expected ';'")
+    assert (results[26].status, results[26].stderr) == ("error", "ZeroDivisionError")
+
+    assert judge0.posts == [20, 7]  # 27 runs in two submissions
+    assert max(judge0.gets) <= 20 and len(judge0.gets) <= 8
+    assert stats["batches_submitted"] == 2
+
+
+def test_run_jobs_return_immediately_and_report_each_status_change() -> None:
+    store = RunJobStore(max_jobs=2)
+    release = asyncio.Event()
+
+    async def work() -> dict:
+        await release.wait()
+        return {"stdout": "halo\n", "status": "completed"}
+
+    async def scenario() -> tuple:
+        job = store.submit(work, owner="siswa-a")
+        submitted = job.status
+        assert store.get(job.job_id, owner="siswa-b") is None
+        running = await store.wait(job.job_id, 0, timeout=1)
+        assert running is not None
+        seen_running = running.status
+        release.set()
+        finished = await store.wait(job.job_id, running.version, timeout=1)
+        assert finished is not None
+        assert store.get(job.job_id, owner="siswa-a") is finished
+        store.submit(work)
+        store.submit(work)  # evicts the oldest job
+        return submitted, seen_running, finished, store.get(job.job_id)
+
+    submitted, running, finished, evicted = asyncio.run(scenario())
+    assert (submitted, running) == ("queued", "running")
+    assert finished.status == "completed"
+    assert finished.result == {"stdout": "halo\n", "status": "completed"}
+    assert evicted is None
+
+
+def test_runtime_version_names_the_language_id_and_compiler_version() -> None:
+    judge0 = MockJudge0()
+
+    async def scenario() -> list:
+        async with httpx.AsyncClient(transport=judge0.transport()) as http:
+            dispatcher = Judge0Dispatcher(Judge0Client("http://judge0.local", client=lambda: http))
+            names = ("python", "py", "c", "java", "brainfuck")
+            return [await dispatcher.runtime_version(name) for name in names]
+
+    python, alias, c, java, unsupported = asyncio.run(scenario())
+    assert python == alias == "71:Python (3.8.1)" and c == "50:C (GCC 9.2.0)"
+    assert java is None and unsupported is None  # not installed / not a Judge0 language
+    assert judge0.gets == [0]  # the language list is fetched once
@@ -0,0 +1,57 @@
+"""Tests for the BM25 index and hybrid retrieval."""
+
+from app.services.lexical import BM25Index, reciprocal_rank_fusion, tokenize
+from app.services.rag import ChunkPayload, RagService
+
+
+def test_tokenizer_keeps_code_identifiers_and_strips_particles() -> None:
+    tokens = tokenize("Gunakan csv.reader dan range(5) untuk datanya, for i in")
+    assert {"csv.reader", "csv", "reader", "range(5)", "range", "5"} <= set(tokens)
+    assert "data" in tokens and "datanya" not in tokens
+    assert "dan" not in tokens and "untuk" not in tokens
+    assert {"for", "i", "in", "for i", "i in"} <= set(tokens)
+
+
+def test_bm25_round_trip_and_rrf(tmp_path) -> None:
+    index = BM25Index()
+    index.add(0, "csv.reader membaca baris file")
+    index.add(1, "perulangan for i in range(5)")
+    index.remove(0, "csv.reader membaca baris file")
+    index.add(0, "csv.writer menulis file")
+    path = tmp_path / "index.bm25.json"
+    index.dump(path)
+
+    reloaded = BM25Index.load(path)
+    assert [doc_id for _, doc_id in reloaded.search("range(5)", top_k=2)] == [1]
+    assert reloaded.search("membaca", top_k=2) == []
+    assert [doc_id for _, doc_id in reciprocal_rank_fusion([[1, 2], [2, 3]])] == [2, 1, 3]
+
+
+def test_hybrid_retrieval_surfaces_exact_identifier_matches() -> None:
+    chunks = [
+        ChunkPayload(f"umum-{i}", f"perulangan while dengan kondisi bagian {i}", {})
+        for i in range(30)
+    ]
+    chunks.append(ChunkPayload("csv", "modul csv.reader mengembalikan iterator baris", {}))
+    vector_only = RagService(retrieval_mode="vector", reranker="none")
+    vector_only.index(chunks)
+    hybrid = RagService(retrieval_mode="hybrid", reranker="none")
+    hybrid.index(chunks)
+
+    query = "pakai csv.reader()"
+    assert "csv" not in [chunk.chunk_id for chunk in vector_only.retrieve(query, top_k=3)]
+    assert "csv" in [chunk.chunk_id for chunk in hybrid.retrieve(query, top_k=3)]
+
+
+def test_hybrid_ranking_keeps_lexical_hits_above_vector_close_distractors() -> None:
+    chunks = [
+        ChunkPayload("csv", "csv.reader mengembalikan iterator baris dari file", {}),
+        # Shares the query's function words (close in vector space) but no term BM25 scores.
+        ChunkPayload("mirip", "apa itu? untuk dan bagaimana", {}),
+        ChunkPayload("loop", "perulangan for mengulang blok kode", {}),
+    ]
+    service = RagService(retrieval_mode="hybrid", reranker="cosine")
+    service.index(chunks)
+
+    query = "csv.reader itu apa dan untuk apa"
+    assert [chunk.chunk_id for chunk in service.retrieve(query, top_k=2)] == ["csv", "mirip"]
@@ -0,0 +1,126 @@
+"""Tests for the multi-provider LLM gateway."""
+
+import asyncio
+
+import httpx
+import pytest
+
+from app.services.llm_gateway import (
+    CircuitBreaker,
+    LLMGateway,
+    LLMProvider,
+    LLMRequest,
+    LocalProvider,
+)
+from app.services.rag import RagService, RetrievedChunk, is_fallback_response
+
+_REQUEST = LLMRequest(system="tutor", prompt="apa itu loop?")
+
+
+class _Named(LocalProvider):
+    def __init__(self, name: str, delay: float = 0.0) -> None:
+        super().__init__(delay)
+        self.name = name
+        self.cancelled = 0
+
+    async def generate(self, request: LLMRequest) -> str:
+        try:
+            return f"{self.name}: " + await super().generate(request)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+
+
+class _Broken(LLMProvider):
+    name = "broken"
+
+    def __init__(self) -> None:
+        self.calls = 0
+
+    async def generate(self, request: LLMRequest) -> str:
+        self.calls += 1
+        raise ConnectionError("brownout")
+
+    async def stream(self, request: LLMRequest) -> object:
+        self.calls += 1
+        raise ConnectionError("brownout")
+        yield ""
+
+
+def test_slow_primary_is_hedged_and_failures_trip_the_breaker() -> None:
+    async def scenario() -> None:
+        slow, fast = _Named("slow", delay=1.0), _Named("fast", delay=0.01)
+        gateway = LLMGateway([slow, fast], hedge_default_delay=0.05)
+        assert (await gateway.generate(_REQUEST)).startswith("fast: ")
+        stats = gateway.stats()
+        assert slow.cancelled == 1 and stats["fast"]["hedges"] == 1 and stats["fast"]["wins"] == 1
+
+        broken, backup = _Broken(), _Named("backup")
+        gateway = LLMGateway([broken, backup], failure_threshold=2, reset_timeout=60)
+        for _ in range(3):
+            assert (await gateway.generate(_REQUEST)).startswith("backup: ")
+        assert broken.calls == 2 and gateway.stats()["broken"]["state"] == "open"
+        deltas = [delta async for delta in gateway.stream(_REQUEST)]
+        assert "".join(deltas).endswith("apa itu loop?")
+        assert broken.calls == 2
+
+    asyncio.run(scenario())
+
+
+def test_circuit_breaker_half_opens_for_a_single_trial() -> None:
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=lambda: now[0])
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+    now[0] = 10.0
+    assert breaker.allow() and not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    now[0] = 20.0
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_all_providers_failing_yields_a_retrieval_only_answer() -> None:
+    chunks = [RetrievedChunk("loop-0", "for mengulang blok kode", {}, 0.9)]
+    service = RagService(llm=LLMGateway([_Broken()]))
+
+    async def scenario() -> tuple[str, list[str]]:
+        answer = await service.generate_response("apa itu loop?", chunks)
+        streamed = [delta async for delta in service.stream_response("apa itu loop?", chunks)]
+        return answer, streamed
+
+    answer, streamed = asyncio.run(scenario())
+    assert answer == "LLM unavailable. Retrieved chunks: for mengulang blok kode"
+    assert streamed == [answer] and is_fallback_response(answer)
+    assert "brownout" not in answer
+
+
+class _CutOff(LLMProvider):
+    """Streams one delta, then fails with ``error``."""
+
+    name = "cut-off"
+
+    def __init__(self, error: Exception) -> None:
+        self.error = error
+
+    async def generate(self, request: LLMRequest) -> str:
+        raise self.error
+
+    async def stream(self, request: LLMRequest) -> object:
+        yield "Loop mengulang"
+        raise self.error
+
+
+def test_only_provider_failures_fall_back_mid_stream() -> None:
+    chunks = [RetrievedChunk("loop-0", "for mengulang blok kode", {}, 0.9)]
+
+    async def stream(error: Exception) -> list[str]:
+        service = RagService(llm=LLMGateway([_CutOff(error)]))
+        return [delta async for delta in service.stream_response("apa itu loop?", chunks)]
+
+    dropped = asyncio.run(stream(httpx.ReadError("connection reset")))
+    assert dropped[0] == "Loop mengulang" and is_fallback_response(dropped[1])
+    with pytest.raises(TypeError):
+        asyncio.run(stream(TypeError("bug in prompt assembly")))
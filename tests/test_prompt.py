@@ -0,0 +1,65 @@
+"""Tests for token-budgeted prompt assembly."""
+
+import json
+
+import app.services.rag as rag
+from app.services.chunking import count_tokens
+from app.services.llm_gateway import GeminiProvider
+from app.services.prompt import build_context
+from app.services.rag import RetrievedChunk
+
+_FOR_LOOP = """Perulangan for mengulang blok kode. Fungsi range menghasilkan deret angka. \
+Kucing suka tidur.
+
+```python
+for i in range(3):
+    print(i)
+```
+
+- range(stop) berhenti sebelum stop"""
+
+_WHILE_LOOP = """- range(stop) berhenti sebelum stop
+
+While mengulang selama kondisi benar. Gunakan while bila jumlah ulangan tidak diketahui."""
+
+
+def _chunks() -> list[RetrievedChunk]:
+    metadata = {
+        "topik": "Perulangan",
+        "kelas": "X",
+        "ord": "3",
+        "tokens": "80",
+        "content_id": "loop",
+    }
+    return [
+        RetrievedChunk("loop-0", _FOR_LOOP, {**metadata, "headings": "Loop > For"}, 0.9, 0),
+        RetrievedChunk("loop-1", _WHILE_LOOP, {**metadata, "headings": "Loop > While"}, 0.8, 1),
+        RetrievedChunk("loop-0", _FOR_LOOP, {**metadata, "headings": "Loop > For"}, 0.7, 0),
+    ]
+
+
+def test_context_is_deduplicated_labelled_and_trimmed_to_the_budget() -> None:
+    full = build_context("apa itu range?", _chunks(), token_budget=1000)
+    assert full.chunks_used == 2 and full.units_dropped == 0
+    assert full.text.count("range(stop) berhenti sebelum stop") == 1
+    assert full.text.startswith("[1] Perulangan > Loop > For\n")
+    assert "kelas" not in full.text and "content_id" not in full.text
+    assert "```python\nfor i in range(3):\n    print(i)\n```" in full.text
+
+    trimmed = build_context("apa itu range?", _chunks(), token_budget=50)
+    assert trimmed.tokens <= 50 and trimmed.units_dropped > 0
+    assert trimmed.chunks_used == 2
+    assert "- range(stop) berhenti sebelum stop" in trimmed.text  # most query-relevant unit
+    assert "Kucing" not in trimmed.text and "print(i)" not in trimmed.text
+    assert trimmed.tokens == count_tokens(trimmed.text)
+
+
+def test_gemini_payload_keeps_the_system_prefix_static(monkeypatch) -> None:
+    monkeypatch.setattr(rag.settings, "llm_context_token_budget", 1000)
+    gemini = GeminiProvider(api_key="test-key")
+    first = gemini.payload(rag._llm_request("apa itu range?", _chunks()))
+    second = gemini.payload(rag._llm_request("bagaimana while bekerja?", _chunks()[1:]))
+    prefix = '{"systemInstruction": ' + json.dumps(first["systemInstruction"])
+    assert json.dumps(first).startswith(prefix) and json.dumps(second).startswith(prefix)
+    prompt = first["contents"][0]["parts"][0]["text"]
+    assert prompt.endswith("Query: apa itu range?") and rag._TUTOR_SYSTEM_PROMPT not in prompt
@@ -1,6 +1,9 @@
 """Tests for the FAISS-backed retriever."""
 
+import faiss
+
 from app.services.rag import ChunkPayload, RagService
+from app.services.vector_index import IndexSpec
 
 
 def test_retriever_returns_relevant_chunks() -> None:
@@ -17,3 +20,164 @@ def test_retriever_returns_relevant_chunks() -> None:
     assert results
     assert results[0].chunk_id == "1"
     assert results[0].metadata["topik"] == "aljabar"
+
+
+def test_re_rank_uses_stored_vectors_for_every_strategy() -> None:
+    chunks = [
+        ChunkPayload(chunk_id="loop", text="for i in range(5): print(i)", metadata={}),
+        ChunkPayload(chunk_id="loop-copy", text="for i in range(5): print(i) lagi", metadata={}),
+        ChunkPayload(chunk_id="csv", text="csv.reader membaca file csv", metadata={}),
+    ]
+    for strategy in ("none", "cosine", "mmr", "cross-encoder"):
+        service = RagService(reranker=strategy)
+        service.index(chunks)
+        misses_after_index = service.embedder.cache.stats.misses
+
+        results = service.retrieve("for i in range(5)", top_k=3)
+
+        assert {chunk.chunk_id for chunk in results} == {"loop", "loop-copy", "csv"}
+        assert results[0].chunk_id in {"loop", "loop-copy"}
+        assert service.embedder.cache.stats.misses == misses_after_index + 1
+
+
+def test_ann_index_modes_match_flat_top_hit() -> None:
+    chunks = [
+        ChunkPayload(chunk_id=str(i), text=f"materi {i} topik{i % 7} kata{i}", metadata={})
+        for i in range(300)
+    ]
+    for kind in ("ivf-flat", "hnsw"):
+        service = RagService(index_spec=IndexSpec(kind=kind, nlist=4, nprobe=4))
+        service.index(chunks)
+        service.set_search_params(nprobe=4, ef_search=128)
+
+        results = service.retrieve("materi 42 topik0 kata42", top_k=3)
+        assert results[0].chunk_id == "42"
+
+
+def test_filtered_retrieval_stays_inside_the_selection() -> None:
+    chunks = [
+        ChunkPayload(
+            chunk_id=f"{kelas}-{i}",
+            text=f"loop for range python contoh {i}",
+            metadata={"kelas": kelas, "tags": "python,loop" if i % 2 else "python"},
+        )
+        for kelas in ("X", "XI", "XII")
+        for i in range(40)
+    ]
+    for kind in ("flat", "hnsw"):
+        service = RagService(index_spec=IndexSpec(kind=kind))
+        service.index(chunks)
+
+        filters = {"kelas": "XI", "tags": "loop"}
+        results = service.retrieve("loop for range", top_k=5, filters=filters)
+        assert len(results) == 5
+        assert all(chunk.metadata["kelas"] == "XI" for chunk in results)
+        assert all("loop" in chunk.metadata["tags"] for chunk in results)
+
+        either = service.retrieve("loop", top_k=100, filters={"kelas": ["X", "XII"]})
+        assert len(either) == 80
+        assert service.retrieve("loop", filters={"kelas": "IX"}) == []
+
+
+def test_upsert_document_is_idempotent_and_replaces_changed_documents(tmp_path) -> None:
+    def payloads(doc_id: str, text: str) -> list[ChunkPayload]:
+        return [ChunkPayload(chunk_id=f"{doc_id}-0", text=text, metadata={"content_id": doc_id})]
+
+    for_loop, while_loop = "perulangan for in range", "perulangan while kondisi"
+    for kind in ("flat", "hnsw"):
+        service = RagService(index_spec=IndexSpec(kind=kind))
+        assert service.upsert_document("loop", "v1", payloads("loop", for_loop))
+        assert service.upsert_document("csv", "v1", payloads("csv", "membaca csv.reader"))
+        assert not service.upsert_document("loop", "v1", payloads("loop", for_loop))
+        assert service.upsert_document("loop", "v2", payloads("loop", while_loop))
+        assert service.remove_document("csv")
+
+        results = service.retrieve("perulangan for in range csv.reader", top_k=5)
+        assert [chunk.text for chunk in results] == ["perulangan while kondisi"]
+
+        path = tmp_path / kind / "index.bin"
+        service.dump(path)
+        reloaded = RagService.load(path, index_spec=IndexSpec(kind=kind))
+        assert [chunk.chunk_id for chunk in reloaded.retrieve("perulangan", top_k=5)] == ["loop-0"]
+        assert not reloaded.upsert_document("loop", "v2", payloads("loop", while_loop))
+
+
+def test_ivf_index_retrains_as_documents_are_upserted_one_by_one() -> None:
+    service = RagService(index_spec=IndexSpec(kind="ivf-flat", nlist=8, nprobe=8))
+    for doc in range(20):
+        chunks = [
+            ChunkPayload(f"{doc}-{i}", f"bab {doc} materi {i} kata{doc * 20 + i}", {})
+            for i in range(20)
+        ]
+        service.upsert_document(f"bab-{doc}", "v1", chunks)
+
+    index = faiss.extract_index_ivf(service._index)
+    # The first document alone only supports one list.
+    assert index.nlist > 1 and index.ntotal == 400
+    assert service.retrieve("bab 13 materi 7 kata267", top_k=1)[0].chunk_id == "13-7"
+
+
+def test_memory_mapped_load_decodes_lazily_and_copies_on_write(tmp_path) -> None:
+    path = tmp_path / "index.bin"
+    service = RagService()
+    service.index(
+        [
+            ChunkPayload(chunk_id="loop", text="perulangan for in range", metadata={"kelas": "X"}),
+            ChunkPayload(chunk_id="csv", text="membaca csv.reader", metadata={"kelas": "XI"}),
+        ]
+    )
+    service.dump(path)
+
+    def top_hit(service: RagService, query: str, kelas: str) -> str:
+        return service.retrieve(query, top_k=1, filters={"kelas": kelas})[0].chunk_id
+
+    mapped = RagService.load(path, mmap=True)
+    assert mapped._chunks.mapped and len(mapped._chunks) == 2
+    assert top_hit(mapped, "csv.reader", "XI") == "csv"
+
+    writer = RagService.load(path, mmap=True)
+    writer.remove([0])
+    writer.index([ChunkPayload("while", "perulangan while kondisi", {"kelas": "X"})])
+    writer.dump(path)  # replaced atomically: the first mapping still reads the old dump
+
+    assert top_hit(mapped, "perulangan", "X") == "loop"
+    reloaded = RagService.load(path, mmap=True)
+    assert sorted(chunk.chunk_id for chunk in reloaded._chunks.values()) == ["csv", "while"]
+    assert top_hit(reloaded, "perulangan", "X") == "while"
+
+
+def test_async_retrieve_matches_sync_retrieve_without_blocking_the_loop() -> None:
+    import asyncio
+
+    topics = ("loop", "csv", "fungsi")
+    texts = [f"materi {topic} nomor {index}" for index in range(60) for topic in topics]
+    for mode in ("vector", "hybrid"):
+        service = RagService(retrieval_mode=mode)
+        service.index(
+            [
+                ChunkPayload(chunk_id=str(position), text=text, metadata={"topik": text.split()[1]})
+                for position, text in enumerate(texts)
+            ]
+        )
+
+        def search(retrieve):
+            return retrieve("materi csv nomor 7", top_k=3, filters={"topik": "csv"})
+
+        async def scenario() -> tuple[list[list[str]], int]:
+            ticks = 0
+
+            async def heartbeat() -> None:
+                nonlocal ticks
+                while True:
+                    ticks += 1
+                    await asyncio.sleep(0)
+
+            beat = asyncio.create_task(heartbeat())
+            results = await asyncio.gather(*(search(service.aretrieve) for _ in range(8)))
+            beat.cancel()
+            return [[chunk.chunk_id for chunk in result] for result in results], ticks
+
+        results, ticks = asyncio.run(scenario())
+        expected = [chunk.chunk_id for chunk in search(service.retrieve)]
+        assert all(result == expected for result in results)
+        assert ticks > 1
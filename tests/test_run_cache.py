@@ -0,0 +1,51 @@
+"""Tests for the deterministic code-run result cache."""
+
+from app.services.run_cache import RunResultCache
+
+
+def test_equivalent_sources_share_an_entry_and_report_the_hit_rate() -> None:
+    cache = RunResultCache(max_entries=2)
+    starter = "for i in range(3):\n    print(i)\n"
+    key = cache.key("Python", starter, "", "local:cpython-3.11")
+    assert key is not None
+    assert cache.get(key) is None
+    assert cache.put(key, {"stdout": "0\n1\n2\n", "status": "completed"})
+
+    reformatted = "for i in range(3):   \r\n    print(i)\r\n\r\n"
+    assert cache.key("python", reformatted, "", "local:cpython-3.11") == key
+    assert cache.get(key) == {"stdout": "0\n1\n2\n", "status": "completed"}
+
+    assert cache.key("python", starter, "5\n", "local:cpython-3.11") != key
+    assert cache.key("python", starter, "", "local:cpython-3.12") != key
+    assert cache.stats.as_dict()["hit_rate"] == 0.5
+
+    others = [cache.key("python", f"print({n})", "", "local") for n in range(2)]
+    for other in others:
+        cache.put(other, {"stdout": "", "status": "completed"})
+    assert len(cache) == 2 and cache.get(key) is None
+    assert cache.stats.evictions == 1
+
+
+def test_nondeterministic_programs_and_timeouts_are_not_cached() -> None:
+    cache = RunResultCache()
+    for source in (
+        "import random\nprint(random.randint(1, 6))",
+        "from datetime import datetime\nprint(datetime.now())",
+        "import time\nprint(time.time())",
+        "print(id(object()))",
+        "print(open('/etc/hostname').read())",
+        "import os\nprint(os.environ)",
+        "import sys\nprint(sys.version)",
+        "from sys import argv\nprint(argv)",
+    ):
+        assert cache.key("python", source, "", "local") is None
+    assert cache.key("python", "print('halo')", "", None) is None  # unknown executor
+    assert cache.stats.skipped == 9
+
+    stdin_driven = "import sys\nid = int(sys.stdin.readline())\nprint(id * 2)"
+    assert cache.key("python", stdin_driven, "21\n", "local") is not None
+
+    key = cache.key("python", "while True:\n    pass", "", "local")
+    assert key is not None
+    assert not cache.put(key, {"stdout": "", "status": "timeout"})
+    assert cache.get(key) is None
@@ -0,0 +1,97 @@
+"""Tests for the local pre-started Python sandbox."""
+
+import asyncio
+import time
+
+from app.services.sandbox import PythonSandbox, SandboxChunk, SandboxLimits, SandboxResult
+
+
+def _run_all(sandbox: PythonSandbox, *jobs: tuple[str, str]) -> list:
+    async def scenario() -> list:
+        await sandbox.start()
+        try:
+            return [await sandbox.run(source, stdin) for source, stdin in jobs]
+        finally:
+            await sandbox.aclose()
+
+    return asyncio.run(scenario())
+
+
+def test_runs_programs_with_stdin_and_reports_student_tracebacks() -> None:
+    sandbox = PythonSandbox(pool_size=2, limits=SandboxLimits(output_bytes=100))
+    ok, failed, noisy, exited = _run_all(
+        sandbox,
+        ("nama = input()\nprint(f'halo {nama}')", "wahida\n"),
+        ("angka = [1, 2]\nprint(angka[5])", ""),
+        ("for i in range(10_000):\n    print(i)", ""),
+        ("import sys\nsys.exit('selesai')", ""),
+    )
+    assert (ok.status, ok.stdout, ok.exit_code) == ("completed", "halo wahida\n", 0)
+    assert 0 <= ok.execution_time_ms < 1000
+
+    assert failed.status == "error"
+    assert 'File "<main>", line 2' in failed.stderr and "IndexError" in failed.stderr
+    assert "sandbox_worker" not in failed.stderr
+
+    assert noisy.truncated and len(noisy.stdout.encode()) <= 100
+    assert "[output truncated at 100 bytes]" in noisy.stderr
+    assert (exited.status, exited.exit_code, exited.stderr) == ("error", 1, "selesai\n")
+
+
+def test_timeouts_network_and_subprocesses_are_refused() -> None:
+    sandbox = PythonSandbox(pool_size=1, limits=SandboxLimits(timeout_seconds=0.5))
+    looping, network, shell = _run_all(
+        sandbox,
+        ("while True:\n    pass", ""),
+        ("import socket\nsocket.create_connection(('127.0.0.1', 80), timeout=1)", ""),
+        ("import subprocess\nsubprocess.run(['ls'])", ""),
+    )
+    assert looping.status == "timeout" and looping.execution_time_ms >= 500
+    assert network.status == "error" and "PermissionError" in network.stderr
+    assert shell.status == "error" and "PermissionError" in shell.stderr
+
+
+def test_streamed_output_arrives_while_running_and_closing_kills_the_program() -> None:
+    sandbox = PythonSandbox(pool_size=1, limits=SandboxLimits(timeout_seconds=5))
+
+    async def scenario() -> tuple[list, float, float]:
+        await sandbox.start()
+        try:
+            events = []
+            counting = "import time\nfor i in range(3):\n    print(i)\n    time.sleep(0.2)"
+            async for event in sandbox.stream(counting):
+                events.append((event, time.perf_counter()))
+            runaway = sandbox.stream("print('mulai', flush=True)\nwhile True:\n    pass")
+            first = await anext(runaway)
+            assert isinstance(first, SandboxChunk) and first.data == "mulai\n"
+            started = time.perf_counter()
+            await runaway.aclose()
+            return events, events[-1][1] - events[0][1], time.perf_counter() - started
+        finally:
+            await sandbox.aclose()
+
+    events, spread, close_seconds = asyncio.run(scenario())
+    chunks = [event for event, _ in events if isinstance(event, SandboxChunk)]
+    assert "".join(chunk.data for chunk in chunks) == "0\n1\n2\n" and len(chunks) == 3
+    assert isinstance(events[-1][0], SandboxResult) and events[-1][0].status == "completed"
+    assert spread >= 0.3  # the first line came well before the program finished
+    assert close_seconds < 1
+
+
+def test_programs_cannot_see_the_host_or_write_outside_tmp() -> None:
+    sandbox = PythonSandbox(pool_size=1)
+    looks_around = "print(os.getuid(), os.getcwd(), os.path.exists('/proc'), os.path.exists(here))"
+    forged_result = '{"stdout": "", "stderr": "", "status": "timeout"}\\n'
+    identity, environ, source, written, forged = _run_all(
+        sandbox,
+        (f"import os\nhere = {__file__!r}\n{looks_around}", ""),
+        ("import os\nprint(open(f'/proc/{os.getppid()}/environ').read())", ""),
+        (f"print(open({__file__!r}).read())", ""),
+        ("open('/tmp/catatan.txt', 'w').write('ok')\nopen('/usr/lib/jahat', 'w')", ""),
+        (f"import os\nos.write(3, b'{forged_result}')", ""),
+    )
+    assert identity.stdout == "65534 /tmp False False\n"
+    assert environ.status == "error" and "FileNotFoundError" in environ.stderr
+    assert source.status == "error" and "FileNotFoundError" in source.stderr
+    assert written.status == "error" and "OSError" in written.stderr
+    assert forged.status == "error" and "result channel" in forged.stderr
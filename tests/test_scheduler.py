@@ -0,0 +1,68 @@
+"""Tests for admission control and fair-share scheduling of code runs."""
+
+import asyncio
+
+from app.services.scheduler import AdmissionRejected, ExecutionScheduler, parse_weights
+
+
+def test_free_slots_rotate_between_classes_by_weight_and_between_users() -> None:
+    scheduler = ExecutionScheduler(max_concurrency=1, max_queue_per_user=10, class_weights={"a": 2})
+    order: list[str] = []
+
+    async def run(class_id: str, user_id: str) -> None:
+        async with scheduler.slot(class_id, user_id):
+            order.append(f"{class_id}/{user_id}")
+            await asyncio.sleep(0)
+
+    async def scenario() -> None:
+        await scheduler.acquire("a", "holder")  # the only slot, while everyone else queues
+        waiting = [("a", "u1")] * 4 + [("a", "u2")] * 2 + [("b", "v1")] * 3
+        tasks = [asyncio.create_task(run(class_id, user_id)) for class_id, user_id in waiting]
+        await asyncio.sleep(0)
+        scheduler.release()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+    # Class a (weight 2) alternates its users, then it is b's turn.
+    rounds = [order[start : start + 3] for start in range(0, len(order), 3)]
+    assert rounds == [
+        ["a/u1", "a/u2", "b/v1"],
+        ["a/u1", "a/u2", "b/v1"],
+        ["a/u1", "a/u1", "b/v1"],
+    ]
+    stats = scheduler.stats()
+    assert stats["admitted"] == 10 and stats["running"] == 0 and stats["waiting"] == 0
+    assert stats["wait_p99_ms"] is not None
+    assert parse_weights("kelas-a:3, kelas-b:0") == {"kelas-a": 3, "kelas-b": 1}
+
+
+def test_full_queues_and_long_waits_are_rejected_quickly() -> None:
+    scheduler = ExecutionScheduler(
+        max_concurrency=1,
+        max_queue=3,
+        max_queue_per_class=2,
+        max_queue_per_user=1,
+        queue_timeout=0.05,
+    )
+
+    async def scenario() -> list[int]:
+        await scheduler.acquire("a", "holder")
+        attempts = []
+        arrivals = (("a", "u1"), ("a", "u1"), ("a", "u2"), ("a", "u3"), ("b", "v1"), ("c", "w1"))
+        for class_id, user_id in arrivals:
+            attempts.append(asyncio.create_task(scheduler.acquire(class_id, user_id)))
+            await asyncio.sleep(0)  # queued (or refused) before the next one arrives
+        results = await asyncio.gather(*attempts, return_exceptions=True)
+        scheduler.release()
+        return [result.status_code for result in results if isinstance(result, AdmissionRejected)]
+
+    # u1 twice: per-user limit; u3: class a already has two waiting; w1: global
+    # queue full. The three that did queue time out behind the holder.
+    assert sorted(asyncio.run(scenario())) == [429, 429, 503, 503, 503, 503]
+    assert scheduler.rejected == {
+        "user_queue": 1,
+        "class_queue": 1,
+        "global_queue": 1,
+        "timeout": 3,
+    }
+    assert scheduler.stats()["waiting"] == 0 and scheduler.stats()["running"] == 0
@@ -0,0 +1,55 @@
+"""Tests for single-flight coalescing of identical streams."""
+
+import asyncio
+
+from app.services.single_flight import SingleFlight
+
+
+def test_concurrent_subscribers_share_one_run_and_late_joiners_replay() -> None:
+    runs: list[str] = []
+
+    async def produce() -> object:
+        runs.append("run")
+        for token in ("started", "chunk", "delta", "completed"):
+            await asyncio.sleep(0.01)
+            yield token
+
+    async def collect(flights: SingleFlight[str], delay: float) -> list[str]:
+        await asyncio.sleep(delay)
+        return [item async for item in flights.stream("apa itu range", produce)]
+
+    async def scenario() -> tuple[list[list[str]], dict[str, float], int]:
+        flights: SingleFlight[str] = SingleFlight()
+        results = await asyncio.gather(*(collect(flights, delay) for delay in (0, 0, 0.025, 0.025)))
+        return list(results), flights.stats.as_dict(), len(flights)
+
+    results, stats, in_flight = asyncio.run(scenario())
+    assert runs == ["run"]
+    assert all(result == ["started", "chunk", "delta", "completed"] for result in results)
+    assert stats == {"leaders": 1, "followers": 3, "coalesced_rate": 0.75}
+    assert in_flight == 0
+
+
+def test_producer_is_cancelled_when_every_subscriber_leaves() -> None:
+    closed: list[bool] = []
+
+    async def produce() -> object:
+        try:
+            for index in range(100):
+                await asyncio.sleep(0.01)
+                yield index
+        finally:
+            closed.append(True)
+
+    async def scenario() -> int:
+        flights: SingleFlight[int] = SingleFlight()
+        first, second = flights.stream("q", produce), flights.stream("q", produce)
+        assert await anext(first) == 0 and await anext(second) == 0
+        await first.aclose()
+        assert await anext(second) == 1  # still running for the remaining subscriber
+        await second.aclose()
+        await asyncio.sleep(0.05)
+        return len(flights)
+
+    assert asyncio.run(scenario()) == 0
+    assert closed == [True]
@@ -0,0 +1,53 @@
+"""Tests for the batching, heartbeat-aware SSE writer."""
+
+import asyncio
+
+from app.core.sse import sse_event, stream_events
+
+
+class _FakeRequest:
+    """Just enough of a Starlette request: ``receive`` yields a disconnect after ``after``."""
+
+    def __init__(self, after: float = 60.0) -> None:
+        self.after = after
+
+    async def receive(self) -> dict[str, str]:
+        await asyncio.sleep(self.after)
+        return {"type": "http.disconnect"}
+
+
+def test_ready_frames_are_flushed_together_and_idle_streams_get_heartbeats() -> None:
+    async def events() -> object:
+        for index in range(3):
+            yield sse_event({"type": "chunk", "index": index})
+        await asyncio.sleep(0.05)
+        yield sse_event({"type": "completed"}, event="status")
+
+    async def scenario() -> list[str]:
+        stream = stream_events(_FakeRequest(), events(), heartbeat_interval=0.02)
+        return [frames async for frames in stream]
+
+    writes = asyncio.run(scenario())
+    assert writes[0] == "".join(sse_event({"type": "chunk", "index": i}) for i in range(3))
+    assert ": keep-alive\n\n" in writes[1:-1]
+    assert writes[-1] == 'event: status\ndata: {"type":"completed"}\n\n'
+
+
+def test_disconnect_cancels_the_producer_mid_await() -> None:
+    closed: list[bool] = []
+
+    async def events() -> object:
+        try:
+            yield sse_event({"type": "started"})
+            await asyncio.sleep(10)
+            yield sse_event({"type": "never"})
+        finally:
+            closed.append(True)
+
+    async def scenario() -> list[str]:
+        stream = stream_events(_FakeRequest(after=0.05), events())
+        return [frames async for frames in stream]
+
+    writes = asyncio.run(asyncio.wait_for(scenario(), timeout=2))
+    assert writes == [sse_event({"type": "started"})]
+    assert closed == [True]